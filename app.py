@@ -1,26 +1,55 @@
 from __future__ import annotations
 
-import io
-import re
+import os
+import shutil
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Iterator
 
-from flask import Flask, flash, make_response, redirect, render_template, request, send_file, url_for
+from flask import Flask, Response, flash, make_response, redirect, render_template, request, send_file, url_for
 from werkzeug.serving import WSGIRequestHandler
 
 from merge_logs_to_pdf import (
+    BATCH_MANIFEST_NAME,
+    DEFAULT_CACHE_MAX_BYTES,
+    DEFAULT_DOCX_COMPRESSION,
+    DEFAULT_PDF_BACKEND,
+    OUTPUT_MIMETYPES,
+    PDF_BACKENDS,
+    ConversionCache,
+    ConversionProgress,
+    DocxWriteStats,
     FdoClockOptions,
-    build_combined_lines_with_report,
-    build_docx_bytes,
-    build_pdf_bytes,
-    decode_text_with_fallback,
+    FdoValidationResult,
+    Timings,
+    build_batch_zip,
+    cached_combined_lines,
+    cached_layout,
+    combined_lines_hash,
+    configure_render_pool,
+    iter_docx_chunks,
+    iter_pdf_chunks,
+    layout_base_key,
+    load_batch_archive,
+    output_cache_key,
+    parse_batch_manifest,
+    prepare_conversion,
+    resolve_docx_compression,
+    resolve_pdf_backend,
+    safe_basename,
+    validation_report_passed,
 )
 
 
 BASE_DIR = Path(__file__).resolve().parent
 OUTPUT_DIR = BASE_DIR / "output"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+JOB_OUTPUT_DIR = OUTPUT_DIR / "jobs"
 CLI_HTML_PATH = BASE_DIR / "static" / "cli" / "txt_log_converter_v20.html"
 
 ALLOWED_TEXT_EXTENSIONS = {".log", ".txt", ".cfg", ".conf"}
@@ -32,8 +61,231 @@ app.secret_key = "gui-convert-local-secret"
 app.config["TEMPLATES_AUTO_RELOAD"] = True
 app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
 APP_BUILD = datetime.now().strftime("%Y%m%d%H%M%S")
-REPORT_CACHE_LIMIT = 100
-REPORT_CACHE: dict[str, str] = {}
+JOB_STORE_LIMIT = 100
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", "3600"))
+# Jobs running at once, and how many more may wait before POST /jobs answers 503.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "8"))
+CONVERSION_CACHE = ConversionCache(
+    Path(os.environ.get("CONVERSION_CACHE_DIR") or OUTPUT_DIR / "cache"),
+    max_bytes=int(os.environ.get("CONVERSION_CACHE_MAX_MB", DEFAULT_CACHE_MAX_BYTES // (1024 * 1024))) * 1024 * 1024,
+)
+# Render processes shared by all requests; 0/unset means one per CPU, 1 keeps rendering in-process.
+RENDER_WORKERS = configure_render_pool(int(os.environ.get("RENDER_WORKERS", "0")) or None)
+
+
+@dataclass
+class ConversionJob:
+    job_id: str
+    output_name: str | None = None
+    mimetype: str | None = None
+    status: str = "queued"
+    progress: ConversionProgress = field(default_factory=ConversionProgress)
+    report: str | None = None
+    error: str | None = None
+    result_path: Path | None = None
+    stage_seconds: dict[str, float] = field(default_factory=dict)
+    # Filled in as the conversion runs, streamed spans included.
+    timings: Timings | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    def to_json(self) -> dict[str, object]:
+        return {
+            "id": self.job_id,
+            "status": self.status,
+            **self.progress.snapshot(),
+            "output_name": self.output_name,
+            "validation_passed": validation_report_passed(self.report) if self.report is not None else None,
+            "error": self.error,
+            "stage_seconds": {name: round(seconds, 3) for name, seconds in self.stage_seconds.items()},
+            "timings": self.timings.to_json() if self.timings is not None else None,
+            "elapsed_seconds": round((self.finished_at or time.time()) - self.created_at, 3),
+        }
+
+
+class JobStore:
+    """Jobs and validation reports by id; finished entries expire after a TTL."""
+
+    def __init__(self, limit: int, ttl_seconds: float) -> None:
+        self.limit = limit
+        self.ttl_seconds = ttl_seconds
+        self._jobs: dict[str, ConversionJob] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def status_counts(self) -> dict[str, int]:
+        with self._lock:
+            counts: dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def add(self, job: ConversionJob) -> ConversionJob:
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict()
+        return job
+
+    def get(self, job_id: str) -> ConversionJob | None:
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def _evict(self) -> None:
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        expired = [job for job in finished if now - job.finished_at > self.ttl_seconds]
+        overflow = len(self._jobs) - len(expired) - self.limit
+        if overflow > 0:
+            expired_ids = {job.job_id for job in expired}
+            expired += [job for job in finished if job.job_id not in expired_ids][:overflow]
+        for job in expired:
+            self._jobs.pop(job.job_id, None)
+            self.evictions += 1
+            if job.result_path is not None:
+                shutil.rmtree(job.result_path.parent, ignore_errors=True)
+
+
+METRIC_PREFIX = "switch_converter"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(1024 * 4**power for power in range(11))  # 1 KiB .. 1 GiB
+LINES_BUCKETS = (100, 1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+PAGES_BUCKETS = (1, 5, 10, 50, 100, 500, 1_000, 5_000, 20_000)
+
+
+def _metric_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _metric_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+@dataclass
+class ConversionRecord:
+    """One conversion as /metrics sees it; filled in while the request runs."""
+
+    endpoint: str
+    output_format: str = "none"
+    timings: Timings = field(default_factory=Timings)
+    # None leaves the request counter alone (batches count per device).
+    outcome: str | None = "error"
+    input_bytes: dict[str, int] = field(default_factory=dict)
+    lines: int | None = None
+    started: float = field(default_factory=time.perf_counter)
+    finished: bool = False
+
+
+class ServiceMetrics:
+    """Counters and histograms rendered in the Prometheus text format."""
+
+    HISTOGRAMS = {
+        "stage_seconds": ("Wall time of each conversion stage.", SECONDS_BUCKETS),
+        "stage_cpu_seconds": ("CPU time of each conversion stage, on the thread that ran it.", SECONDS_BUCKETS),
+        "conversion_seconds": ("Time from upload to the last byte of the response.", SECONDS_BUCKETS),
+        "input_bytes": ("Size of each uploaded file.", BYTES_BUCKETS),
+        "input_lines": ("Combined FDO + APIC lines per conversion.", LINES_BUCKETS),
+        "output_pages": ("Pages per laid-out PDF, screenshot page included.", PAGES_BUCKETS),
+    }
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._requests: dict[tuple[tuple[str, str], ...], int] = {}
+        self._histograms: dict[str, dict[tuple[tuple[str, str], ...], list[float]]] = {
+            name: {} for name in self.HISTOGRAMS
+        }
+        self.in_flight = 0
+
+    def count_request(self, endpoint: str, output_format: str, outcome: str) -> None:
+        labels = (("endpoint", endpoint), ("format", output_format), ("outcome", outcome))
+        with self._lock:
+            self._requests[labels] = self._requests.get(labels, 0) + 1
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        buckets = self.HISTOGRAMS[name][1]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # Cumulative count per bucket, then sum and count (the +Inf bucket).
+            series = self._histograms[name].setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def begin(self, endpoint: str, timings: Timings | None = None) -> ConversionRecord:
+        with self._lock:
+            self.in_flight += 1
+        return ConversionRecord(endpoint=endpoint, timings=timings or Timings())
+
+    def finish(self, record: ConversionRecord) -> None:
+        # Safe to call twice: error paths and response close may both get here.
+        with self._lock:
+            if record.finished:
+                return
+            record.finished = True
+            self.in_flight -= 1
+        if record.outcome is not None:
+            self.count_request(record.endpoint, record.output_format, record.outcome)
+        self.observe("conversion_seconds", time.perf_counter() - record.started, endpoint=record.endpoint)
+        for name, size in record.input_bytes.items():
+            self.observe("input_bytes", size, file=name)
+        if record.lines is not None:
+            self.observe("input_lines", record.lines)
+        for span in list(record.timings.spans):
+            self.observe("stage_seconds", span.wall_seconds, stage=span.name)
+            self.observe("stage_cpu_seconds", span.cpu_seconds, stage=span.name)
+            if span.name == "paginate" and span.unit == "pages" and span.size is not None:
+                self.observe("output_pages", span.size + 1)
+
+    def render(self, gauges: list[tuple[str, str, dict[tuple[tuple[str, str], ...], float]]]) -> str:
+        """The text exposition; ``gauges`` are (name, help, {labels: value}) read at scrape time."""
+        lines = []
+
+        def header(name: str, help_text: str, kind: str) -> str:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            return f"{METRIC_PREFIX}_{name}"
+
+        with self._lock:
+            requests = dict(self._requests)
+            histograms = {
+                name: {key: list(series) for key, series in data.items()} for name, data in self._histograms.items()
+            }
+            in_flight = self.in_flight
+
+        metric = header("requests_total", "Conversions by endpoint, output format and validation outcome.", "counter")
+        for labels, value in sorted(requests.items()):
+            lines.append(f"{metric}{_metric_labels(labels)} {value}")
+        metric = header("conversions_in_flight", "Conversions started and not yet fully sent.", "gauge")
+        lines.append(f"{metric} {in_flight}")
+        for name, help_text, series in gauges:
+            metric = header(name, help_text, "counter" if name.endswith("_total") else "gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{metric}{_metric_labels(labels)} {_metric_value(value)}")
+        for name, (help_text, buckets) in self.HISTOGRAMS.items():
+            metric = header(name, help_text, "histogram")
+            for labels, series in sorted(histograms[name].items()):
+                for bound, count in zip((*buckets, "+Inf"), (*series[:-2], series[-1])):
+                    lines.append(f"{metric}_bucket{_metric_labels((*labels, ('le', str(bound))))} {count}")
+                lines.append(f"{metric}_sum{_metric_labels(labels)} {_metric_value(series[-2])}")
+                lines.append(f"{metric}_count{_metric_labels(labels)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+JOB_STORE = JobStore(limit=JOB_STORE_LIMIT, ttl_seconds=JOB_TTL_SECONDS)
+METRICS = ServiceMetrics()
+JOB_EXECUTOR = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_job_slots = threading.BoundedSemaphore(JOB_WORKERS + JOB_QUEUE_LIMIT)
 
 
 class QuietRequestHandler(WSGIRequestHandler):
@@ -45,21 +297,160 @@ def _is_allowed(filename: str, allowed_extensions: set[str]) -> bool:
     return Path(filename).suffix.lower() in allowed_extensions
 
 
-def _safe_basename(text: str) -> str:
-    text = text.strip()
-    if not text:
-        return "output"
-    sanitized = re.sub(r"[^A-Za-z0-9._-]+", "_", text).strip("._-")
-    return sanitized or "output"
+def _form_flag(name: str) -> bool:
+    return (request.form.get(name) or "").strip().lower() in {"1", "true", "on", "yes"}
+
+
+def _clock_options_from_form() -> FdoClockOptions:
+    custom_mode = _form_flag("clock_custom_mode")
+    custom_date = (request.form.get("clock_date") or "").strip() or None
+    custom_start = (request.form.get("clock_start") or "08:00:00").strip()
+    custom_end = (request.form.get("clock_end") or "18:00:00").strip()
+    seed_text = (request.form.get("clock_seed") or "").strip()
+    return FdoClockOptions(
+        custom_mode=custom_mode,
+        custom_date=custom_date,
+        custom_start_time=custom_start,
+        custom_end_time=custom_end,
+        seed=int(seed_text) if seed_text.isdigit() else None,
+    )
+
+
+def _output_format_from_form() -> str:
+    output_format = (request.form.get("output_format") or "pdf").strip().lower()
+    return output_format if output_format in OUTPUT_MIMETYPES else "pdf"
+
+
+def _pdf_backend_from_form() -> str:
+    pdf_backend = (request.form.get("pdf_backend") or DEFAULT_PDF_BACKEND).strip().lower()
+    return pdf_backend if pdf_backend in PDF_BACKENDS else DEFAULT_PDF_BACKEND
+
+
+def _docx_compression_from_form(default: str = "fast") -> str:
+    # Interactive conversions default to the fast level; batches use DEFAULT_DOCX_COMPRESSION.
+    value = (request.form.get("docx_compression") or default).strip().lower()
+    try:
+        resolve_docx_compression(value)
+    except ValueError:
+        return default
+    return value
+
 
+def _store_validation_report(report_text: str, timings: Timings | None = None) -> str:
+    job = ConversionJob(job_id=uuid.uuid4().hex, status="done", report=report_text, timings=timings)
+    job.finished_at = job.created_at
+    return JOB_STORE.add(job).job_id
 
-def _store_validation_report(report_text: str) -> str:
-    report_id = uuid.uuid4().hex
-    REPORT_CACHE[report_id] = report_text
-    while len(REPORT_CACHE) > REPORT_CACHE_LIMIT:
-        oldest = next(iter(REPORT_CACHE))
-        REPORT_CACHE.pop(oldest, None)
-    return report_id
+
+def _with_docx_stats_report(
+    on_complete: Callable[[Path], None] | None,
+    docx_stats: DocxWriteStats,
+    output_name: str,
+    report_id: str,
+) -> Callable[[Path], None]:
+    def report(path: Path) -> None:
+        if on_complete is not None:
+            on_complete(path)
+        app.logger.info("Built %s: %s", output_name, docx_stats.summary())
+        job = JOB_STORE.get(report_id)
+        if job is not None and job.report is not None:
+            job.report = job.report.rstrip("\n") + f"\nDOCX compression: {docx_stats.summary()}\n"
+
+    return report
+
+
+def _upload_error(fdo_file, apic_file, image_file) -> str | None:
+    if not fdo_file or not apic_file or not image_file:
+        return "กรุณาอัปโหลดไฟล์ให้ครบทั้ง 3 ไฟล์"
+    if not _is_allowed(fdo_file.filename, ALLOWED_TEXT_EXTENSIONS):
+        return "ไฟล์ Config/FDO ต้องเป็น .log .txt .cfg หรือ .conf"
+    if not _is_allowed(apic_file.filename, ALLOWED_TEXT_EXTENSIONS):
+        return "ไฟล์ APIC ต้องเป็น .log .txt .cfg หรือ .conf"
+    if not _is_allowed(image_file.filename, ALLOWED_IMAGE_EXTENSIONS):
+        return "ไฟล์รูปต้องเป็น .png .jpg .jpeg .bmp .gif หรือ .webp"
+    return None
+
+
+def _tee_to_file(
+    chunks: Iterator[bytes],
+    path: Path,
+    on_complete: Callable[[Path], None] | None = None,
+    timings: Timings | None = None,
+) -> Iterator[bytes]:
+    # The ".part" file is renamed into place once everything has gone out.
+    partial_path = path.with_name(f"{path.name}.part")
+    started = time.perf_counter()
+    size = 0
+    completed = False
+    span = (timings or Timings()).start("write_output")
+    try:
+        with partial_path.open("wb") as sink:
+            for chunk in chunks:
+                with span.measure():
+                    sink.write(chunk)
+                span.add_size(len(chunk))
+                size += len(chunk)
+                yield chunk
+        partial_path.replace(path)
+        completed = True
+        if on_complete is not None:
+            on_complete(path)
+        app.logger.info("Wrote %s (%d bytes, %.3fs)", path.name, size, time.perf_counter() - started)
+    finally:
+        if not completed:
+            partial_path.unlink(missing_ok=True)
+
+
+def _output_chunks(
+    combined_lines: list[str],
+    image_bytes: bytes,
+    output_format: str,
+    pdf_backend: str,
+    progress: ConversionProgress | None = None,
+    layout_base: str | None = None,
+    render_image: bytes | None = None,
+    docx_compression: str | None = None,
+    docx_stats: DocxWriteStats | None = None,
+    timings: Timings | None = None,
+    fdo_clock_options: FdoClockOptions | None = None,
+) -> tuple[Iterator[bytes], int | None, Callable[[Path], None] | None]:
+    """Return (chunks, content length if known, callback for the written file)."""
+    timings = timings or Timings()
+    image_input = image_bytes if render_image is None else render_image
+    lines_hash = combined_lines_hash(combined_lines)
+    store: Callable[[Path], None] | None = None
+    if fdo_clock_options is not None and fdo_clock_options.seed is not None:
+        output_key = output_cache_key(
+            CONVERSION_CACHE, lines_hash, image_bytes, output_format, pdf_backend, docx_compression
+        )
+        with timings.span("output_cache") as span:
+            cached = CONVERSION_CACHE.get("output", output_key)
+            span.set_output(cached)
+        if cached is not None:
+            return iter((cached,)), len(cached), None
+
+        def store_output(path: Path) -> None:
+            CONVERSION_CACHE.put("output", output_key, path.read_bytes())
+
+        store = store_output
+
+    if output_format == "docx":
+        if progress is not None:
+            progress.start("render")
+        chunks = iter_docx_chunks(combined_lines, image_input, docx_compression, docx_stats)
+        return timings.iter_span("render", chunks), None, store
+
+    layout = None
+    if resolve_pdf_backend(pdf_backend).native_layout:
+        if progress is not None:
+            progress.start("paginate")
+        with timings.span("paginate") as span:
+            layout = cached_layout(
+                CONVERSION_CACHE, combined_lines, lines_hash, base_key=layout_base, fdo_clock_options=fdo_clock_options
+            )
+            span.set_output(layout)
+    chunks = iter_pdf_chunks(combined_lines, image_input, backend=pdf_backend, progress=progress, layout=layout)
+    return timings.iter_span("render", chunks), None, store
 
 
 def _apply_no_cache_headers(response):
@@ -86,99 +477,361 @@ def index():
     return _apply_no_cache_headers(make_response(render_template("index.html", app_build=APP_BUILD)))
 
 
+def _validation_response(validation: FdoValidationResult, status: int = 200, timings: Timings | None = None):
+    report_id = _store_validation_report(validation.report, timings)
+    body = {"report_id": report_id, **validation.to_json()}
+    if timings is not None:
+        body["timings"] = timings.to_json()
+    response = make_response(body, status)
+    response.headers["X-Validation-Report-Id"] = report_id
+    if timings is not None:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
+
+@app.post("/validate")
+def validate():
+    fdo_file = request.files.get("fdo_file")
+    apic_file = request.files.get("apic_file")
+    image_file = request.files.get("image_file")
+    if not fdo_file or not apic_file:
+        return {"error": "กรุณาอัปโหลดไฟล์ Config/FDO และ APIC"}, 400
+    if not _is_allowed(fdo_file.filename, ALLOWED_TEXT_EXTENSIONS) or not _is_allowed(
+        apic_file.filename, ALLOWED_TEXT_EXTENSIONS
+    ):
+        return {"error": "ไฟล์ Config/FDO และ APIC ต้องเป็น .log .txt .cfg หรือ .conf"}, 400
+
+    record = METRICS.begin("validate")
+    timings = record.timings
+    try:
+        with timings.span("upload") as span:
+            fdo_raw = fdo_file.read()
+            apic_raw = apic_file.read()
+            span.add_size(len(fdo_raw) + len(apic_raw))
+        record.input_bytes = {"fdo": len(fdo_raw), "apic": len(apic_raw)}
+        lines, validation = cached_combined_lines(
+            CONVERSION_CACHE,
+            fdo_raw,
+            apic_raw,
+            fdo_clock_options=_clock_options_from_form(),
+            show_log_image_present=bool(image_file and image_file.filename),
+            timings=timings,
+        )
+        record.lines = len(lines)
+        record.outcome = "passed" if validation.passed else "failed"
+        return _validation_response(validation, timings=timings)
+    finally:
+        METRICS.finish(record)
+
+
 @app.post("/generate")
 def generate():
     fdo_file = request.files.get("fdo_file")
     apic_file = request.files.get("apic_file")
     image_file = request.files.get("image_file")
 
-    if not fdo_file or not apic_file or not image_file:
-        flash("กรุณาอัปโหลดไฟล์ให้ครบทั้ง 3 ไฟล์", "error")
+    upload_error = _upload_error(fdo_file, apic_file, image_file)
+    if upload_error:
+        flash(upload_error, "error")
         return redirect(url_for("index"))
 
-    if not _is_allowed(fdo_file.filename, ALLOWED_TEXT_EXTENSIONS):
-        flash("ไฟล์ Config/FDO ต้องเป็น .log .txt .cfg หรือ .conf", "error")
+    record = METRICS.begin("generate")
+    timings = record.timings
+    try:
+        with timings.span("upload") as span:
+            image_bytes = image_file.read()
+            fdo_raw = fdo_file.read()
+            apic_raw = apic_file.read()
+            span.add_size(len(image_bytes) + len(fdo_raw) + len(apic_raw))
+        record.input_bytes = {"fdo": len(fdo_raw), "apic": len(apic_raw), "image": len(image_bytes)}
+        output_base = safe_basename(Path(fdo_file.filename or "config.log").stem)
+        clock_options = _clock_options_from_form()
+        output_format = record.output_format = _output_format_from_form()
+        pdf_backend = _pdf_backend_from_form()
+        docx_compression = _docx_compression_from_form()
+        docx_stats = DocxWriteStats.for_compression(docx_compression) if output_format == "docx" else None
+
+        prepared = prepare_conversion(
+            CONVERSION_CACHE,
+            fdo_raw,
+            apic_raw,
+            image_bytes,
+            output_format,
+            pdf_backend,
+            fdo_clock_options=clock_options,
+            timings=timings,
+        )
+        app.logger.info("Prepared %s: %s", output_base, prepared.timings_text())
+        combined_lines, validation = prepared.combined_lines, prepared.validation
+        record.lines = len(combined_lines)
+        record.outcome = "passed" if validation.passed else "failed"
+        validation_report = validation.report
+        if not validation.passed and _form_flag("validate_first"):
+            # Nothing is rendered or written for logs that would be rejected anyway.
+            record.outcome = "rejected"
+            METRICS.finish(record)
+            return _validation_response(validation, status=422, timings=timings)
+
+        with timings.span("write_text") as span:
+            combined_text = "\n".join(combined_lines) + "\n"
+            (OUTPUT_DIR / f"{output_base}.txt").write_text(combined_text, encoding="utf-8")
+            span.add_size(len(combined_text), "chars")
+
+        output_name = f"{output_base}.{output_format}"
+        output_chunks, content_length, on_complete = _output_chunks(
+            combined_lines,
+            image_bytes,
+            output_format,
+            pdf_backend,
+            layout_base=layout_base_key(CONVERSION_CACHE, fdo_raw, apic_raw),
+            render_image=prepared.render_image,
+            docx_compression=docx_compression,
+            docx_stats=docx_stats,
+            timings=timings,
+            fdo_clock_options=clock_options,
+        )
+        report_id = _store_validation_report(validation_report, timings)
+        if docx_stats is not None and content_length is None:
+            # Stats are only known once the streamed DOCX is written.
+            on_complete = _with_docx_stats_report(on_complete, docx_stats, output_name, report_id)
+
+        mimetype = OUTPUT_MIMETYPES[output_format]
+        response = Response(
+            _tee_to_file(output_chunks, OUTPUT_DIR / output_name, on_complete, timings), mimetype=mimetype
+        )
+        response.headers.set("Content-Disposition", "attachment", filename=output_name)
+        if content_length is not None:
+            response.content_length = content_length
+        response.headers["X-Validation-Report-Id"] = report_id
+        # Up to the first byte; streamed spans only reach the stored report.
+        response.headers["Server-Timing"] = timings.server_timing()
+        response.headers["X-Clock-Seed"] = str(validation.changes["clock_seed"])
+        if output_format == "pdf":
+            response.headers["X-Pdf-Backend"] = pdf_backend
+        else:
+            response.headers["X-Docx-Compression"] = f"{docx_stats.compression}; level={docx_stats.level}"
+        # Counted once the body has gone out (or the client went away).
+        response.call_on_close(lambda: METRICS.finish(record))
+        return response
+    except Exception as exc:
+        record.outcome = "error"
+        METRICS.finish(record)
+        flash(f"สร้างไฟล์ผลลัพธ์ไม่สำเร็จ: {exc}", "error")
         return redirect(url_for("index"))
 
-    if not _is_allowed(apic_file.filename, ALLOWED_TEXT_EXTENSIONS):
-        flash("ไฟล์ APIC ต้องเป็น .log .txt .cfg หรือ .conf", "error")
-        return redirect(url_for("index"))
 
-    if not _is_allowed(image_file.filename, ALLOWED_IMAGE_EXTENSIONS):
-        flash("ไฟล์รูปต้องเป็น .png .jpg .jpeg .bmp .gif หรือ .webp", "error")
-        return redirect(url_for("index"))
+@app.post("/generate/batch")
+def generate_batch():
+    # A zip with manifest.json at its root, or a manifest plus "files" uploads.
+    archive_file = request.files.get("batch_file")
+    manifest_file = request.files.get("manifest_file")
+    try:
+        if archive_file:
+            devices, load = load_batch_archive(archive_file.read())
+        elif manifest_file:
+            devices = parse_batch_manifest(manifest_file.read())
+            uploads = {Path(f.filename or "").name: f.read() for f in request.files.getlist("files")}
+
+            def load(name: str) -> bytes:
+                return uploads[Path(name.replace("\\", "/")).name]
+        else:
+            return {"error": f"upload batch_file (zip with {BATCH_MANIFEST_NAME}) or manifest_file + files"}, 400
+    except ValueError as exc:
+        return {"error": str(exc)}, 400
 
+    output_format = _output_format_from_form()
+    record = METRICS.begin("batch")
+    record.outcome = None
     try:
-        fdo_text = decode_text_with_fallback(fdo_file.read())
-        apic_text = decode_text_with_fallback(apic_file.read())
-        image_bytes = image_file.read()
-
-        output_base = _safe_basename(Path(fdo_file.filename or "config.log").stem)
-        custom_mode = (request.form.get("clock_custom_mode") or "").strip().lower() in {"1", "true", "on", "yes"}
-        custom_date = (request.form.get("clock_date") or "").strip() or None
-        custom_start = (request.form.get("clock_start") or "08:00:00").strip()
-        custom_end = (request.form.get("clock_end") or "18:00:00").strip()
-        clock_options = FdoClockOptions(
-            custom_mode=custom_mode,
-            custom_date=custom_date,
-            custom_start_time=custom_start,
-            custom_end_time=custom_end,
+        zip_bytes, results = build_batch_zip(
+            devices,
+            load,
+            output_format=output_format,
+            fdo_clock_options=_clock_options_from_form(),
+            pdf_backend=_pdf_backend_from_form(),
+            cache=CONVERSION_CACHE,
+            docx_compression=_docx_compression_from_form(DEFAULT_DOCX_COMPRESSION),
         )
+    finally:
+        METRICS.finish(record)
+    for result in results:
+        outcome = "error" if result.error else ("passed" if result.passed else "failed")
+        METRICS.count_request("batch", output_format, outcome)
+    output_name = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    (OUTPUT_DIR / output_name).write_bytes(zip_bytes)
+
+    response = Response(zip_bytes, mimetype="application/zip")
+    response.headers.set("Content-Disposition", "attachment", filename=output_name)
+    response.headers["X-Batch-Devices"] = str(len(results))
+    response.headers["X-Batch-Passed"] = str(sum(1 for result in results if result.passed))
+    return response
 
-        combined_lines, validation_report = build_combined_lines_with_report(
-            fdo_text,
-            apic_text,
+
+def _run_conversion_job(
+    job: ConversionJob,
+    fdo_raw: bytes,
+    apic_raw: bytes,
+    image_bytes: bytes,
+    clock_options: FdoClockOptions,
+    output_format: str,
+    pdf_backend: str,
+    docx_compression: str | None = None,
+) -> None:
+    progress = job.progress
+    job.status = "running"
+    record = METRICS.begin("jobs")
+    record.output_format = output_format
+    record.input_bytes = {"fdo": len(fdo_raw), "apic": len(apic_raw), "image": len(image_bytes)}
+    job.timings = timings = record.timings
+    try:
+        progress.start("preprocess")
+        prepared = prepare_conversion(
+            CONVERSION_CACHE,
+            fdo_raw,
+            apic_raw,
+            image_bytes,
+            output_format,
+            pdf_backend,
+            fdo_clock_options=clock_options,
+            timings=timings,
+        )
+        job.stage_seconds = prepared.stage_seconds
+        job.report = prepared.validation.report
+        record.lines = len(prepared.combined_lines)
+        output_chunks, _content_length, on_complete = _output_chunks(
+            prepared.combined_lines,
+            image_bytes,
+            output_format,
+            pdf_backend,
+            progress=progress,
+            layout_base=layout_base_key(CONVERSION_CACHE, fdo_raw, apic_raw),
+            render_image=prepared.render_image,
+            docx_compression=docx_compression,
+            timings=timings,
             fdo_clock_options=clock_options,
-            show_log_title_present=True,
-            show_log_image_present=bool(image_bytes),
         )
-        combined_text = "\n".join(combined_lines) + "\n"
 
-        output_format = (request.form.get("output_format") or "pdf").strip().lower()
-        if output_format not in {"pdf", "docx"}:
-            output_format = "pdf"
+        job.result_path = JOB_OUTPUT_DIR / job.job_id / job.output_name
+        job.result_path.parent.mkdir(parents=True, exist_ok=True)
+        for _chunk in _tee_to_file(output_chunks, job.result_path, on_complete, timings):
+            pass
+        job.status = "done"
+        record.outcome = "passed" if prepared.validation.passed else "failed"
+    except Exception as exc:
+        app.logger.exception("Job %s failed", job.job_id)
+        job.error = str(exc)
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+        METRICS.finish(record)
+        _job_slots.release()
 
-        txt_name = f"{output_base}.txt"
-        (OUTPUT_DIR / txt_name).write_text(combined_text, encoding="utf-8")
 
-        if output_format == "docx":
-            output_name = f"{output_base}.docx"
-            output_bytes = build_docx_bytes(combined_lines, image_bytes)
-            mimetype = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        else:
-            output_name = f"{output_base}.pdf"
-            output_bytes = build_pdf_bytes(combined_lines, image_bytes)
-            mimetype = "application/pdf"
-
-        (OUTPUT_DIR / output_name).write_bytes(output_bytes)
-
-        stream = io.BytesIO(output_bytes)
-        stream.seek(0)
-        response = send_file(
-            stream,
-            as_attachment=True,
-            download_name=output_name,
-            mimetype=mimetype,
-        )
-        report_id = _store_validation_report(validation_report)
-        response.headers["X-Validation-Report-Id"] = report_id
+@app.post("/jobs")
+def create_job():
+    fdo_file = request.files.get("fdo_file")
+    apic_file = request.files.get("apic_file")
+    image_file = request.files.get("image_file")
+    upload_error = _upload_error(fdo_file, apic_file, image_file)
+    if upload_error:
+        return {"error": upload_error}, 400
+
+    if not _job_slots.acquire(blocking=False):
+        response = make_response({"error": "job queue is full, retry later"}, 503)
+        response.headers["Retry-After"] = "5"
         return response
-    except Exception as exc:
-        flash(f"สร้างไฟล์ผลลัพธ์ไม่สำเร็จ: {exc}", "error")
-        return redirect(url_for("index"))
+
+    output_format = _output_format_from_form()
+    output_base = safe_basename(Path(fdo_file.filename or "config.log").stem)
+    job = ConversionJob(
+        job_id=uuid.uuid4().hex,
+        output_name=f"{output_base}.{output_format}",
+        mimetype=OUTPUT_MIMETYPES[output_format],
+    )
+    try:
+        JOB_STORE.add(job)
+        JOB_EXECUTOR.submit(
+            _run_conversion_job,
+            job,
+            fdo_file.read(),
+            apic_file.read(),
+            image_file.read(),
+            _clock_options_from_form(),
+            output_format,
+            _pdf_backend_from_form(),
+            _docx_compression_from_form(),
+        )
+    except BaseException:
+        _job_slots.release()
+        raise
+
+    response = make_response(job.to_json(), 202)
+    response.headers["Location"] = url_for("job_status", job_id=job.job_id)
+    return response
+
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id: str):
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return {"error": "job not found"}, 404
+    response = make_response(job.to_json())
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@app.get("/jobs/<job_id>/result")
+def job_result(job_id: str):
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return {"error": "job not found"}, 404
+    if job.status != "done":
+        return {"error": f"job is {job.status}", **job.to_json()}, 409
+    response = send_file(job.result_path, mimetype=job.mimetype, as_attachment=True, download_name=job.output_name)
+    response.headers["X-Validation-Report-Id"] = job.job_id
+    return response
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "cache": CONVERSION_CACHE.stats()}
+
+
+@app.get("/metrics")
+def metrics():
+    cache_stats = CONVERSION_CACHE.stats()
+    gauges = [
+        ("job_store_entries", "Jobs and validation reports held by the job store.", {
+            (("status", status),): count for status, count in JOB_STORE.status_counts().items()
+        }),
+        ("job_store_evictions_total", "Job store entries dropped for TTL or size.", {(): JOB_STORE.evictions}),
+        ("cache_hits_total", "Conversion cache hits by artifact.", {
+            (("artifact", artifact),): count for artifact, count in cache_stats["hits"].items()
+        }),
+        ("cache_misses_total", "Conversion cache misses by artifact.", {
+            (("artifact", artifact),): count for artifact, count in cache_stats["misses"].items()
+        }),
+        ("cache_evictions_total", "Conversion cache entries evicted to stay under the size limit.", {
+            (): cache_stats["evictions"]
+        }),
+        ("cache_size_bytes", "Bytes currently held by the conversion cache.", {(): cache_stats["size_bytes"]}),
+    ]
+    response = make_response(METRICS.render(gauges))
+    response.mimetype = "text/plain"
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 @app.get("/validation-report/<report_id>")
 def validation_report(report_id: str):
-    report_text = REPORT_CACHE.get(report_id)
-    if report_text is None:
+    job = JOB_STORE.get(report_id)
+    if job is None or job.report is None:
         return {"error": "report not found"}, 404
-    response = make_response(report_text)
+    report = job.report
+    if job.timings is not None:
+        report += job.timings.report_section()
+    response = make_response(report)
     response.mimetype = "text/plain"
     response.headers["Cache-Control"] = "no-store"
     return response
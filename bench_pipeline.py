@@ -0,0 +1,746 @@
+from __future__ import annotations
+
+import argparse
+import codecs
+import io
+import json
+import multiprocessing
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+from PIL import Image
+
+import merge_logs_to_pdf as core
+from synthetic_logs import SyntheticLogSpec, synthetic_apic_text, synthetic_fdo_text, synthetic_screenshot
+
+
+def _peak_rss_bytes() -> int:
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes.
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+    return int(counters.PeakWorkingSetSize)
+
+
+def _synthetic_fdo_text(line_count: int) -> str:
+    return synthetic_fdo_text(SyntheticLogSpec(lines=line_count))
+
+
+def _synthetic_image_bytes() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (1280, 720), color=(32, 64, 96)).save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def _pdf_eager(combined_lines: list[str], image_input: Path | bytes) -> bytes:
+    # Previous behaviour: draw every page with PIL, then let the native writer ignore them.
+    core.build_pdf_pages(combined_lines, image_input)
+    return core.build_pdf_bytes(combined_lines, image_input, backend="native-vector")
+
+
+def _pdf_variants() -> dict[str, Callable[[list[str], Path | bytes], bytes]]:
+    variants: dict[str, Callable[[list[str], Path | bytes], bytes]] = {"legacy-eager": _pdf_eager}
+    for name, backend in core.PDF_BACKENDS.items():
+        variants[name] = backend.build
+    return variants
+
+
+def _run_pdf_variant(variant: str, fdo_text: str, apic_text: str, image_input: Path | bytes, queue) -> None:
+    combined_lines = core.build_combined_lines(fdo_text, apic_text)
+    baseline_rss = _peak_rss_bytes()
+    started = time.perf_counter()
+    pdf_bytes = _pdf_variants()[variant](combined_lines, image_input)
+    elapsed = time.perf_counter() - started
+    queue.put((variant, elapsed, _peak_rss_bytes(), baseline_rss, len(pdf_bytes), len(combined_lines)))
+
+
+def bench_pdf(
+    fdo_text: str,
+    apic_text: str,
+    image_input: Path | bytes,
+    variants: list[str] | None = None,
+) -> None:
+    # Each variant runs in a fresh process so peak RSS is not shared between them.
+    ctx = multiprocessing.get_context("spawn")
+    for variant in variants or list(_pdf_variants()):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_pdf_variant, args=(variant, fdo_text, apic_text, image_input, queue))
+        proc.start()
+        name, elapsed, peak_rss, baseline_rss, size, line_count = queue.get()
+        proc.join()
+        print(
+            f"{name:<14} lines={line_count:<8} time={elapsed:8.3f}s "
+            f"peak_rss={peak_rss / 1048576:8.1f} MiB (+{(peak_rss - baseline_rss) / 1048576:.1f}) "
+            f"size={size / 1024:.1f} KiB"
+        )
+
+
+def _input_read_text(path: Path) -> int:
+    return len(core.preprocess_fdo_lines(core.read_text_with_fallback(path)))
+
+
+def _input_line_source(path: Path) -> int:
+    with core.LogLineSource.open(path) as source:
+        return len(core.preprocess_fdo_lines(source))
+
+
+def _input_line_scan(path: Path) -> int:
+    # Decoding and splitting alone, with nothing kept: the flat baseline.
+    with core.LogLineSource.open(path) as source:
+        return sum(1 for _line in source)
+
+
+INPUT_VARIANTS: dict[str, Callable[[Path], int]] = {
+    "read-text": _input_read_text,
+    "line-source": _input_line_source,
+    "line-scan": _input_line_scan,
+}
+
+
+def _run_input_variant(variant: str, path: Path, queue) -> None:
+    # Peak RSS would count the mapped file pages (and on Linux carries over
+    # the parent's peak across exec), so the Python heap peak is reported.
+    import tracemalloc
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    line_count = INPUT_VARIANTS[variant](path)
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queue.put((elapsed, peak, line_count))
+
+
+def bench_input(fdo_text: str, fdo_path: Path | None = None) -> None:
+    # Reading and preprocessing one FDO log, each variant in a fresh process.
+    # Synthetic text is written to a temporary file first. Times include
+    # tracemalloc overhead.
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = fdo_path
+        if path is None:
+            path = Path(tmp) / "fdo.log"
+            path.write_text(fdo_text, encoding="utf-8")
+        size = path.stat().st_size
+        for variant in INPUT_VARIANTS:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_input_variant, args=(variant, path, queue))
+            proc.start()
+            elapsed, peak, line_count = queue.get()
+            proc.join()
+            print(
+                f"{variant:<12} size={size / 1048576:8.1f} MiB lines={line_count:<9} time={elapsed:8.3f}s "
+                f"peak_heap={peak / 1048576:8.1f} MiB"
+            )
+
+
+ENCODING_SAMPLE_TEXT = {
+    "utf-8": "LEAF-101# show clock\n10:15:30.123 UTC Tue Nov 25 2025\n  description ลิงก์หลัก ห้อง ๒\n",
+    "utf-8-sig": "LEAF-101# show clock\n  description ลิงก์หลัก ห้อง ๒\n",
+    "utf-16": "LEAF-101# show clock\n  description ลิงก์หลัก ห้อง ๒\n",
+    "cp874": "LEAF-101# show clock\n  description ลิงก์หลัก ห้อง ๒\n",
+    "cp1252": "LEAF-101# show clock\n  description Müller – Straße\n",
+    "latin-1": "LEAF-101# show clock\n  description \x81\x8d raw bytes\n",
+}
+
+
+def _write_encoded_log(path: Path, encoding: str, size_bytes: int) -> None:
+    # A ~1 MiB encoded block repeated up to at least size_bytes; BOM-carrying
+    # codecs only get one BOM.
+    text = ENCODING_SAMPLE_TEXT[encoding]
+    body_codec = {"utf-8-sig": "utf-8", "utf-16": "utf-16-le"}.get(encoding, encoding)
+    block = (text * max(1, (1 << 20) // len(text))).encode(body_codec)
+    with path.open("wb") as sink:
+        written = 0
+        if encoding == "utf-8-sig":
+            written += sink.write(codecs.BOM_UTF8)
+        elif encoding == "utf-16":
+            written += sink.write(codecs.BOM_UTF16_LE)
+        # Whole blocks only, so no character is cut at the end.
+        while written < size_bytes:
+            written += sink.write(block)
+
+
+def _legacy_decode(raw: bytes) -> str:
+    # Whole-buffer trial decoding, as decode_text_with_fallback did before sniffing.
+    for enc in ("utf-8-sig", "utf-16", "cp874", "cp1252", "latin-1"):
+        try:
+            return raw.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode("latin-1", errors="replace")
+
+
+def _run_encoding_variant(variant: str, path: Path, queue) -> None:
+    started = time.perf_counter()
+    if variant == "legacy-trial":
+        result = len(_legacy_decode(path.read_bytes()))
+    elif variant == "sniff":
+        with core.LogLineSource.open(path) as source:
+            result = source.encoding
+    elif variant == "sniff+decode":
+        result = len(core.decode_text_with_fallback(path.read_bytes()))
+    else:
+        with core.LogLineSource.open(path) as source:
+            result = sum(1 for _line in source)
+    queue.put((time.perf_counter() - started, result))
+
+
+def bench_encoding(sizes_mb: list[int]) -> None:
+    # Each (encoding, size, variant) runs in a fresh process on a generated file.
+    ctx = multiprocessing.get_context("spawn")
+    variants = ("legacy-trial", "sniff", "sniff+decode", "stream-lines")
+    with tempfile.TemporaryDirectory() as tmp:
+        for encoding in ENCODING_SAMPLE_TEXT:
+            for size_mb in sizes_mb:
+                path = Path(tmp) / f"{encoding}-{size_mb}.log"
+                _write_encoded_log(path, encoding, size_mb * 1024 * 1024)
+                for variant in variants:
+                    queue = ctx.Queue()
+                    proc = ctx.Process(target=_run_encoding_variant, args=(variant, path, queue))
+                    proc.start()
+                    elapsed, result = queue.get()
+                    proc.join()
+                    throughput = size_mb / elapsed if elapsed else float("inf")
+                    print(
+                        f"{encoding:<10} size={size_mb:>5} MiB {variant:<13} time={elapsed:9.4f}s "
+                        f"{throughput:10.1f} MiB/s result={result}"
+                    )
+                path.unlink()
+
+
+def _legacy_classify_line(line: str) -> tuple[bool, bool, set[str]]:
+    # The per-pattern cascade the pipeline used before classify_prompt_line.
+    kinds: set[str] = set()
+    if core.SHOW_CLOCK_COMMAND_PATTERN.search(line):
+        kinds.add("show_clock")
+    if core.SHOW_VERSION_PATTERN.search(line):
+        kinds.add("show_version")
+    if core.SHOW_RUNNING_CONFIG_PATTERN.search(line):
+        kinds.add("show_running_config")
+    if core.SHOW_ENV_PATTERN.search(line):
+        kinds.add("show_environment")
+    match = re.search(r"#\s*(.+)$", line)
+    raw = match.group(1).strip().lower() if match else ""
+    tokens = [token for token in re.split(r"\s+", raw) if token] if raw else []
+    if core._is_show_interface_counters_errors_tokens(tokens):
+        kinds.add("show_interface_errors")
+    core.CLEAR_WORD_PATTERN.search(line)
+    is_command = bool(core.COMMAND_LINE_PATTERN.match(line))
+    is_prompt_only = bool(core.PROMPT_ONLY_PATTERN.fullmatch(line))
+    return is_command, is_prompt_only, kinds
+
+
+def _new_classify_line(line: str) -> tuple[bool, bool, frozenset[str]]:
+    core.CLEAR_WORD_PATTERN.search(line)
+    return core.classify_prompt_line(line)
+
+
+def bench_classify(fdo_text: str, rounds: int = 3) -> None:
+    lines = fdo_text.splitlines()
+    variants: dict[str, Callable[[str], object]] = {
+        "legacy-cascade": _legacy_classify_line,
+        "dispatch-cold": _new_classify_line,
+        "dispatch-warm": _new_classify_line,
+    }
+    for name, classify in variants.items():
+        if name == "dispatch-cold":
+            core._classify_prompt_line_cached.cache_clear()
+        best = float("inf")
+        for _ in range(1 if name == "dispatch-cold" else rounds):
+            started = time.perf_counter()
+            for line in lines:
+                classify(line)
+            best = min(best, time.perf_counter() - started)
+        print(f"{name:<16} lines={len(lines):<8} {len(lines) / best:14,.0f} lines/s")
+
+
+def _legacy_wrap_segments(line: str, max_chars: int) -> list[str]:
+    # One TextWrapper per line, as the pipeline wrapped before _wrap_long_line.
+    wrapper = textwrap.TextWrapper(
+        width=max_chars,
+        expand_tabs=False,
+        replace_whitespace=False,
+        drop_whitespace=False,
+        break_long_words=False,
+        break_on_hyphens=True,
+    )
+    wrapper.wordsep_re = core.WORD_WRAP_SEPARATOR_PATTERN
+    return wrapper.wrap(line) or [""]
+
+
+def bench_wrap(fdo_text: str, apic_text: str, rounds: int = 3) -> None:
+    # "all": every combined line; "long": runs of three lines joined, so
+    # nothing takes the fits-on-one-row fast path.
+    *_geometry, max_chars = core._text_layout_params()
+    lines = [line.replace("\t", "    ") for line in core.build_combined_lines(fdo_text, apic_text)]
+    corpora = {
+        "all": lines,
+        "long": [" ".join(lines[idx : idx + 3]) for idx in range(0, len(lines), 3)],
+    }
+    for corpus, corpus_lines in corpora.items():
+        mismatches = sum(
+            core._wrap_text_segments(line, max_chars) != _legacy_wrap_segments(line, max_chars)
+            for line in corpus_lines
+        )
+        variants: dict[str, Callable[[str, int], list[str]]] = {
+            "textwrap": _legacy_wrap_segments,
+            "engine-cold": core._wrap_text_segments,
+            "engine-warm": core._wrap_text_segments,
+        }
+        for name, wrap in variants.items():
+            if name == "engine-cold":
+                core._wrap_long_line.cache_clear()
+            best = _time_best(
+                lambda: [wrap(line, max_chars) for line in corpus_lines],
+                1 if name == "engine-cold" else rounds,
+            )
+            print(
+                f"{corpus:<5} {name:<12} lines={len(corpus_lines):<8} "
+                f"{len(corpus_lines) / best:14,.0f} lines/s mismatches={mismatches}"
+            )
+
+
+def _time_best(fn: Callable[[], object], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_scaling(
+    fdo_text: str,
+    apic_text: str,
+    image_input: Path | bytes,
+    workers: list[int],
+    batch_size: int = 8,
+    rounds: int = 3,
+) -> None:
+    # "pages": one large PDF with page streams farmed out after pagination.
+    # "batch": batch_size independent devices converted on the same pool.
+    combined_lines = core.build_combined_lines(fdo_text, apic_text)
+    image_bytes = image_input.read_bytes() if isinstance(image_input, Path) else image_input
+    inputs = {"fdo.log": fdo_text.encode("utf-8"), "apic.log": apic_text.encode("utf-8"), "image.jpg": image_bytes}
+    devices = [
+        core.BatchDevice(name=f"dev{idx}", fdo="fdo.log", apic="apic.log", image="image.jpg")
+        for idx in range(batch_size)
+    ]
+    print(f"cpus={os.cpu_count()} lines={len(combined_lines)} batch={batch_size}")
+
+    baseline: dict[str, float] = {}
+    for count in workers:
+        core.configure_render_pool(count)
+        pool = core.get_render_pool()
+        if pool is not None:
+            # Start every worker before timing so spawn cost is not measured.
+            for future in [pool.submit(time.sleep, 0.05) for _ in range(count)]:
+                future.result()
+        timings = {
+            "pages": _time_best(lambda: core.build_pdf_bytes(combined_lines, image_input), rounds),
+            "batch": _time_best(lambda: core.build_batch_zip(devices, inputs.__getitem__, max_workers=1), rounds),
+        }
+        core.shutdown_render_pool()
+        for name, elapsed in timings.items():
+            baseline.setdefault(name, elapsed)
+            print(f"{name:<6} workers={count:<3} time={elapsed:8.3f}s speedup={baseline[name] / elapsed:5.2f}x")
+    core.configure_render_pool(1)
+
+
+def bench_repaginate(fdo_text: str, apic_text: str, pages: int = 100, rounds: int = 5) -> None:
+    # Single-line edits on a document cut to ``pages`` text pages: a full
+    # PageLayout.build against repaginate() from the previous layout.
+    combined_lines = core.build_combined_lines(fdo_text, apic_text)
+    layout = core.PageLayout.build(combined_lines)
+    if len(layout.pages) > pages:
+        combined_lines = combined_lines[: layout.line_pages.index(pages)]
+        layout = core.PageLayout.build(combined_lines)
+    print(f"lines={len(combined_lines)} pages={len(layout.pages)}")
+
+    clock_index = next(idx for idx, line in enumerate(combined_lines) if core._parse_clock_time_line(line))
+    middle = len(combined_lines) // 2
+    edits: dict[str, list[str]] = {
+        "clock-line": combined_lines[:clock_index] + ["10:15:31.456 UTC Tue Nov 25 2025"] + combined_lines[clock_index + 1 :],
+        "replace-mid": combined_lines[:middle] + [combined_lines[middle] + " edited"] + combined_lines[middle + 1 :],
+        "wrap-mid": combined_lines[:middle] + [combined_lines[middle] + " x" * 120] + combined_lines[middle + 1 :],
+        "insert-mid": combined_lines[:middle] + ["inserted line"] + combined_lines[middle:],
+        "delete-mid": combined_lines[:middle] + combined_lines[middle + 1 :],
+        "append-end": combined_lines + ["appended line"],
+    }
+    for name, edited in edits.items():
+        full = _time_best(lambda: core.PageLayout.build(edited), rounds)
+        incremental = _time_best(lambda: layout.repaginate(edited), rounds)
+        expected = core.PageLayout.build(edited)
+        result = layout.repaginate(edited)
+        same = result.pages == expected.pages and result.line_pages == expected.line_pages
+        print(
+            f"{name:<12} full={full * 1000:8.2f}ms incremental={incremental * 1000:8.2f}ms "
+            f"speedup={full / incremental:6.1f}x identical={same}"
+        )
+
+
+def bench_docx(fdo_text: str, apic_text: str, image_input: Path | bytes, rounds: int = 3) -> None:
+    # Streaming DOCX writer at each compression level: time, heap peak while
+    # writing and sizes; then what deflating the media part used to cost.
+    import tracemalloc
+
+    combined_lines = core.build_combined_lines(fdo_text, apic_text)
+    image_bytes = image_input.read_bytes() if isinstance(image_input, Path) else image_input
+    print(f"lines={len(combined_lines)}")
+    for compression in core.DOCX_COMPRESSION_LEVELS:
+        elapsed = _time_best(lambda: core.write_docx(combined_lines, image_bytes, io.BytesIO(), compression), rounds)
+        tracemalloc.start()
+        stats = core.write_docx(combined_lines, image_bytes, io.BytesIO(), compression)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(
+            f"{compression:<8} level={stats.level} time={elapsed:8.3f}s heap-peak={peak / 1024 / 1024:6.1f} MiB "
+            f"uncompressed={stats.uncompressed_bytes / 1024 / 1024:7.1f} MiB "
+            f"output={stats.compressed_bytes / 1024 / 1024:6.2f} MiB ({stats.ratio:.1%})"
+        )
+    _ext, _mime, media, _size = core._docx_image_part(image_bytes)
+    deflate = _time_best(lambda: zlib.compress(media, 6), rounds)
+    print(
+        f"media {len(media)} bytes: stored, deflating it would take {deflate * 1000:.2f}ms "
+        f"to save {len(media) - len(zlib.compress(media, 6))} bytes"
+    )
+
+
+def _legacy_pdf_image(raw: bytes) -> bytes:
+    # Previous behaviour: everything but an RGB JPEG became a quality-100 JPEG.
+    with Image.open(io.BytesIO(raw)) as src:
+        if src.format == "JPEG" and src.mode == "RGB":
+            return raw
+        return core._jpeg_bytes_from_image(src, quality=100)
+
+
+def _embedded_image_bytes(image: "core.PdfImage") -> int:
+    return len(image.data) + (len(image.smask.data) if image.smask is not None else 0)
+
+
+def bench_image(image_input: Path | bytes, rounds: int = 3) -> None:
+    # The screenshot as each kind of upload, old JPEG transcode against the
+    # PNG passthrough / soft-mask path, first call and cached re-run.
+    image_bytes = image_input.read_bytes() if isinstance(image_input, Path) else image_input
+    with Image.open(io.BytesIO(image_bytes)) as src:
+        rgb = src.convert("RGB")
+    rgba = rgb.convert("RGBA")
+    rgba.putalpha(Image.linear_gradient("L").resize(rgb.size))
+    variants: dict[str, bytes] = {}
+    for name, image, fmt in (
+        ("png-rgb", rgb, "PNG"),
+        ("png-rgba-opaque", rgb.convert("RGBA"), "PNG"),
+        ("png-rgba", rgba, "PNG"),
+        ("jpeg-rgb", rgb, "JPEG"),
+        ("bmp", rgb, "BMP"),
+    ):
+        out = io.BytesIO()
+        image.save(out, format=fmt)
+        variants[name] = out.getvalue()
+    print(f"size={rgb.size[0]}x{rgb.size[1]}")
+    for name, raw in variants.items():
+        legacy = _time_best(lambda: _legacy_pdf_image(raw), rounds)
+        legacy_size = len(_legacy_pdf_image(raw))
+        core._pdf_image_cache.clear()
+        started = time.perf_counter()
+        image = core.pdf_image_from_bytes(raw)
+        first = time.perf_counter() - started
+        cached = _time_best(lambda: core.pdf_image_from_bytes(raw), rounds)
+        print(
+            f"{name:<16} upload={len(raw):>9} legacy={legacy * 1000:8.2f}ms/{legacy_size:>9}B "
+            f"new={first * 1000:8.2f}ms/{_embedded_image_bytes(image):>9}B cached={cached * 1000:7.2f}ms "
+            f"smask={image.smask is not None}"
+        )
+
+
+def _sequential_prepare(fdo_raw: bytes, apic_raw: bytes, image_bytes: bytes) -> dict[str, float]:
+    # The same stages one after another, as conversions ran before the DAG.
+    seconds: dict[str, float] = {}
+
+    def timed(name: str, fn: Callable[[], object]) -> object:
+        started = time.perf_counter()
+        result = fn()
+        seconds[name] = time.perf_counter() - started
+        return result
+
+    fdo_text = timed("decode_fdo", lambda: core.decode_text_with_fallback(fdo_raw))
+    apic_text = timed("decode_apic", lambda: core.decode_text_with_fallback(apic_raw))
+    preprocessed = timed("preprocess_fdo", lambda: core._preprocess_stage(fdo_text, None))
+    block = timed("split_apic", lambda: core._apic_block(apic_text))
+    timed("combine", lambda: core._splice_apic_block(preprocessed[0], *block))
+    timed("image", lambda: core.prepare_render_image(image_bytes))
+    return seconds
+
+
+def bench_stages(fdo_text: str, apic_text: str, image_input: Path | bytes, workers: list[int], rounds: int = 3) -> None:
+    # Sum of the stages run back to back against the StageGraph wall time.
+    # The screenshot is re-encoded as PNG so the image stage has work to do.
+    image_bytes = image_input.read_bytes() if isinstance(image_input, Path) else image_input
+    with Image.open(io.BytesIO(image_bytes)) as src:
+        out = io.BytesIO()
+        src.convert("RGB").save(out, format="PNG")
+        png_bytes = out.getvalue()
+    fdo_raw, apic_raw = fdo_text.encode("utf-8"), apic_text.encode("utf-8")
+    print(f"cpus={os.cpu_count()} fdo={len(fdo_raw)} bytes png={len(png_bytes)} bytes")
+    for count in workers:
+        core.configure_render_pool(count)
+        pool = core.get_render_pool()
+        if pool is not None:
+            for future in [pool.submit(time.sleep, 0.05) for _ in range(count)]:
+                future.result()
+        sequential = min(
+            (_sequential_prepare(fdo_raw, apic_raw, png_bytes) for _ in range(rounds)),
+            key=lambda seconds: sum(seconds.values()),
+        )
+        prepared = min(
+            (core.prepare_conversion(None, fdo_raw, apic_raw, png_bytes) for _ in range(rounds)),
+            key=lambda result: result.wall_seconds,
+        )
+        core.shutdown_render_pool()
+        total = sum(sequential.values())
+        critical = max(
+            sequential["decode_fdo"] + sequential["preprocess_fdo"],
+            sequential["decode_apic"] + sequential["split_apic"],
+        ) + sequential["combine"]
+        critical = max(critical, sequential["image"])
+        print(
+            f"workers={count:<3} sequential={total:8.3f}s critical-path={critical:8.3f}s "
+            f"graph={prepared.wall_seconds:8.3f}s speedup={total / prepared.wall_seconds:5.2f}x"
+        )
+        print(f"            {prepared.timings_text()}")
+    core.configure_render_pool(1)
+
+
+SCALE_LINES = (1_000, 10_000, 100_000, 1_000_000)
+SCALE_RESULTS_VERSION = 1
+
+
+def _git_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _scale_targets(fdo_text: str, apic_text: str, image_bytes: bytes, seed: int) -> dict[str, Callable[[], object]]:
+    # The four entry points timed at every size; later ones reuse the
+    # combined lines so each target is measured on its own.
+    options = core.FdoClockOptions(seed=seed)
+    combined_lines = core.build_combined_lines(fdo_text, apic_text, fdo_clock_options=options)
+    return {
+        "preprocess_fdo_lines": lambda: core.preprocess_fdo_lines(fdo_text, options),
+        "_paginate_wrapped_lines": lambda: core._paginate_wrapped_lines(combined_lines),
+        "build_pdf_bytes": lambda: core.build_pdf_bytes(combined_lines, image_bytes),
+        "build_docx_bytes": lambda: core.build_docx_bytes(combined_lines, image_bytes),
+    }
+
+
+def _scale_output_size(result: object) -> tuple[int, str]:
+    if isinstance(result, (bytes, bytearray)):
+        return len(result), "bytes"
+    if isinstance(result, tuple):
+        return len(result[0]), "pages"
+    return len(result), "lines"
+
+
+def bench_scale(line_counts: list[int], rounds: int = 3, seed: int = 0) -> dict[str, object]:
+    """Time the pipeline entry points on synthetic logs of each size.
+
+    Sizes above 100k lines get a single round. The result is plain JSON so
+    runs from different commits can be diffed with ``--compare``.
+    """
+    image_bytes = synthetic_screenshot(seed=seed)
+    results = []
+    for line_count in line_counts:
+        spec = SyntheticLogSpec(lines=line_count, seed=seed)
+        fdo_text, apic_text = synthetic_fdo_text(spec), synthetic_apic_text(spec)
+        targets = _scale_targets(fdo_text, apic_text, image_bytes, seed)
+        size_rounds = rounds if line_count <= 100_000 else 1
+        for name, fn in targets.items():
+            # The first round also gives the output size.
+            started = time.perf_counter()
+            output_size, output_unit = _scale_output_size(fn())
+            elapsed = time.perf_counter() - started
+            if size_rounds > 1:
+                elapsed = min(elapsed, _time_best(fn, size_rounds - 1))
+            results.append(
+                {
+                    "target": name,
+                    "lines": line_count,
+                    "input_bytes": len(fdo_text.encode("utf-8")),
+                    "rounds": size_rounds,
+                    "seconds": round(elapsed, 6),
+                    "lines_per_second": round(line_count / elapsed) if elapsed else None,
+                    "output_size": output_size,
+                    "output_unit": output_unit,
+                }
+            )
+            print(
+                f"{name:<24} lines={line_count:<8} time={elapsed:9.4f}s "
+                f"rate={line_count / elapsed:>12,.0f} lines/s output={output_size} {output_unit}",
+                file=sys.stderr,
+            )
+    return {
+        "version": SCALE_RESULTS_VERSION,
+        "commit": _git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare_scale_results(baseline: dict[str, object], current: dict[str, object]) -> None:
+    # Ratios above 1.0 mean the current run is slower; written to stderr
+    # like the progress lines, so stdout stays valid JSON.
+    previous = {(entry["target"], entry["lines"]): entry for entry in baseline["results"]}
+    print(f"baseline {baseline.get('commit')} -> current {current.get('commit')}", file=sys.stderr)
+    for entry in current["results"]:
+        old = previous.get((entry["target"], entry["lines"]))
+        if old is None:
+            continue
+        ratio = entry["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        print(
+            f"{entry['target']:<24} lines={entry['lines']:<8} "
+            f"{old['seconds']:9.4f}s -> {entry['seconds']:9.4f}s  x{ratio:5.2f}",
+            file=sys.stderr,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the log conversion pipeline.")
+    parser.add_argument("--fdo", type=Path)
+    parser.add_argument("--apic", type=Path)
+    parser.add_argument("--image", type=Path)
+    parser.add_argument("--lines", type=int, default=50_000, help="Synthetic FDO size when --fdo is not given.")
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=(
+            "pdf",
+            "classify",
+            "scaling",
+            "repaginate",
+            "wrap",
+            "input",
+            "encoding",
+            "stages",
+            "image",
+            "docx",
+            "scale",
+        ),
+        help="Benchmarks to run (repeatable, default: pdf).",
+    )
+    parser.add_argument(
+        "--pdf-variant",
+        action="append",
+        choices=sorted(_pdf_variants()),
+        help="Limit the PDF benchmark to these variants (repeatable).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        action="append",
+        help="Worker counts for the scaling and stages benchmarks (repeatable, default: 1 2 4 8).",
+    )
+    parser.add_argument(
+        "--encoding-size-mb",
+        type=int,
+        action="append",
+        help="File sizes for the encoding benchmark (repeatable, default: 1 100 1024).",
+    )
+    parser.add_argument(
+        "--scale-lines",
+        type=int,
+        action="append",
+        help="Synthetic log sizes for the scale benchmark (repeatable, default: 1k 10k 100k 1M).",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the scale benchmark's synthetic inputs.")
+    parser.add_argument("--json", type=Path, help="Write the scale benchmark results here (default: stdout).")
+    parser.add_argument("--compare", type=Path, help="Scale results from an earlier run to compare against.")
+    args = parser.parse_args()
+
+    fdo_text = core.read_text_with_fallback(args.fdo) if args.fdo else _synthetic_fdo_text(args.lines)
+    apic_text = core.read_text_with_fallback(args.apic) if args.apic else "apic1# show version\n"
+    image_input: Path | bytes = args.image if args.image else _synthetic_image_bytes()
+
+    suites = args.suite or ["pdf"]
+    if "pdf" in suites:
+        bench_pdf(fdo_text, apic_text, image_input, variants=args.pdf_variant)
+    if "classify" in suites:
+        bench_classify(fdo_text)
+    if "scaling" in suites:
+        bench_scaling(fdo_text, apic_text, image_input, workers=args.workers or [1, 2, 4, 8])
+    if "repaginate" in suites:
+        bench_repaginate(fdo_text, apic_text)
+    if "wrap" in suites:
+        bench_wrap(fdo_text, apic_text)
+    if "input" in suites:
+        bench_input(fdo_text, args.fdo)
+    if "encoding" in suites:
+        bench_encoding(args.encoding_size_mb or [1, 100, 1024])
+    if "docx" in suites:
+        bench_docx(fdo_text, apic_text, image_input)
+    if "image" in suites:
+        bench_image(image_input)
+    if "stages" in suites:
+        bench_stages(fdo_text, apic_text, image_input, workers=args.workers or [1, 2, 4, 8])
+    if "scale" in suites:
+        results = bench_scale(args.scale_lines or list(SCALE_LINES), seed=args.seed)
+        if args.json is not None:
+            args.json.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        else:
+            print(json.dumps(results, indent=2))
+        if args.compare is not None:
+            compare_scale_results(json.loads(args.compare.read_text(encoding="utf-8")), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,28 @@
 from __future__ import annotations
 
 import argparse
+import bisect
+import codecs
+import hashlib
 import io
+import json
+import mmap
+import multiprocessing
+import os
 import random
 import re
-import textwrap
+import threading
+import time
 import zipfile
-from dataclasses import dataclass
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime, timedelta
-from pathlib import Path
-from typing import Iterable
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Callable, Iterable, Iterator, NamedTuple
 from xml.sax.saxutils import escape as xml_escape
 
 from PIL import Image, ImageDraw, ImageFont
@@ -24,6 +37,7 @@ A4_PAGE_H = 1123
 PDF_BODY_FONT_SIZE = 11
 PDF_BODY_LINE_HEIGHT = 15
 PDF_CHAR_WIDTH_ESTIMATE = 6.7
+PDF_FLATE_LEVEL = 6
 HIGHLIGHT_YELLOW = (255, 244, 130)
 TEXT_BLACK = (0, 0, 0)
 PAGE_WHITE = (255, 255, 255)
@@ -36,15 +50,39 @@ SHOW_RUNNING_CONFIG_PATTERN = re.compile(
     re.IGNORECASE,
 )
 SHOW_CLOCK_COMMAND_PATTERN = re.compile(r"#\s*(?:sh|sho|show)\s+(?:clock|clo)\b", re.IGNORECASE)
+SHOW_COMMAND_DISPATCH_PATTERN = re.compile(
+    r"#\s*(?:sh|sho|show)\s+(?:"
+    r"(?P<show_clock>clock|clo)"
+    r"|(?P<show_version>version|ver)"
+    r"|(?P<show_running_config>running(?:-|\s+)config|run)"
+    r"|(?P<show_environment>environment|env)"
+    r")\b",
+    re.IGNORECASE,
+)
+# Prompt up to the first "#"; the rest decides command vs prompt-only.
+PROMPT_LINE_PATTERN = re.compile(r"^\s*[^\s#][^#]*#(.*)$")
+PROMPT_CLASS_CACHE_SIZE = 4096
+WRAP_CACHE_SIZE = 4096
 CLEAR_WORD_PATTERN = re.compile(r"\bclear\b", re.IGNORECASE)
 TIME_LINE_PATTERN = re.compile(
     r"^(\s*(?:[.*]\s*)*)(\d{1,2}):(\d{2}):(\d{2})(?:\.(\d+))?\s+(\S+)\s+([A-Za-z]{3})\s+([A-Za-z]{3})\s+(\d{1,2})\s+(\d{4})\s*$"
 )
 INTERFACE_NAME_PATTERN = re.compile(r"^[A-Za-z][A-Za-z0-9/._:-]*$")
+INTERFACE_ROW_PATTERN = re.compile(r"^(\s*)(\S+)(.*)$")
+DIGIT_PATTERN = re.compile(r"\d")
 INTERFACE_ERRORS_FIELD_PATTERN = re.compile(r"(\s+)(\S+)")
 INTERFACE_ERRORS_HEADER_PATTERN = re.compile(r"^\s*port\s+.+$", re.IGNORECASE)
 WORD_WRAP_SEPARATOR_PATTERN = re.compile(r"(\s+|,\s*)")
 SECTION_SEPARATOR_PATTERN = re.compile(r"^\s*-{3,}(?:\s+-{3,})*\s*$")
+SEPARATOR_BLOCK_MAX_SCAN_LINES = 40
+
+# Tried in order after the BOM and UTF-16 checks; latin-1 takes anything else.
+TEXT_SNIFF_ENCODINGS = ("utf-8", "cp874", "cp1252")
+LINE_SOURCE_CHUNK_BYTES = 1024 * 1024
+SNIFF_WINDOW_BYTES = 64 * 1024
+SNIFF_SAMPLE_COUNT = 8
+ENCODING_CACHE_SIZE = 256
+LINE_BREAK_CHARS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
 
 MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
 MONTH_TO_INDEX = {month: idx for idx, month in enumerate(MONTHS)}
@@ -57,6 +95,14 @@ class FdoClockOptions:
     custom_date: str | None = None
     custom_start_time: str = "08:00:00"
     custom_end_time: str = "18:00:00"
+    seed: int | None = None
+
+
+CLOCK_SEED_LIMIT = 2**32
+
+
+def new_clock_seed() -> int:
+    return random.randrange(CLOCK_SEED_LIMIT)
 
 
 @dataclass(frozen=True)
@@ -68,22 +114,148 @@ class FdoPreprocessStats:
     interface_row_changes: list[str]
     clock_before: list[tuple[int, int, datetime, str]]
     clock_after: list[tuple[int, int, datetime, str]]
-
-
-def decode_text_with_fallback(raw: bytes) -> str:
-    encodings = ("utf-8-sig", "utf-16", "cp874", "cp1252", "latin-1")
-    for enc in encodings:
+    clock_seed: int | None = None
+
+
+def _sniff_windows(data: bytes | mmap.mmap) -> list[tuple[bytes, bool, bool]]:
+    size = len(data)
+    window = SNIFF_WINDOW_BYTES
+    if size <= window * (SNIFF_SAMPLE_COUNT + 1):
+        return [(data[:], False, True)]
+    windows = [(data[:window], False, False)]
+    for sample in range(1, SNIFF_SAMPLE_COUNT + 1):
+        start = sample * (size - window) // SNIFF_SAMPLE_COUNT
+        windows.append((data[start : start + window], True, start + window == size))
+    return windows
+
+
+def _windows_decode(windows: list[tuple[bytes, bool, bool]], encoding: str) -> bool:
+    for chunk, starts_mid_file, ends_at_eof in windows:
+        if starts_mid_file and encoding == "utf-8":
+            # Skip the tail of a character cut by the window start.
+            skip = 0
+            while skip < 3 and skip < len(chunk) and 0x80 <= chunk[skip] <= 0xBF:
+                skip += 1
+            chunk = chunk[skip:]
+        decoder = codecs.getincrementaldecoder(encoding)()
         try:
-            return raw.decode(enc)
+            # A character cut by the window end is buffered, not an error.
+            decoder.decode(chunk, final=ends_at_eof)
         except UnicodeDecodeError:
-            continue
-    return raw.decode("latin-1", errors="replace")
+            return False
+    return True
+
+
+def sniff_encoding(data: bytes | mmap.mmap) -> str:
+    """Pick the encoding of a log from its BOM or a bounded sample of its bytes."""
+    if data[:3] == codecs.BOM_UTF8:
+        return "utf-8-sig"
+    if data[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        return "utf-16"
+
+    windows = _sniff_windows(data)
+    prefix = windows[0][0]
+    # Log text in UTF-16 has a NUL in every other byte for its ASCII part.
+    odd_nuls = prefix[1::2].count(0)
+    even_nuls = prefix[0::2].count(0)
+    if len(prefix) >= 2 and max(odd_nuls, even_nuls) * 4 >= len(prefix) // 2:
+        return "utf-16-le" if odd_nuls >= even_nuls else "utf-16-be"
+
+    for enc in TEXT_SNIFF_ENCODINGS:
+        if _windows_decode(windows, enc):
+            return enc
+    return "latin-1"
+
+
+def detect_encoding(data: bytes | mmap.mmap, digest: str | None = None) -> str:
+    """``sniff_encoding`` remembered per upload when its content hash is given."""
+    if digest is None:
+        return sniff_encoding(data)
+    with _detected_encodings_lock:
+        encoding = _detected_encodings.get(digest)
+    if encoding is None:
+        encoding = sniff_encoding(data)
+        with _detected_encodings_lock:
+            if len(_detected_encodings) >= ENCODING_CACHE_SIZE:
+                _detected_encodings.pop(next(iter(_detected_encodings)))
+            _detected_encodings[digest] = encoding
+    return encoding
+
+
+_detected_encodings: dict[str, str] = {}
+_detected_encodings_lock = threading.Lock()
+
+
+def decode_text_with_fallback(raw: bytes, digest: str | None = None) -> str:
+    # Bytes outside the sampled windows that do not fit become U+FFFD.
+    return raw.decode(detect_encoding(raw, digest), errors="replace")
 
 
 def read_text_with_fallback(path: Path) -> str:
     return decode_text_with_fallback(path.read_bytes())
 
 
+class LogLineSource:
+    """Lines of a log held as bytes or a memory-mapped file, decoded on demand."""
+
+    def __init__(self, data: bytes | mmap.mmap, encoding: str | None = None) -> None:
+        self.data = data
+        self._encoding = encoding
+        self._file: BinaryIO | None = None
+
+    @classmethod
+    def open(cls, path: Path) -> LogLineSource:
+        handle = path.open("rb")
+        try:
+            size = os.fstat(handle.fileno()).st_size
+            # mmap refuses empty files.
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        except BaseException:
+            handle.close()
+            raise
+        source = cls(data)
+        source._file = handle
+        return source
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> LogLineSource:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def _chunks(self) -> Iterator[bytes]:
+        for offset in range(0, len(self.data), LINE_SOURCE_CHUNK_BYTES):
+            yield self.data[offset : offset + LINE_SOURCE_CHUNK_BYTES]
+
+    @property
+    def encoding(self) -> str:
+        if self._encoding is None:
+            self._encoding = sniff_encoding(self.data)
+        return self._encoding
+
+    def __iter__(self) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        pending = ""
+        for chunk in self._chunks():
+            pieces = (pending + decoder.decode(chunk)).splitlines(keepends=True)
+            pending = ""
+            if pieces:
+                last = pieces[-1]
+                # A trailing "\r" may be half of a "\r\n" split across chunks.
+                if last[-1] not in LINE_BREAK_CHARS or last[-1] == "\r":
+                    pending = pieces.pop()
+            for piece in pieces:
+                yield piece[:-2] if piece.endswith("\r\n") else piece[:-1]
+        yield from (pending + decoder.decode(b"", final=True)).splitlines()
+
+
 def _parse_hms_seconds(value: str, fallback_seconds: int) -> int:
     match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})(?::(\d{2}))?\s*", value or "")
     if not match:
@@ -142,43 +314,34 @@ def _format_clock_time_line(
     return f"{prefix}{base} {timezone_token} {weekday} {month} {dt.day} {dt.year}"
 
 
-def _randomize_microsecond_for_precision(fraction_digits: int) -> int:
+def _randomize_microsecond_for_precision(fraction_digits: int, rng: random.Random | None = None) -> int:
+    rng = rng or random
     if fraction_digits <= 0:
         return 0
     if fraction_digits >= 6:
-        return random.randint(0, 999999)
+        return rng.randint(0, 999999)
     visible_max = (10 ** fraction_digits) - 1
     step = 10 ** (6 - fraction_digits)
-    return random.randint(0, visible_max) * step
+    return rng.randint(0, visible_max) * step
 
 
-def _is_show_clock_command(line: str) -> bool:
-    return bool(SHOW_CLOCK_COMMAND_PATTERN.search(line))
+class PromptLineClass(NamedTuple):
+    is_command: bool
+    is_prompt_only: bool
+    kinds: frozenset[str]
 
 
-def _prompt_command_tokens(line: str) -> list[str]:
-    match = re.search(r"#\s*(.+)$", line)
-    if not match:
-        return []
-    raw = match.group(1).strip().lower()
-    if not raw:
-        return []
-    return [token for token in re.split(r"\s+", raw) if token]
-
+NOT_A_PROMPT_LINE = PromptLineClass(False, False, frozenset())
 
-def _is_show_interface_counters_errors_command(line: str) -> bool:
-    tokens = _prompt_command_tokens(line)
-    if not tokens:
-        return False
 
-    first = tokens[0]
-    if not first.startswith("sh"):
+def _is_show_interface_counters_errors_tokens(tokens: list[str]) -> bool:
+    # Cisco-style abbreviations: "sh[ow] ... int[erface] ... cou[nters] ... err[ors]".
+    if not tokens or not tokens[0].startswith("sh"):
         return False
 
-    search_tokens = tokens[1:]
     found_int = False
     found_count = False
-    for token in search_tokens:
+    for token in tokens[1:]:
         if not found_int:
             if token.startswith("int"):
                 found_int = True
@@ -192,6 +355,112 @@ def _is_show_interface_counters_errors_command(line: str) -> bool:
     return False
 
 
+@lru_cache(maxsize=PROMPT_CLASS_CACHE_SIZE)
+def _classify_prompt_line_cached(line: str) -> PromptLineClass:
+    is_command = False
+    is_prompt_only = False
+    prompt_match = PROMPT_LINE_PATTERN.match(line)
+    if prompt_match:
+        rest = prompt_match.group(1)
+        if rest.strip() == "":
+            is_prompt_only = True
+        elif rest[0].isspace():
+            is_command = True
+
+    kinds = {match.lastgroup for match in SHOW_COMMAND_DISPATCH_PATTERN.finditer(line)}
+    tokens = line[line.index("#") + 1 :].lower().split()
+    if _is_show_interface_counters_errors_tokens(tokens):
+        kinds.add("show_interface_errors")
+    return PromptLineClass(is_command, is_prompt_only, frozenset(kinds))
+
+
+def classify_prompt_line(line: str) -> PromptLineClass:
+    """Classify a log line against every prompt/command pattern at once."""
+    if "#" not in line:
+        return NOT_A_PROMPT_LINE
+    return _classify_prompt_line_cached(line)
+
+
+COMMAND_KINDS = (
+    "show_clock",
+    "show_version",
+    "show_running_config",
+    "show_environment",
+    "show_interface_errors",
+)
+
+
+class CommandIndex:
+    """Prompt lines of one document, classified once."""
+
+    def __init__(
+        self,
+        line_count: int,
+        commands: list[int],
+        prompts: list[int],
+        kinds: dict[str, list[int]],
+    ) -> None:
+        self.line_count = line_count
+        self.commands = commands
+        self.prompts = prompts
+        self.kinds = kinds
+        self._command_set = frozenset(commands)
+        self._show_clock_set = frozenset(kinds["show_clock"])
+
+    @classmethod
+    def build(cls, lines: list[str]) -> CommandIndex:
+        commands: list[int] = []
+        prompts: list[int] = []
+        kinds: dict[str, list[int]] = {kind: [] for kind in COMMAND_KINDS}
+        for idx, line in enumerate(lines):
+            if "#" not in line:
+                continue
+            line_class = _classify_prompt_line_cached(line)
+            if line_class.is_command:
+                commands.append(idx)
+            elif line_class.is_prompt_only:
+                prompts.append(idx)
+            for kind in line_class.kinds:
+                kinds[kind].append(idx)
+        return cls(len(lines), commands, prompts, kinds)
+
+    def positions(self, kind: str) -> list[int]:
+        return self.kinds[kind]
+
+    def first(self, kind: str) -> int | None:
+        positions = self.kinds[kind]
+        return positions[0] if positions else None
+
+    def is_command(self, idx: int) -> bool:
+        return idx in self._command_set
+
+    def is_show_clock(self, idx: int) -> bool:
+        return idx in self._show_clock_set
+
+    def next_command_after(self, idx: int) -> int | None:
+        pos = bisect.bisect_right(self.commands, idx)
+        return self.commands[pos] if pos < len(self.commands) else None
+
+    def first_prompt_from(self, start: int) -> int | None:
+        pos = bisect.bisect_left(self.prompts, start)
+        return self.prompts[pos] if pos < len(self.prompts) else None
+
+    def spliced(self, at: int, inserted: CommandIndex) -> CommandIndex:
+        """Index of this document with ``inserted``'s lines placed before line ``at``."""
+
+        def merge(own: list[int], other: list[int]) -> list[int]:
+            cut = bisect.bisect_left(own, at)
+            shift = inserted.line_count
+            return own[:cut] + [idx + at for idx in other] + [idx + shift for idx in own[cut:]]
+
+        return CommandIndex(
+            self.line_count + inserted.line_count,
+            merge(self.commands, inserted.commands),
+            merge(self.prompts, inserted.prompts),
+            {kind: merge(self.kinds[kind], inserted.kinds[kind]) for kind in self.kinds},
+        )
+
+
 def _is_interface_errors_header(line: str) -> bool:
     if not INTERFACE_ERRORS_HEADER_PATTERN.match(line):
         return False
@@ -199,70 +468,53 @@ def _is_interface_errors_header(line: str) -> bool:
     return len(tokens) >= 3 and tokens[0].lower() == "port"
 
 
-def _parse_interface_errors_data_row(line: str) -> tuple[str, list[int], str] | None:
-    match = re.match(r"^(\s*)(\S+)(.*)$", line)
+def _parse_interface_errors_row(line: str) -> tuple[str, list[int], str, list[str]] | None:
+    match = INTERFACE_ROW_PATTERN.match(line)
     if not match:
         return None
 
-    indent = match.group(1)
-    interface_name = match.group(2)
-    rest = match.group(3)
+    indent, interface_name, rest = match.groups()
     if not INTERFACE_NAME_PATTERN.fullmatch(interface_name):
         return None
     # Avoid touching header lines like "Port ..."; data rows always include a digit.
-    if not re.search(r"\d", interface_name):
+    if not DIGIT_PATTERN.search(interface_name):
         return None
 
-    fields: list[tuple[str, str]] = []
+    prefix = f"{indent}{interface_name}"
+    token_end_positions: list[int] = []
+    values: list[str] = []
     cursor = 0
     for field_match in INTERFACE_ERRORS_FIELD_PATTERN.finditer(rest):
         if field_match.start() != cursor:
             return None
-        fields.append((field_match.group(1), field_match.group(2)))
+        values.append(field_match.group(2))
         cursor = field_match.end()
+        token_end_positions.append(len(prefix) + cursor)
     trailing = rest[cursor:]
 
-    if not fields:
+    if not values:
         return None
     if trailing.strip():
         return None
+    return prefix, token_end_positions, trailing, values
 
-    prefix = f"{indent}{interface_name}"
-    token_end_positions: list[int] = []
-    for field_match in INTERFACE_ERRORS_FIELD_PATTERN.finditer(rest):
-        token_end_positions.append(len(prefix) + field_match.end())
-    return prefix, token_end_positions, trailing
-
-
-def _interface_row_contains_non_dash_value(line: str) -> bool:
-    match = re.match(r"^(\s*)(\S+)(.*)$", line)
-    if not match:
-        return False
-
-    interface_name = match.group(2)
-    rest = match.group(3)
-    if not INTERFACE_NAME_PATTERN.fullmatch(interface_name):
-        return False
-    if not re.search(r"\d", interface_name):
-        return False
-
-    values: list[str] = []
-    cursor = 0
-    for field_match in INTERFACE_ERRORS_FIELD_PATTERN.finditer(rest):
-        if field_match.start() != cursor:
-            return False
-        values.append(field_match.group(2))
-        cursor = field_match.end()
-    trailing = rest[cursor:]
-    if not values or trailing.strip():
-        return False
 
-    return any(value != "--" for value in values)
+def _parse_interface_errors_data_row(line: str) -> tuple[str, list[int], str] | None:
+    parsed = _parse_interface_errors_row(line)
+    if parsed is None:
+        return None
+    prefix, token_end_positions, trailing, _values = parsed
+    return prefix, token_end_positions, trailing
 
 
-def _normalize_interface_errors_block(block_lines: list[str]) -> list[str]:
+def _normalize_interface_errors_block(
+    block_lines: list[str],
+    parsed_rows: list[tuple[str, list[int], str, list[str]] | None] | None = None,
+) -> list[str]:
     normalized = block_lines[:]
     group: list[tuple[int, str, list[int], str]] = []
+    if parsed_rows is None:
+        parsed_rows = [_parse_interface_errors_row(line) for line in block_lines]
 
     def flush_group() -> None:
         nonlocal group
@@ -287,13 +539,12 @@ def _normalize_interface_errors_block(block_lines: list[str]) -> list[str]:
             normalized[line_idx] = "".join(out)
         group = []
 
-    for idx, line in enumerate(block_lines):
-        parsed = _parse_interface_errors_data_row(line)
+    for idx, parsed in enumerate(parsed_rows):
         if parsed is None:
             flush_group()
             continue
 
-        prefix, token_ends, trailing = parsed
+        prefix, token_ends, trailing, _values = parsed
         if group and len(token_ends) != len(group[0][2]):
             flush_group()
         group.append((idx, prefix, token_ends, trailing))
@@ -302,70 +553,27 @@ def _normalize_interface_errors_block(block_lines: list[str]) -> list[str]:
     return normalized
 
 
-def _force_interface_errors_to_dash(lines: list[str]) -> list[str]:
-    out: list[str] = []
-    in_errors_section = False
-    section_buffer: list[str] = []
-
-    def flush_section() -> None:
-        nonlocal section_buffer
-        if section_buffer:
-            out.extend(_normalize_interface_errors_block(section_buffer))
-            section_buffer = []
-
-    for line in lines:
-        if _is_show_interface_counters_errors_command(line):
-            flush_section()
-            in_errors_section = True
-            out.append(line)
-            continue
-
-        if not in_errors_section and _is_interface_errors_header(line):
-            in_errors_section = True
-            section_buffer.append(line)
-            continue
-
-        if in_errors_section and (COMMAND_LINE_PATTERN.match(line) or PROMPT_ONLY_PATTERN.fullmatch(line)):
-            flush_section()
-            in_errors_section = False
-            out.append(line)
-            continue
-
-        if in_errors_section:
-            section_buffer.append(line)
-            continue
-
-        flush_section()
-        out.append(line)
-
-    flush_section()
-    return out
-
-
-def _adjust_show_clock_lines(lines: list[str], options: FdoClockOptions | None = None) -> list[str]:
+def _adjust_show_clock_values(
+    lines: list[str],
+    blocks: list[tuple[int, int, datetime, str]],
+    options: FdoClockOptions | None = None,
+    rng: random.Random | None = None,
+) -> bool:
+    """Rewrite the first three show clock values in ``lines`` in place."""
     opts = options or FdoClockOptions()
-    blocks: list[tuple[int, datetime, int, str, str]] = []
-
-    for idx, line in enumerate(lines):
-        if not _is_show_clock_command(line):
-            continue
-        value_idx = idx + 1
-        while value_idx < len(lines) and lines[value_idx].strip() == "":
-            value_idx += 1
-        if value_idx >= len(lines):
-            continue
-        parsed = _parse_clock_time_line(lines[value_idx])
-        if not parsed:
-            continue
-        dt, fraction_digits, timezone_token, prefix = parsed
-        blocks.append((value_idx, dt, fraction_digits, timezone_token, prefix))
-
     if len(blocks) < 3:
-        return lines
+        return False
+    if rng is None:
+        rng = random.Random(opts.seed) if opts.seed is not None else random
+
+    resolved: list[tuple[int, datetime, int, str, str]] = []
+    for _cmd_idx, value_idx, _dt, value_line in blocks[:3]:
+        dt, fraction_digits, timezone_token, prefix = _parse_clock_time_line(value_line)
+        resolved.append((value_idx, dt, fraction_digits, timezone_token, prefix))
 
-    line1_idx, dt1_raw, has_ms1, tz1, prefix1 = blocks[0]
-    line2_idx, _dt2_raw, has_ms2, tz2, prefix2 = blocks[1]
-    line3_idx, _dt3_raw, has_ms3, tz3, prefix3 = blocks[2]
+    line1_idx, dt1_raw, has_ms1, tz1, prefix1 = resolved[0]
+    line2_idx, _dt2_raw, has_ms2, tz2, prefix2 = resolved[1]
+    line3_idx, _dt3_raw, has_ms3, tz3, prefix3 = resolved[2]
 
     def apply_fraction_precision(dt: datetime, fraction_digits: int) -> datetime:
         if fraction_digits <= 0:
@@ -374,7 +582,7 @@ def _adjust_show_clock_lines(lines: list[str], options: FdoClockOptions | None =
             step = 10 ** (6 - fraction_digits)
             return dt.replace(microsecond=(dt.microsecond // step) * step)
         if fraction_digits > 6:
-            return dt.replace(microsecond=_randomize_microsecond_for_precision(fraction_digits))
+            return dt.replace(microsecond=_randomize_microsecond_for_precision(fraction_digits, rng))
         return dt
 
     # Clock #1 behavior:
@@ -406,43 +614,24 @@ def _adjust_show_clock_lines(lines: list[str], options: FdoClockOptions | None =
 
         # Randomize clock #1 inside selected custom range.
         range_us = int((dt1_window_end - dt1_window_start).total_seconds() * 1_000_000)
-        offset_us = random.randint(0, max(0, range_us))
+        offset_us = rng.randint(0, max(0, range_us))
         dt1_new = dt1_window_start + timedelta(microseconds=offset_us)
         dt1_new = apply_fraction_precision(dt1_new, has_ms1)
     else:
         # Keep clock #1 as-is from source when custom mode is not selected.
         dt1_new = dt1_raw
 
-    delta12_sec = random.randint(40, 90)
-    delta23_sec = random.randint(420, 450)
+    delta12_sec = rng.randint(40, 90)
+    delta23_sec = rng.randint(420, 450)
     dt2_new = dt1_new + timedelta(seconds=delta12_sec)
     dt2_new = apply_fraction_precision(dt2_new, has_ms2)
     dt3_new = dt2_new + timedelta(seconds=delta23_sec)
     dt3_new = apply_fraction_precision(dt3_new, has_ms3)
 
-    out = lines[:]
-    out[line1_idx] = _format_clock_time_line(dt1_new, has_ms1, tz1, prefix1)
-    out[line2_idx] = _format_clock_time_line(dt2_new, has_ms2, tz2, prefix2)
-    out[line3_idx] = _format_clock_time_line(dt3_new, has_ms3, tz3, prefix3)
-    return out
-
-
-def _extract_show_clock_entries(lines: list[str]) -> list[tuple[int, int, datetime, str]]:
-    entries: list[tuple[int, int, datetime, str]] = []
-    for idx, line in enumerate(lines):
-        if not _is_show_clock_command(line):
-            continue
-        value_idx = idx + 1
-        while value_idx < len(lines) and lines[value_idx].strip() == "":
-            value_idx += 1
-        if value_idx >= len(lines):
-            continue
-        parsed = _parse_clock_time_line(lines[value_idx])
-        if not parsed:
-            continue
-        dt, _fraction_digits, _tz, _prefix = parsed
-        entries.append((idx, value_idx, dt, lines[value_idx]))
-    return entries
+    lines[line1_idx] = _format_clock_time_line(dt1_new, has_ms1, tz1, prefix1)
+    lines[line2_idx] = _format_clock_time_line(dt2_new, has_ms2, tz2, prefix2)
+    lines[line3_idx] = _format_clock_time_line(dt3_new, has_ms3, tz3, prefix3)
+    return True
 
 
 def _wrapped_seconds_diff(start: datetime, end: datetime) -> int:
@@ -456,7 +645,18 @@ def _count_matches(lines: list[str], pattern: re.Pattern[str]) -> int:
     return sum(1 for line in lines if pattern.search(line))
 
 
-def _build_fdo_validation_report(
+@dataclass(frozen=True)
+class FdoValidationResult:
+    passed: bool
+    report: str
+    checks: dict[str, dict[str, object]]
+    changes: dict[str, int]
+
+    def to_json(self) -> dict[str, object]:
+        return {"passed": self.passed, "checks": self.checks, "changes": self.changes, "report": self.report}
+
+
+def _build_fdo_validation(
     validated_lines: list[str],
     clear_removed: int,
     clear_removed_lines: list[tuple[int, str]],
@@ -467,14 +667,15 @@ def _build_fdo_validation_report(
     clock_after: list[tuple[int, int, datetime, str]],
     show_log_title_present: bool = False,
     show_log_image_present: bool = False,
-) -> str:
-    show_clock_cmd_indices = [idx for idx, line in enumerate(validated_lines) if _is_show_clock_command(line)]
-    show_version_indices = [idx for idx, line in enumerate(validated_lines) if SHOW_VERSION_PATTERN.search(line)]
-    show_running_indices = [idx for idx, line in enumerate(validated_lines) if SHOW_RUNNING_CONFIG_PATTERN.search(line)]
-    show_env_indices = [idx for idx, line in enumerate(validated_lines) if SHOW_ENV_PATTERN.search(line)]
-    interface_cmd_indices = [
-        idx for idx, line in enumerate(validated_lines) if _is_show_interface_counters_errors_command(line)
-    ]
+    command_index: CommandIndex | None = None,
+    clock_seed: int | None = None,
+) -> FdoValidationResult:
+    index = command_index or CommandIndex.build(validated_lines)
+    show_clock_cmd_indices = index.positions("show_clock")
+    show_version_indices = index.positions("show_version")
+    show_running_indices = index.positions("show_running_config")
+    show_env_indices = index.positions("show_environment")
+    interface_cmd_indices = index.positions("show_interface_errors")
     show_version_count = len(show_version_indices)
     show_running_count = len(show_running_indices)
     show_env_count = len(show_env_indices)
@@ -573,10 +774,7 @@ def _build_fdo_validation_report(
     show_log_detail = "ต้องมี show interface counters errors 2 คำสั่งก่อนจึงจะตรวจตำแหน่ง Show log ได้"
     if len(interface_cmd_indices) >= 2:
         iface2_idx = interface_cmd_indices[1]
-        next_command_idx = next(
-            (idx for idx in range(iface2_idx + 1, len(validated_lines)) if COMMAND_LINE_PATTERN.match(validated_lines[idx])),
-            None,
-        )
+        next_command_idx = index.next_command_after(iface2_idx)
         show_log_position_ok = next_command_idx is None
         if show_log_position_ok:
             show_log_detail = f"iface#2@{iface2_idx+1}, ไม่มี command ถัดจาก iface#2 => ผ่าน"
@@ -598,6 +796,10 @@ def _build_fdo_validation_report(
         for line_no, line_text in clear_removed_lines:
             clear_detail_lines.append(f"- line {line_no}: {line_text}")
 
+    clock_seed_lines = []
+    if clock_seed is not None:
+        clock_seed_lines.append(f"- seed ที่ใช้สุ่มเวลา show clock: {clock_seed} (ใช้ seed นี้เพื่อสร้างผลลัพธ์เดิมซ้ำ)")
+
     report_lines = [
         f"ผลการตรวจสอบ: {'ผ่าน' if overall_ok else 'ไม่ผ่าน'}",
         "",
@@ -606,6 +808,7 @@ def _build_fdo_validation_report(
         *clear_detail_lines,
         f"- แถว show interface counters errors ที่ปรับเป็น '--': {interface_rows_changed}/{interface_rows_seen}",
         f"- จำนวนบรรทัดเวลา show clock ที่เปลี่ยน: {clock_changed_lines}/3",
+        *clock_seed_lines,
         "",
         "คำสั่งที่ต้องมี:",
         *count_lines,
@@ -674,56 +877,146 @@ def _build_fdo_validation_report(
             report_lines.append(f"- {before}")
         report_lines.append("- ระบบได้ปรับบรรทัดข้างต้นให้เป็น '--' ในผลลัพธ์แล้ว")
 
-    return "\n".join(report_lines)
+    checks: dict[str, dict[str, object]] = {
+        "command_counts": {
+            "passed": counts_ok,
+            "commands": [
+                {"name": name, "found": found, "required": required, "passed": found == required}
+                for name, found, required in expected_counts
+            ],
+        },
+        "order": {"passed": order_ok, "detail": order_detail},
+        "placement": {"passed": placement_ok, "detail": placement_detail},
+        "clock_ranges": {
+            "passed": deltas_ok,
+            "delta_1_2_seconds": clock_delta_12,
+            "delta_2_3_seconds": clock_delta_23,
+        },
+        "show_log": {
+            "passed": show_log_ok,
+            "position_ok": show_log_position_ok,
+            "title_present": show_log_title_present,
+            "image_present": show_log_image_present,
+            "detail": show_log_detail,
+        },
+    }
+    changes = {
+        "clear_removed": clear_removed,
+        "interface_rows_changed": interface_rows_changed,
+        "interface_rows_seen": interface_rows_seen,
+        "clock_lines_changed": clock_changed_lines,
+        "clock_seed": clock_seed,
+    }
+    return FdoValidationResult(passed=overall_ok, report="\n".join(report_lines), checks=checks, changes=changes)
 
 
 def _preprocess_fdo_lines_and_stats(
-    fdo_text: str,
+    fdo_text: str | Iterable[str],
     options: FdoClockOptions | None = None,
 ) -> tuple[list[str], FdoPreprocessStats]:
-    raw_lines = fdo_text.splitlines()
-    lines_no_clear: list[str] = []
+    # One pass; only an open interface-errors section is buffered.
+    final_lines: list[str] = []
     clear_removed_lines: list[tuple[int, str]] = []
+    interface_rows_seen = 0
+    interface_row_changes: list[str] = []
+    clock_before: list[tuple[int, int, datetime, str]] = []
+    pending_clock_cmd_idx: int | None = None
+    in_errors_section = False
+    section_lines: list[str] = []
+    section_rows: list[tuple[str, list[int], str, list[str]] | None] = []
+
+    def flush_section() -> None:
+        nonlocal section_lines, section_rows
+        if not section_lines:
+            return
+        normalized = _normalize_interface_errors_block(section_lines, section_rows)
+        for before, after, parsed in zip(section_lines, normalized, section_rows):
+            if parsed is not None and before != after and any(value != "--" for value in parsed[3]):
+                interface_row_changes.append(before)
+        final_lines.extend(normalized)
+        section_lines = []
+        section_rows = []
+
+    raw_lines = fdo_text.splitlines() if isinstance(fdo_text, str) else fdo_text
     for line_no, line in enumerate(raw_lines, start=1):
         if CLEAR_WORD_PATTERN.search(line):
             clear_removed_lines.append((line_no, line))
             continue
-        lines_no_clear.append(line)
-    clear_removed = len(clear_removed_lines)
 
-    lines_after_interface = _force_interface_errors_to_dash(lines_no_clear)
-    interface_rows_seen = 0
-    interface_rows_changed = 0
-    interface_row_changes: list[str] = []
-    for before, after in zip(lines_no_clear, lines_after_interface):
-        if _parse_interface_errors_data_row(before) is not None:
+        idx = len(final_lines) + len(section_lines)
+        line_class = classify_prompt_line(line)
+        # A show clock value is the first non-blank line after the command.
+        if pending_clock_cmd_idx is not None and line.strip() != "":
+            parsed_clock = _parse_clock_time_line(line)
+            if parsed_clock:
+                clock_before.append((pending_clock_cmd_idx, idx, parsed_clock[0], line))
+            pending_clock_cmd_idx = None
+        if "show_clock" in line_class.kinds:
+            pending_clock_cmd_idx = idx
+
+        parsed_row = _parse_interface_errors_row(line)
+        if parsed_row is not None:
             interface_rows_seen += 1
-            if before != after and _interface_row_contains_non_dash_value(before):
-                interface_rows_changed += 1
-                interface_row_changes.append(before)
 
-    clock_before = _extract_show_clock_entries(lines_after_interface)
-    final_lines = _adjust_show_clock_lines(lines_after_interface, options=options)
-    clock_after = _extract_show_clock_entries(final_lines)
+        if "show_interface_errors" in line_class.kinds:
+            flush_section()
+            in_errors_section = True
+            final_lines.append(line)
+            continue
+
+        if not in_errors_section and _is_interface_errors_header(line):
+            in_errors_section = True
+            section_lines.append(line)
+            section_rows.append(parsed_row)
+            continue
+
+        if in_errors_section and (line_class.is_command or line_class.is_prompt_only):
+            flush_section()
+            in_errors_section = False
+            final_lines.append(line)
+            continue
+
+        if in_errors_section:
+            section_lines.append(line)
+            section_rows.append(parsed_row)
+            continue
+
+        final_lines.append(line)
+
+    flush_section()
+
+    clock_seed = options.seed if options is not None and options.seed is not None else new_clock_seed()
+    clock_after = clock_before[:]
+    if _adjust_show_clock_values(final_lines, clock_before, options=options, rng=random.Random(clock_seed)):
+        clock_after = []
+        for position, (cmd_idx, value_idx, dt, value_line) in enumerate(clock_before):
+            if position < 3:
+                value_line = final_lines[value_idx]
+                parsed_clock = _parse_clock_time_line(value_line)
+                if not parsed_clock:
+                    continue
+                dt = parsed_clock[0]
+            clock_after.append((cmd_idx, value_idx, dt, value_line))
 
     stats = FdoPreprocessStats(
-        clear_removed=clear_removed,
+        clear_removed=len(clear_removed_lines),
         clear_removed_lines=clear_removed_lines,
-        interface_rows_changed=interface_rows_changed,
+        interface_rows_changed=len(interface_row_changes),
         interface_rows_seen=interface_rows_seen,
         interface_row_changes=interface_row_changes,
         clock_before=clock_before,
         clock_after=clock_after,
+        clock_seed=clock_seed,
     )
     return final_lines, stats
 
 
 def preprocess_fdo_lines_with_report(
-    fdo_text: str,
+    fdo_text: str | Iterable[str],
     options: FdoClockOptions | None = None,
 ) -> tuple[list[str], str]:
     final_lines, stats = _preprocess_fdo_lines_and_stats(fdo_text, options=options)
-    report = _build_fdo_validation_report(
+    report = _build_fdo_validation(
         validated_lines=final_lines,
         clear_removed=stats.clear_removed,
         clear_removed_lines=stats.clear_removed_lines,
@@ -732,42 +1025,38 @@ def preprocess_fdo_lines_with_report(
         interface_row_changes=stats.interface_row_changes,
         clock_before=stats.clock_before,
         clock_after=stats.clock_after,
-    )
+        clock_seed=stats.clock_seed,
+    ).report
     return final_lines, report
 
 
-def preprocess_fdo_lines(fdo_text: str, options: FdoClockOptions | None = None) -> list[str]:
+def preprocess_fdo_lines(fdo_text: str | Iterable[str], options: FdoClockOptions | None = None) -> list[str]:
     lines, _stats = _preprocess_fdo_lines_and_stats(fdo_text, options=options)
     return lines
 
 
-def find_insert_index(lines: list[str]) -> int:
-    show_env_index = next(
-        (idx for idx, line in enumerate(lines) if SHOW_ENV_PATTERN.search(line)),
-        None,
-    )
+def find_insert_index(lines: list[str], command_index: CommandIndex | None = None) -> int:
+    index = command_index or CommandIndex.build(lines)
+    show_env_index = index.first("show_environment")
     if show_env_index is not None:
         return max(0, show_env_index - 1)
 
-    show_version_index = next(
-        (idx for idx, line in enumerate(lines) if SHOW_VERSION_PATTERN.search(line)),
-        None,
-    )
+    show_version_index = index.first("show_version")
     start = (show_version_index + 1) if show_version_index is not None else 0
 
-    for idx in range(start, len(lines)):
-        if PROMPT_ONLY_PATTERN.fullmatch(lines[idx]):
-            return idx
+    prompt_index = index.first_prompt_from(start)
+    if prompt_index is not None:
+        return prompt_index
 
-    for idx, line in enumerate(lines):
-        if PROMPT_ONLY_PATTERN.fullmatch(line):
-            return idx
+    prompt_index = index.first_prompt_from(0)
+    if prompt_index is not None:
+        return prompt_index
 
     return max(0, len(lines) - 1)
 
 
 def build_combined_lines(
-    fdo_text: str,
+    fdo_text: str | Iterable[str],
     apic_text: str,
     fdo_clock_options: FdoClockOptions | None = None,
 ) -> list[str]:
@@ -776,15 +1065,54 @@ def build_combined_lines(
 
 
 def build_combined_lines_with_report(
-    fdo_text: str,
+    fdo_text: str | Iterable[str],
     apic_text: str,
     fdo_clock_options: FdoClockOptions | None = None,
     show_log_title_present: bool = False,
     show_log_image_present: bool = False,
+    seed: int | None = None,
 ) -> tuple[list[str], str]:
+    combined_lines, validation = build_combined_lines_with_validation(
+        fdo_text,
+        apic_text,
+        fdo_clock_options=fdo_clock_options,
+        show_log_title_present=show_log_title_present,
+        show_log_image_present=show_log_image_present,
+        seed=seed,
+    )
+    return combined_lines, validation.report
+
+
+def build_combined_lines_with_validation(
+    fdo_text: str | Iterable[str],
+    apic_text: str,
+    fdo_clock_options: FdoClockOptions | None = None,
+    show_log_title_present: bool = False,
+    show_log_image_present: bool = False,
+    seed: int | None = None,
+) -> tuple[list[str], FdoValidationResult]:
+    if seed is not None:
+        fdo_clock_options = replace(fdo_clock_options or FdoClockOptions(), seed=seed)
     fdo_lines, stats = _preprocess_fdo_lines_and_stats(fdo_text, options=fdo_clock_options)
-    combined_lines = _combine_fdo_and_apic_lines(fdo_lines, apic_text)
-    report = _build_fdo_validation_report(
+    combined_lines, command_index = _combine_fdo_and_apic_lines_indexed(fdo_lines, apic_text)
+    validation = _validate_combined_lines(
+        combined_lines,
+        command_index,
+        stats,
+        show_log_title_present=show_log_title_present,
+        show_log_image_present=show_log_image_present,
+    )
+    return combined_lines, validation
+
+
+def _validate_combined_lines(
+    combined_lines: list[str],
+    command_index: CommandIndex,
+    stats: FdoPreprocessStats,
+    show_log_title_present: bool = False,
+    show_log_image_present: bool = False,
+) -> FdoValidationResult:
+    return _build_fdo_validation(
         validated_lines=combined_lines,
         clear_removed=stats.clear_removed,
         clear_removed_lines=stats.clear_removed_lines,
@@ -795,19 +1123,60 @@ def build_combined_lines_with_report(
         clock_after=stats.clock_after,
         show_log_title_present=show_log_title_present,
         show_log_image_present=show_log_image_present,
+        command_index=command_index,
+        clock_seed=stats.clock_seed,
+    )
+
+
+def validate_logs(
+    fdo_text: str | Iterable[str],
+    apic_text: str,
+    fdo_clock_options: FdoClockOptions | None = None,
+    show_log_title_present: bool = False,
+    show_log_image_present: bool = False,
+) -> FdoValidationResult:
+    """Preprocess and check the logs without paginating or rendering anything."""
+    _lines, validation = build_combined_lines_with_validation(
+        fdo_text,
+        apic_text,
+        fdo_clock_options=fdo_clock_options,
+        show_log_title_present=show_log_title_present,
+        show_log_image_present=show_log_image_present,
     )
-    return combined_lines, report
+    return validation
 
 
 def _combine_fdo_and_apic_lines(fdo_lines: list[str], apic_text: str) -> list[str]:
-    apic_lines = apic_text.splitlines()
+    combined_lines, _command_index = _combine_fdo_and_apic_lines_indexed(fdo_lines, apic_text)
+    return combined_lines
+
+
+def _combine_fdo_and_apic_lines_indexed(
+    fdo_lines: list[str],
+    apic_text: str,
+) -> tuple[list[str], CommandIndex]:
+    return _splice_apic_block(fdo_lines, *_apic_block(apic_text))
+
+
+def _apic_block(apic_text: str) -> tuple[list[str], CommandIndex]:
+    # Classified on its own so the combined index never re-reads FDO lines.
+    block = [""] + apic_text.splitlines() + [""]
+    return block, CommandIndex.build(block)
+
+
+def _splice_apic_block(
+    fdo_lines: list[str],
+    block: list[str],
+    block_index: CommandIndex,
+) -> tuple[list[str], CommandIndex]:
     if not fdo_lines:
-        return apic_lines
+        apic_lines = block[1:-1]
+        return apic_lines, CommandIndex.build(apic_lines)
 
-    insert_at = find_insert_index(fdo_lines)
-    first_part = fdo_lines[: insert_at + 1]
-    remaining_part = fdo_lines[insert_at + 1 :]
-    return first_part + [""] + apic_lines + [""] + remaining_part
+    fdo_index = CommandIndex.build(fdo_lines)
+    insert_at = find_insert_index(fdo_lines, command_index=fdo_index)
+    fdo_lines[insert_at + 1 : insert_at + 1] = block
+    return fdo_lines, fdo_index.spliced(insert_at + 1, block_index)
 
 
 def build_combined_text(
@@ -831,17 +1200,38 @@ def load_monospace_font(size: int) -> ImageFont.FreeTypeFont | ImageFont.ImageFo
 
 
 def _wrap_text_segments(line: str, max_chars: int) -> list[str]:
-    wrapper = textwrap.TextWrapper(
-        width=max_chars,
-        expand_tabs=False,
-        replace_whitespace=False,
-        drop_whitespace=False,
-        break_long_words=False,
-        break_on_hyphens=True,
-    )
-    wrapper.wordsep_re = WORD_WRAP_SEPARATOR_PATTERN
-    segments = wrapper.wrap(line)
-    return segments if segments else [""]
+    # Most log lines fit on one row; only longer ones go through the wrapper.
+    if len(line) <= max_chars:
+        return [line]
+    return list(_wrap_long_line(line, max_chars))
+
+
+@lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _wrap_long_line(line: str, max_chars: int) -> tuple[str, ...]:
+    # Breaks exactly like the TextWrapper it replaced.
+    segments: list[str] = []
+    current: list[str] = []
+    current_len = 0
+    for chunk in WORD_WRAP_SEPARATOR_PATTERN.split(line):
+        if not chunk:
+            continue
+        size = len(chunk)
+        if current_len + size <= max_chars:
+            current.append(chunk)
+            current_len += size
+            continue
+        if current:
+            segments.append("".join(current))
+        if size > max_chars:
+            segments.append(chunk)
+            current = []
+            current_len = 0
+        else:
+            current = [chunk]
+            current_len = size
+    if current:
+        segments.append("".join(current))
+    return tuple(segments)
 
 
 def wrap_lines(lines: list[str], max_chars: int) -> list[tuple[str, bool]]:
@@ -857,170 +1247,144 @@ def wrap_lines(lines: list[str], max_chars: int) -> list[tuple[str, bool]]:
     return wrapped
 
 
-def _wrap_single_line(line: str, max_chars: int) -> list[tuple[str, bool]]:
+def _wrap_single_line(line: str, max_chars: int, is_command: bool | None = None) -> list[tuple[str, bool]]:
     line = line.replace("\t", "    ")
-    is_command = bool(COMMAND_LINE_PATTERN.match(line))
+    if is_command is None:
+        is_command = bool(COMMAND_LINE_PATTERN.match(line))
     if line == "":
         return [("", False)]
     segments = _wrap_text_segments(line, max_chars)
     return [(segment, is_command) for segment in segments]
 
 
-def _is_section_separator(line: str) -> bool:
-    return bool(SECTION_SEPARATOR_PATTERN.match(line))
-
-
-def _separator_block_segments(
+def _wrap_indexed_line(
     lines: list[str],
-    start_index: int,
+    idx: int,
     max_chars: int,
-) -> tuple[list[tuple[str, bool]], int] | None:
-    if not _is_section_separator(lines[start_index]):
-        return None
-
-    end_index = None
-    max_scan_lines = 40
-    scan_limit = min(len(lines), start_index + max_scan_lines + 1)
-    for idx in range(start_index + 1, scan_limit):
-        if _is_section_separator(lines[idx]):
-            end_index = idx
-            break
-
-    if end_index is None:
-        return None
-
-    block_segments: list[tuple[str, bool]] = []
-    for idx in range(start_index, end_index + 1):
-        block_segments.extend(_wrap_single_line(lines[idx], max_chars))
-    return block_segments, (end_index + 1)
-
-
-def _line_with_trailing_separator_segments(
-    lines: list[str],
-    start_index: int,
-    max_chars: int,
-) -> tuple[list[tuple[str, bool]], int] | None:
-    next_index = start_index + 1
-    if next_index >= len(lines):
-        return None
-    if _is_section_separator(lines[start_index]):
-        return None
-    if not _is_section_separator(lines[next_index]):
-        return None
-
-    pair_segments = _wrap_single_line(lines[start_index], max_chars)
-    pair_segments.extend(_wrap_single_line(lines[next_index], max_chars))
-    return pair_segments, (next_index + 1)
-
-
-def _line_separator_header_separator_segments(
-    lines: list[str],
-    start_index: int,
-    max_chars: int,
-) -> tuple[list[tuple[str, bool]], int] | None:
-    sep1_index = start_index + 1
-    header_index = start_index + 2
-    sep2_index = start_index + 3
-    if sep2_index >= len(lines):
-        return None
-    if _is_section_separator(lines[start_index]):
-        return None
-    if not _is_section_separator(lines[sep1_index]):
-        return None
-    if _is_section_separator(lines[header_index]):
-        return None
-    if not _is_section_separator(lines[sep2_index]):
-        return None
+    command_index: CommandIndex,
+) -> list[tuple[str, bool]]:
+    return _wrap_single_line(lines[idx], max_chars, is_command=command_index.is_command(idx))
 
-    block_segments = _wrap_single_line(lines[start_index], max_chars)
-    block_segments.extend(_wrap_single_line(lines[sep1_index], max_chars))
-    block_segments.extend(_wrap_single_line(lines[header_index], max_chars))
-    block_segments.extend(_wrap_single_line(lines[sep2_index], max_chars))
-    next_index = sep2_index + 1
-    if next_index < len(lines):
-        next_line = lines[next_index]
-        if (
-            next_line.strip() != ""
-            and not _is_section_separator(next_line)
-            and not COMMAND_LINE_PATTERN.match(next_line)
-        ):
-            block_segments.extend(_wrap_single_line(next_line, max_chars))
-            return block_segments, (next_index + 1)
-    return block_segments, next_index
 
+def _is_section_separator(line: str) -> bool:
+    return "---" in line and bool(SECTION_SEPARATOR_PATTERN.match(line))
 
-def _header_with_trailing_separator_segments(
-    lines: list[str],
-    start_index: int,
-    max_chars: int,
-) -> tuple[list[tuple[str, bool]], int] | None:
-    if _is_section_separator(lines[start_index]) or lines[start_index].strip() == "":
-        return None
 
-    max_header_lines = 4
-    scan_limit = min(len(lines), start_index + max_header_lines + 1)
-    for sep_index in range(start_index + 1, scan_limit):
-        candidate = lines[sep_index]
-        if _is_section_separator(candidate):
-            body_lines = lines[start_index:sep_index]
-            if any(line.strip() == "" for line in body_lines):
-                return None
-            if any(COMMAND_LINE_PATTERN.match(line) for line in body_lines):
-                return None
+def _wrapped_row_count(line: str, max_chars: int) -> int:
+    if "\t" in line:
+        line = line.replace("\t", "    ")
+    if len(line) <= max_chars:
+        return 1
+    return len(_wrap_long_line(line, max_chars))
 
-            block_segments: list[tuple[str, bool]] = []
-            for idx in range(start_index, sep_index + 1):
-                block_segments.extend(_wrap_single_line(lines[idx], max_chars))
-            next_index = sep_index + 1
-            if next_index < len(lines):
-                next_line = lines[next_index]
-                if (
-                    next_line.strip() != ""
-                    and not _is_section_separator(next_line)
-                    and not COMMAND_LINE_PATTERN.match(next_line)
-                ):
-                    block_segments.extend(_wrap_single_line(next_line, max_chars))
-                    return block_segments, (next_index + 1)
-            return block_segments, next_index
-
-        if candidate.strip() == "":
-            return None
-        if COMMAND_LINE_PATTERN.match(candidate):
-            return None
 
-    return None
+BLOCK_KINDS = ("separator_table", "titled_table", "header", "line_separator", "show_clock", "line")
 
 
-def _show_clock_block_segments(
-    lines: list[str],
-    start_index: int,
-    max_chars: int,
-) -> tuple[list[tuple[str, bool]], int] | None:
-    if not _is_show_clock_command(lines[start_index]):
-        return None
+class BlockSpan(NamedTuple):
+    start: int
+    end: int
+    kind: str
 
-    next_index = start_index + 1
-    if next_index >= len(lines):
-        return None
 
-    block_segments = _wrap_single_line(lines[start_index], max_chars)
-    next_line = lines[next_index]
+class BlockScanner:
+    """Keep-together blocks of one document, found without wrapping them."""
 
-    # Some logs contain a blank line between "show clock" and its time output.
-    if next_line.strip() == "" and (next_index + 1) < len(lines):
-        time_line = lines[next_index + 1]
-        if _parse_clock_time_line(time_line) is not None:
-            block_segments.extend(_wrap_single_line(next_line, max_chars))
-            block_segments.extend(_wrap_single_line(time_line, max_chars))
-            return block_segments, (next_index + 2)
+    def __init__(
+        self,
+        lines: list[str],
+        command_index: CommandIndex,
+        max_chars: int,
+        lines_per_page: int,
+    ) -> None:
+        self.lines = lines
+        self.command_index = command_index
+        self.max_chars = max_chars
+        self.lines_per_page = lines_per_page
+        self.separators: list[int] = []
+        self.breakers: list[int] = []
+        for idx, line in enumerate(lines):
+            if _is_section_separator(line):
+                self.separators.append(idx)
+            elif not line.strip() or command_index.is_command(idx):
+                self.breakers.append(idx)
+        self._separator_set = frozenset(self.separators)
+
+    def is_separator(self, idx: int) -> bool:
+        return idx in self._separator_set
+
+    def _next_after(self, positions: list[int], idx: int) -> int | None:
+        pos = bisect.bisect_right(positions, idx)
+        return positions[pos] if pos < len(positions) else None
+
+    def _fits(self, start: int, end: int) -> bool:
+        if end - start > self.lines_per_page:
+            return False
+        rows = sum(_wrapped_row_count(self.lines[idx], self.max_chars) for idx in range(start, end))
+        return rows <= self.lines_per_page
 
-    if _parse_clock_time_line(next_line) is not None:
-        block_segments.extend(_wrap_single_line(next_line, max_chars))
-        return block_segments, (next_index + 1)
+    def _with_trailing_line(self, next_index: int) -> int:
+        # Header-style blocks take one more plain text line after the separator.
+        if (
+            next_index < len(self.lines)
+            and self.lines[next_index].strip() != ""
+            and not self.is_separator(next_index)
+            and not self.command_index.is_command(next_index)
+        ):
+            return next_index + 1
+        return next_index
+
+    def span_at(self, start: int) -> BlockSpan:
+        lines = self.lines
+        line_count = len(lines)
+        if self.is_separator(start):
+            end = self._next_after(self.separators, start)
+            if end is not None and end - start <= SEPARATOR_BLOCK_MAX_SCAN_LINES and self._fits(start, end + 1):
+                return BlockSpan(start, end + 1, "separator_table")
+            return BlockSpan(start, start + 1, "line")
 
-    # Fallback to previous behavior: keep command with immediate next line.
-    block_segments.extend(_wrap_single_line(next_line, max_chars))
-    return block_segments, (next_index + 1)
+        if (
+            start + 3 < line_count
+            and self.is_separator(start + 1)
+            and not self.is_separator(start + 2)
+            and self.is_separator(start + 3)
+        ):
+            end = self._with_trailing_line(start + 4)
+            if self._fits(start, end):
+                return BlockSpan(start, end, "titled_table")
+
+        if lines[start].strip() != "" and not self.command_index.is_command(start):
+            sep_index = self._next_after(self.separators, start)
+            if sep_index is not None and sep_index - start <= 4:
+                breaker = self._next_after(self.breakers, start)
+                if breaker is None or breaker > sep_index:
+                    end = self._with_trailing_line(sep_index + 1)
+                    if self._fits(start, end):
+                        return BlockSpan(start, end, "header")
+
+        if start + 1 < line_count and self.is_separator(start + 1) and self._fits(start, start + 2):
+            return BlockSpan(start, start + 2, "line_separator")
+
+        if self.command_index.is_show_clock(start) and start + 1 < line_count:
+            end = start + 2
+            # Some logs contain a blank line between "show clock" and its time output.
+            if (
+                lines[start + 1].strip() == ""
+                and start + 2 < line_count
+                and _parse_clock_time_line(lines[start + 2]) is not None
+            ):
+                end = start + 3
+            if self._fits(start, end):
+                return BlockSpan(start, end, "show_clock")
+
+        return BlockSpan(start, start + 1, "line")
+
+    def spans(self, start: int = 0) -> Iterator[BlockSpan]:
+        idx = start
+        while idx < len(self.lines):
+            span = self.span_at(idx)
+            yield span
+            idx = span.end
 
 
 def _text_layout_params() -> tuple[int, int, int, int, int, int]:
@@ -1036,99 +1400,242 @@ def _text_layout_params() -> tuple[int, int, int, int, int, int]:
     return (page_w, page_h, margin_x, margin_top, PDF_BODY_LINE_HEIGHT, lines_per_page, chars_per_line)
 
 
-def _paginate_wrapped_lines(lines: list[str]) -> tuple[list[list[tuple[str, bool]]], int, int, int, int, int]:
-    page_w, page_h, margin_x, margin_top, line_h, lines_per_page, max_chars = _text_layout_params()
-    pages: list[list[tuple[str, bool]]] = []
-    current_page: list[tuple[str, bool]] = []
+PAGINATION_LOOKAHEAD_LINES = SEPARATOR_BLOCK_MAX_SCAN_LINES + 1
 
-    def flush_page() -> None:
-        nonlocal current_page
-        if current_page:
-            pages.append(current_page)
-            current_page = []
+
+class _Paginator:
+    # Each unit records (first line, pages flushed, lines on the open page).
+
+    def __init__(
+        self,
+        lines: list[str],
+        command_index: CommandIndex,
+        lines_per_page: int,
+        max_chars: int,
+    ) -> None:
+        self.lines = lines
+        self.command_index = command_index
+        self.lines_per_page = lines_per_page
+        self.max_chars = max_chars
+        self.scanner = BlockScanner(lines, command_index, max_chars, lines_per_page)
+        self.pages: list[list[tuple[str, bool]]] = []
+        self.current_page: list[tuple[str, bool]] = []
+        self.line_pages: list[int] = []
+        self.units: list[tuple[int, int, int]] = []
+
+    def flush_page(self) -> None:
+        if self.current_page:
+            self.pages.append(self.current_page)
+            self.current_page = []
 
     def append_segments(
+        self,
         segments: list[tuple[str, bool]],
         keep_together: bool = False,
-    ) -> None:
-        if not segments:
-            return
+    ) -> int:
+        lines_per_page = self.lines_per_page
         if keep_together and len(segments) <= lines_per_page:
-            remaining_slots = lines_per_page - len(current_page)
-            if remaining_slots < len(segments) and current_page:
-                flush_page()
+            remaining_slots = lines_per_page - len(self.current_page)
+            if remaining_slots < len(segments) and self.current_page:
+                self.flush_page()
 
+        first_page = len(self.pages)
         pending = list(segments)
         while pending:
-            if len(current_page) == lines_per_page:
-                flush_page()
-            free_slots = lines_per_page - len(current_page)
+            if len(self.current_page) == lines_per_page:
+                self.flush_page()
+            free_slots = lines_per_page - len(self.current_page)
             take = pending[:free_slots]
-            current_page.extend(take)
+            self.current_page.extend(take)
             pending = pending[free_slots:]
-            if len(current_page) == lines_per_page:
-                flush_page()
-
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-
-        separator_block = _separator_block_segments(lines, i, max_chars)
-        if separator_block is not None:
-            block_segments, next_index = separator_block
-            if len(block_segments) <= lines_per_page:
-                append_segments(block_segments, keep_together=True)
-                i = next_index
-                continue
-
-        line_separator_header_separator = _line_separator_header_separator_segments(lines, i, max_chars)
-        if line_separator_header_separator is not None:
-            block_segments, next_index = line_separator_header_separator
-            if len(block_segments) <= lines_per_page:
-                append_segments(block_segments, keep_together=True)
-                i = next_index
-                continue
+            if len(self.current_page) == lines_per_page:
+                self.flush_page()
+        return first_page
+
+    def place_unit(self, i: int) -> tuple[int, int]:
+        span = self.scanner.span_at(i)
+        segments: list[tuple[str, bool]] = []
+        for idx in range(span.start, span.end):
+            segments.extend(_wrap_indexed_line(self.lines, idx, self.max_chars, self.command_index))
+        return self.append_segments(segments, keep_together=span.kind != "line"), span.end
+
+    def run(
+        self,
+        start: int,
+        converged: Callable[[int, int], bool] | None = None,
+        recall: Callable[[int], tuple[list[tuple[str, bool]], int, bool] | None] | None = None,
+    ) -> int:
+        lines = self.lines
+        i = start
+        while i < len(lines):
+            fill = len(self.current_page)
+            if converged is not None and converged(i, fill):
+                return i
+            pages_before = len(self.pages)
+            known = recall(i) if recall is not None else None
+            if known is not None:
+                segments, next_index, keep_together = known
+                first_page = self.append_segments(segments, keep_together=keep_together)
+            else:
+                first_page, next_index = self.place_unit(i)
+            self.units.append((i, pages_before, fill))
+            self.line_pages.extend([first_page] * (next_index - i))
+            i = next_index
+        return i
+
+
+class PageLayout:
+    """Paginated text of one document, reusable across renders."""
+
+    def __init__(
+        self,
+        lines: list[str],
+        pages: list[list[tuple[str, bool]]],
+        line_pages: list[int],
+        units: list[tuple[int, int, int]],
+    ) -> None:
+        page_w, page_h, margin_x, margin_top, line_h, lines_per_page, max_chars = _text_layout_params()
+        self.lines = lines
+        self.pages = pages
+        self.line_pages = line_pages
+        self.units = units
+        self.page_w = page_w
+        self.page_h = page_h
+        self.margin_x = margin_x
+        self.margin_top = margin_top
+        self.line_h = line_h
+        self.lines_per_page = lines_per_page
+        self.max_chars = max_chars
+
+    @classmethod
+    def build(cls, lines: list[str], command_index: CommandIndex | None = None) -> PageLayout:
+        paginator = cls._paginator(lines, command_index)
+        paginator.run(0)
+        return cls._finish(paginator)
+
+    @staticmethod
+    def _paginator(lines: list[str], command_index: CommandIndex | None) -> _Paginator:
+        _page_w, _page_h, _margin_x, _margin_top, _line_h, lines_per_page, max_chars = _text_layout_params()
+        return _Paginator(lines, command_index or CommandIndex.build(lines), lines_per_page, max_chars)
+
+    @classmethod
+    def _finish(cls, paginator: _Paginator) -> PageLayout:
+        paginator.flush_page()
+        pages = paginator.pages or [[("", False)]]
+        return cls(paginator.lines, pages, paginator.line_pages, paginator.units)
+
+    def to_json(self) -> dict[str, object]:
+        return {"lines": self.lines, "pages": self.pages, "line_pages": self.line_pages, "units": self.units}
+
+    @classmethod
+    def from_json(cls, data: dict[str, object]) -> PageLayout:
+        return cls(
+            data["lines"],
+            [[(text, is_command) for text, is_command in page] for page in data["pages"]],
+            data["line_pages"],
+            [tuple(unit) for unit in data["units"]],
+        )
 
-        header_with_separator = _header_with_trailing_separator_segments(lines, i, max_chars)
-        if header_with_separator is not None:
-            block_segments, next_index = header_with_separator
-            if len(block_segments) <= lines_per_page:
-                append_segments(block_segments, keep_together=True)
-                i = next_index
-                continue
+    def as_tuple(self) -> tuple[list[list[tuple[str, bool]]], int, int, int, int, int]:
+        return self.pages, self.page_w, self.page_h, self.margin_x, self.margin_top, self.line_h
+
+    def page_of_line(self, idx: int) -> int:
+        return self.line_pages[idx]
+
+    def repaginate(self, lines: list[str], command_index: CommandIndex | None = None) -> PageLayout:
+        """Layout for an edited copy of ``lines``, reusing pages the edit cannot move."""
+        old_lines = self.lines
+        shared = min(len(old_lines), len(lines))
+        first_dirty = 0
+        while first_dirty < shared and old_lines[first_dirty] == lines[first_dirty]:
+            first_dirty += 1
+        if first_dirty == shared and len(old_lines) == len(lines):
+            return self
+        tail = 0
+        while tail < shared - first_dirty and old_lines[-1 - tail] == lines[-1 - tail]:
+            tail += 1
+        clean_from = len(lines) - tail
+        delta = len(lines) - len(old_lines)
+
+        if not self.units:
+            return self.build(lines, command_index)
+        unit_starts = [unit[0] for unit in self.units]
+        resume = bisect.bisect_right(unit_starts, first_dirty - PAGINATION_LOOKAHEAD_LINES)
+        resume = min(resume, len(self.units) - 1)
+        start, pages_before, fill = self.units[resume]
+        paginator = self._paginator(lines, command_index)
+        paginator.pages = self.pages[:pages_before]
+        paginator.current_page = list(self.pages[pages_before][:fill])
+        paginator.line_pages = self.line_pages[:start]
+        paginator.units = self.units[:resume]
+
+        reuse_from: int | None = None
+        rows: list[tuple[str, bool]] = []
+        page_offsets: list[int] = []
+
+        def old_unit(idx: int) -> int | None:
+            if idx < clean_from:
+                return None
+            pos = bisect.bisect_left(unit_starts, idx - delta)
+            return pos if pos < len(unit_starts) and unit_starts[pos] == idx - delta else None
+
+        def converged(idx: int, fill: int) -> bool:
+            nonlocal reuse_from
+            pos = old_unit(idx)
+            if pos is not None and self.units[pos][2] == fill:
+                reuse_from = pos
+                return True
+            return False
 
-        line_with_separator = _line_with_trailing_separator_segments(lines, i, max_chars)
-        if line_with_separator is not None:
-            pair_segments, next_index = line_with_separator
-            if len(pair_segments) <= lines_per_page:
-                append_segments(pair_segments, keep_together=True)
-                i = next_index
-                continue
+        def recall(idx: int) -> tuple[list[tuple[str, bool]], int, bool] | None:
+            # A shifted tail reflows the old segments instead of rewrapping.
+            pos = old_unit(idx)
+            if pos is None:
+                return None
+            if not page_offsets:
+                for page in self.pages:
+                    page_offsets.append(len(rows))
+                    rows.extend(page)
+
+            def row_offset(unit_pos: int) -> int:
+                if unit_pos == len(self.units):
+                    return len(rows)
+                _unit_start, unit_pages, unit_fill = self.units[unit_pos]
+                return page_offsets[unit_pages] + unit_fill
+
+            old_end = unit_starts[pos + 1] if pos + 1 < len(unit_starts) else len(old_lines)
+            segments = rows[row_offset(pos) : row_offset(pos + 1)]
+            return segments, old_end + delta, old_end - unit_starts[pos] > 1
+
+        paginator.run(start, converged, recall)
+        if reuse_from is not None:
+            old_start, old_pages_before, fill = self.units[reuse_from]
+            page_shift = len(paginator.pages) - old_pages_before
+            if fill:
+                paginator.current_page.extend(self.pages[old_pages_before][fill:])
+                paginator.flush_page()
+                paginator.pages.extend(self.pages[old_pages_before + 1 :])
+            else:
+                paginator.pages.extend(self.pages[old_pages_before:])
+            paginator.line_pages.extend(page + page_shift for page in self.line_pages[old_start:])
+            paginator.units.extend(
+                (unit_start + delta, unit_pages + page_shift, unit_fill)
+                for unit_start, unit_pages, unit_fill in self.units[reuse_from:]
+            )
+        return self._finish(paginator)
 
-        show_clock_block = _show_clock_block_segments(lines, i, max_chars)
-        if show_clock_block is not None:
-            block_segments, next_index = show_clock_block
-            if len(block_segments) <= lines_per_page:
-                append_segments(block_segments, keep_together=True)
-                i = next_index
-                continue
 
-        line_segments = _wrap_single_line(line, max_chars)
-        append_segments(line_segments)
+def _paginate_wrapped_lines(
+    lines: list[str],
+    command_index: CommandIndex | None = None,
+) -> tuple[list[list[tuple[str, bool]]], int, int, int, int, int]:
+    return PageLayout.build(lines, command_index).as_tuple()
 
-        i += 1
 
-    flush_page()
-    if not pages:
-        pages = [[("", False)]]
-    return pages, page_w, page_h, margin_x, margin_top, line_h
+def iter_text_pages(lines: list[str]) -> Iterator[Image.Image]:
+    font = load_monospace_font(size=PDF_BODY_FONT_SIZE)
+    pages_data, page_w, page_h, margin_x, margin_top, line_h = _paginate_wrapped_lines(lines)
 
-
-def render_text_pages(lines: list[str]) -> list[Image.Image]:
-    font = load_monospace_font(size=PDF_BODY_FONT_SIZE)
-    pages_data, page_w, page_h, margin_x, margin_top, line_h = _paginate_wrapped_lines(lines)
-
-    pages: list[Image.Image] = []
     for page_lines in pages_data:
         page = Image.new("RGB", (page_w, page_h), color=PAGE_WHITE)
         draw = ImageDraw.Draw(page)
@@ -1143,8 +1650,11 @@ def render_text_pages(lines: list[str]) -> list[Image.Image]:
                 draw.rectangle((x1, y1, x2, y2), fill=HIGHLIGHT_YELLOW)
             draw.text((margin_x, y), text_line, font=font, fill=TEXT_BLACK)
             y += line_h
-        pages.append(page)
-    return pages
+        yield page
+
+
+def render_text_pages(lines: list[str]) -> list[Image.Image]:
+    return list(iter_text_pages(lines))
 
 
 def _load_image_rgb(image_input: Path | bytes) -> Image.Image:
@@ -1206,10 +1716,14 @@ def render_image_page(image_input: Path | bytes) -> Image.Image:
     return page
 
 
+def iter_pdf_pages(combined_lines: list[str], image_input: Path | bytes) -> Iterator[Image.Image]:
+    # Pages are drawn on demand so callers that never consume them pay nothing.
+    yield from iter_text_pages(combined_lines)
+    yield render_image_page(image_input)
+
+
 def build_pdf_pages(combined_lines: list[str], image_input: Path | bytes) -> list[Image.Image]:
-    pages = render_text_pages(combined_lines)
-    pages.append(render_image_page(image_input))
-    return pages
+    return list(iter_pdf_pages(combined_lines, image_input))
 
 
 def _sanitize_xml_text(text: str) -> str:
@@ -1239,19 +1753,62 @@ def _docx_image_part(image_input: Path | bytes) -> tuple[str, str, bytes, tuple[
         return "png", "image/png", out.getvalue(), size
 
 
-def _docx_run_xml(text: str, highlight: bool = False, bold: bool = False) -> str:
+DOCX_TEXT_STYLE = "LogText"
+DOCX_COMMAND_STYLE = "LogCommand"
+DOCX_WRITE_BATCH_LINES = 512
+DOCX_CHUNK_BYTES = 256 * 1024
+DOCX_COMPRESSION_LEVELS = {"fast": 1, "default": 6, "small": 9}
+DEFAULT_DOCX_COMPRESSION = "default"
+# Compressed already, so stored rather than deflated again.
+STORED_ZIP_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".docx", ".zip"})
+
+
+def resolve_docx_compression(name: str | None) -> int:
+    """Deflate level for a DOCX_COMPRESSION_LEVELS name or a digit 0-9."""
+    key = (name or DEFAULT_DOCX_COMPRESSION).strip().lower()
+    if key in DOCX_COMPRESSION_LEVELS:
+        return DOCX_COMPRESSION_LEVELS[key]
+    if key.isdigit() and 0 <= int(key) <= 9:
+        return int(key)
+    known = ", ".join(DOCX_COMPRESSION_LEVELS)
+    raise ValueError(f"Unknown DOCX compression: {name!r} (available: {known} or 0-9)")
+
+
+def _zip_compress_type(name: str) -> int:
+    if PurePosixPath(name).suffix.lower() in STORED_ZIP_SUFFIXES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+@dataclass
+class DocxWriteStats:
+    """Size/time trade-off of one DOCX package, filled in once it is written."""
+
+    compression: str
+    level: int
+    uncompressed_bytes: int = 0
+    compressed_bytes: int = 0
+    elapsed_seconds: float = 0.0
+
+    @classmethod
+    def for_compression(cls, compression: str | None) -> "DocxWriteStats":
+        return cls(compression or DEFAULT_DOCX_COMPRESSION, resolve_docx_compression(compression))
+
+    @property
+    def ratio(self) -> float:
+        return self.compressed_bytes / self.uncompressed_bytes if self.uncompressed_bytes else 1.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.compression} (level {self.level}): {self.uncompressed_bytes} -> {self.compressed_bytes} bytes "
+            f"({self.ratio:.1%}) in {self.elapsed_seconds:.3f}s"
+        )
+
+
+def _docx_run_xml(text: str, style: str = DOCX_TEXT_STYLE) -> str:
+    # Font, size and highlight come from the character styles in styles.xml.
     escaped = xml_escape(_sanitize_xml_text(text))
-    rpr_parts = [
-        '<w:rFonts w:ascii="Consolas" w:hAnsi="Consolas" w:eastAsia="Consolas"/>',
-        '<w:sz w:val="18"/>',
-        '<w:szCs w:val="18"/>',
-    ]
-    if bold:
-        rpr_parts.append("<w:b/>")
-    if highlight:
-        rpr_parts.append('<w:highlight w:val="yellow"/>')
-    rpr = "".join(rpr_parts)
-    return f"<w:r><w:rPr>{rpr}</w:rPr><w:t xml:space=\"preserve\">{escaped}</w:t></w:r>"
+    return f'<w:r><w:rPr><w:rStyle w:val="{style}"/></w:rPr><w:t xml:space="preserve">{escaped}</w:t></w:r>'
 
 
 def _docx_image_inline_xml(rel_id: str, width_px: int, height_px: int) -> str:
@@ -1304,22 +1861,7 @@ def _docx_image_inline_xml(rel_id: str, width_px: int, height_px: int) -> str:
 """.strip()
 
 
-def build_docx_bytes(combined_lines: list[str], image_input: Path | bytes) -> bytes:
-    img_ext, img_content_type, img_bytes, (img_w, img_h) = _docx_image_part(image_input)
-
-    paragraph_xml: list[str] = []
-    for line in combined_lines:
-        if line == "":
-            paragraph_xml.append("<w:p/>")
-            continue
-        is_command = bool(COMMAND_LINE_PATTERN.match(line))
-        paragraph_xml.append(f"<w:p>{_docx_run_xml(line, highlight=is_command)}</w:p>")
-
-    paragraph_xml.append("<w:p/>")
-    paragraph_xml.append(f"<w:p>{_docx_run_xml('Show log', highlight=True)}</w:p>")
-    paragraph_xml.append(_docx_image_inline_xml("rId1", img_w, img_h))
-
-    document_xml = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+DOCX_DOCUMENT_HEAD = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
 <w:document xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"
   xmlns:o="urn:schemas-microsoft-com:office:office"
   xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"
@@ -1336,7 +1878,9 @@ def build_docx_bytes(combined_lines: list[str], image_input: Path | bytes) -> by
   xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape"
   mc:Ignorable="w14 wp14">
   <w:body>
-    {''.join(paragraph_xml)}
+    """
+
+DOCX_DOCUMENT_TAIL = """
     <w:sectPr>
       <w:pgSz w:w="11906" w:h="16838"/>
       <w:pgMar w:top="720" w:right="720" w:bottom="720" w:left="720" w:header="708" w:footer="708" w:gutter="0"/>
@@ -1347,20 +1891,95 @@ def build_docx_bytes(combined_lines: list[str], image_input: Path | bytes) -> by
 </w:document>
 """
 
-    document_rels_xml = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/image1.{img_ext}"/>
-  <Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
-</Relationships>
-"""
-
-    styles_xml = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+DOCX_STYLES_XML = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
 <w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
   <w:style w:type="paragraph" w:default="1" w:styleId="Normal">
     <w:name w:val="Normal"/>
     <w:qFormat/>
   </w:style>
+  <w:style w:type="character" w:customStyle="1" w:styleId="{DOCX_TEXT_STYLE}">
+    <w:name w:val="{DOCX_TEXT_STYLE}"/>
+    <w:rPr>
+      <w:rFonts w:ascii="Consolas" w:hAnsi="Consolas" w:eastAsia="Consolas"/>
+      <w:sz w:val="18"/>
+      <w:szCs w:val="18"/>
+    </w:rPr>
+  </w:style>
+  <w:style w:type="character" w:customStyle="1" w:styleId="{DOCX_COMMAND_STYLE}">
+    <w:name w:val="{DOCX_COMMAND_STYLE}"/>
+    <w:basedOn w:val="{DOCX_TEXT_STYLE}"/>
+    <w:rPr>
+      <w:highlight w:val="yellow"/>
+    </w:rPr>
+  </w:style>
 </w:styles>
+"""
+
+DOCX_RELS_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>
+"""
+
+
+def _iter_docx_paragraphs(combined_lines: list[str]) -> Iterator[str]:
+    command_index = CommandIndex.build(combined_lines)
+    for idx, line in enumerate(combined_lines):
+        if line == "":
+            yield "<w:p/>"
+            continue
+        style = DOCX_COMMAND_STYLE if command_index.is_command(idx) else DOCX_TEXT_STYLE
+        yield f"<w:p>{_docx_run_xml(line, style)}</w:p>"
+
+
+class _ChunkSink:
+    # Write-only, unseekable file for ZipFile that hands back what was written.
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+        self.pending = 0
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        self.pending = 0
+        return data
+
+
+def iter_docx_chunks(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    compression: str | None = None,
+    stats: DocxWriteStats | None = None,
+) -> Iterator[bytes]:
+    """Yield the DOCX package in pieces of about DOCX_CHUNK_BYTES."""
+    image_part = _docx_image_part(image_input)
+    level = resolve_docx_compression(compression)
+    return _iter_docx_chunks(combined_lines, image_part, level, stats)
+
+
+def _iter_docx_chunks(
+    combined_lines: list[str],
+    image_part: tuple[str, str, bytes, tuple[int, int]],
+    level: int,
+    stats: DocxWriteStats | None,
+) -> Iterator[bytes]:
+    started = time.perf_counter()
+    written = 0
+    img_ext, img_content_type, img_bytes, (img_w, img_h) = image_part
+
+    document_rels_xml = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/image1.{img_ext}"/>
+  <Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>
 """
 
     content_types_xml = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
@@ -1373,21 +1992,58 @@ def build_docx_bytes(combined_lines: list[str], image_input: Path | bytes) -> by
 </Types>
 """
 
-    rels_xml = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
-</Relationships>
-"""
-
-    output = io.BytesIO()
-    with zipfile.ZipFile(output, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
         zf.writestr("[Content_Types].xml", content_types_xml)
-        zf.writestr("_rels/.rels", rels_xml)
-        zf.writestr("word/document.xml", document_xml)
-        zf.writestr("word/styles.xml", styles_xml)
+        zf.writestr("_rels/.rels", DOCX_RELS_XML)
+        # Size unknown until the end; zip64 lets the entry pass 4 GiB.
+        with zf.open("word/document.xml", "w", force_zip64=True) as part:
+            part.write(DOCX_DOCUMENT_HEAD.encode("utf-8"))
+            batch: list[str] = []
+            for paragraph in _iter_docx_paragraphs(combined_lines):
+                batch.append(paragraph)
+                if len(batch) >= DOCX_WRITE_BATCH_LINES:
+                    part.write("".join(batch).encode("utf-8"))
+                    batch.clear()
+                    if sink.pending >= DOCX_CHUNK_BYTES:
+                        written += sink.pending
+                        yield sink.drain()
+            batch.append("<w:p/>")
+            batch.append(f"<w:p>{_docx_run_xml('Show log', DOCX_COMMAND_STYLE)}</w:p>")
+            batch.append(_docx_image_inline_xml("rId1", img_w, img_h))
+            part.write("".join(batch).encode("utf-8"))
+            part.write(DOCX_DOCUMENT_TAIL.encode("utf-8"))
+        zf.writestr("word/styles.xml", DOCX_STYLES_XML)
         zf.writestr("word/_rels/document.xml.rels", document_rels_xml)
-        zf.writestr(f"word/media/image1.{img_ext}", img_bytes)
-    return output.getvalue()
+        media_name = f"word/media/image1.{img_ext}"
+        zf.writestr(media_name, img_bytes, compress_type=_zip_compress_type(media_name))
+    if stats is not None:
+        stats.uncompressed_bytes = sum(info.file_size for info in zf.infolist())
+        stats.compressed_bytes = written + sink.pending
+        stats.elapsed_seconds = time.perf_counter() - started
+    yield sink.drain()
+
+
+def write_docx(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    sink: BinaryIO,
+    compression: str | None = None,
+) -> DocxWriteStats:
+    """Stream the DOCX package into ``sink`` and report what it cost."""
+    stats = DocxWriteStats.for_compression(compression)
+    for chunk in iter_docx_chunks(combined_lines, image_input, compression, stats):
+        sink.write(chunk)
+    return stats
+
+
+def build_docx_bytes(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    compression: str | None = None,
+    stats: DocxWriteStats | None = None,
+) -> bytes:
+    return b"".join(iter_docx_chunks(combined_lines, image_input, compression, stats))
 
 
 def _jpeg_bytes_from_image(image: Image.Image, quality: int = 95) -> bytes:
@@ -1397,18 +2053,226 @@ def _jpeg_bytes_from_image(image: Image.Image, quality: int = 95) -> bytes:
     return out.getvalue()
 
 
-def _jpeg_bytes_and_size_from_input(image_input: Path | bytes) -> tuple[bytes, tuple[int, int]]:
-    raw_bytes: bytes | None = None
-    if isinstance(image_input, Path):
-        raw_bytes = image_input.read_bytes()
-    else:
-        raw_bytes = image_input
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG colour types embedded as is; alpha needs a soft mask.
+PNG_PASSTHROUGH_DEPTHS = {0: (1, 2, 4, 8), 2: (8,), 3: (1, 2, 4, 8)}
+PDF_IMAGE_CACHE_SIZE = 16
+# Prefix of a serialized PdfImage; no image format Pillow reads starts so.
+PDF_IMAGE_MAGIC = b"\x89PDFIMAGE\r\n"
 
-    with Image.open(io.BytesIO(raw_bytes)) as src:
-        size = src.size
-        if src.format == "JPEG" and src.mode == "RGB":
-            return raw_bytes, size
-        return _jpeg_bytes_from_image(src, quality=100), size
+
+@dataclass(frozen=True)
+class PdfImage:
+    """Stream data and dictionary entries of one image XObject."""
+
+    width: int
+    height: int
+    bits_per_component: int
+    data: bytes
+    dct: bool = False
+    colors: int = 3
+    palette: bytes | None = None
+    smask: "PdfImage | None" = None
+
+    @property
+    def color_space(self) -> str:
+        if self.palette is not None:
+            return f"[/Indexed /DeviceRGB {len(self.palette) // 3 - 1} <{self.palette.hex()}>]"
+        return "/DeviceGray" if self.colors == 1 else "/DeviceRGB"
+
+    @property
+    def procset(self) -> str:
+        if self.palette is not None:
+            return "/ImageI"
+        return "/ImageB" if self.colors == 1 else "/ImageC"
+
+    def header(self, smask_obj_num: int | None = None) -> str:
+        parts = [
+            f"<< /Type /XObject /Subtype /Image /Width {self.width} /Height {self.height}",
+            f"/ColorSpace {self.color_space} /BitsPerComponent {self.bits_per_component}",
+        ]
+        if self.dct:
+            parts.append("/Filter /DCTDecode")
+        else:
+            colors = 1 if self.palette is not None else self.colors
+            parts.append(
+                f"/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {colors} "
+                f"/BitsPerComponent {self.bits_per_component} /Columns {self.width} >>"
+            )
+        if smask_obj_num is not None:
+            parts.append(f"/SMask {smask_obj_num} 0 R")
+        parts.append(f"/Length {len(self.data)} >>")
+        return " ".join(parts)
+
+    def to_file(self) -> bytes:
+        """The image as a standalone JPEG or PNG file (without its soft mask)."""
+        if self.dct:
+            return self.data
+        color_type = 3 if self.palette is not None else (0 if self.colors == 1 else 2)
+        ihdr = self.width.to_bytes(4, "big") + self.height.to_bytes(4, "big")
+        ihdr += bytes((self.bits_per_component, color_type, 0, 0, 0))
+        chunks = [(b"IHDR", ihdr)]
+        if self.palette is not None:
+            chunks.append((b"PLTE", self.palette))
+        chunks += [(b"IDAT", self.data), (b"IEND", b"")]
+        out = [PNG_SIGNATURE]
+        for chunk_type, body in chunks:
+            out.append(len(body).to_bytes(4, "big") + chunk_type + body)
+            out.append(zlib.crc32(chunk_type + body).to_bytes(4, "big"))
+        return b"".join(out)
+
+    def to_bytes(self) -> bytes:
+        """The image and its soft mask as one blob for from_bytes."""
+        header = {
+            "width": self.width,
+            "height": self.height,
+            "bits_per_component": self.bits_per_component,
+            "dct": self.dct,
+            "colors": self.colors,
+            "palette": self.palette.hex() if self.palette is not None else None,
+            "data_length": len(self.data),
+        }
+        header_bytes = json.dumps(header).encode("ascii")
+        smask = self.smask.to_bytes() if self.smask is not None else b""
+        return PDF_IMAGE_MAGIC + len(header_bytes).to_bytes(4, "big") + header_bytes + self.data + smask
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "PdfImage":
+        pos = len(PDF_IMAGE_MAGIC)
+        header_length = int.from_bytes(raw[pos : pos + 4], "big")
+        pos += 4
+        header = json.loads(raw[pos : pos + header_length])
+        pos += header_length
+        data_end = pos + header["data_length"]
+        rest = raw[data_end:]
+        return cls(
+            width=header["width"],
+            height=header["height"],
+            bits_per_component=header["bits_per_component"],
+            data=raw[pos:data_end],
+            dct=header["dct"],
+            colors=header["colors"],
+            palette=bytes.fromhex(header["palette"]) if header["palette"] is not None else None,
+            smask=cls.from_bytes(rest) if rest else None,
+        )
+
+
+def _png_chunks(raw: bytes) -> Iterator[tuple[bytes, bytes]]:
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(raw):
+        length = int.from_bytes(raw[pos : pos + 4], "big")
+        chunk_type = raw[pos + 4 : pos + 8]
+        yield chunk_type, raw[pos + 8 : pos + 8 + length]
+        if chunk_type == b"IEND":
+            return
+        pos += 12 + length
+
+
+def _pdf_image_from_png(raw: bytes) -> PdfImage | None:
+    # None when the PNG needs Pillow: alpha, 16-bit, interlaced or malformed.
+    if not raw.startswith(PNG_SIGNATURE):
+        return None
+    header = palette = None
+    idat: list[bytes] = []
+    for chunk_type, body in _png_chunks(raw):
+        if chunk_type == b"IHDR" and len(body) == 13:
+            header = body
+        elif chunk_type == b"PLTE":
+            palette = body
+        elif chunk_type == b"tRNS":
+            return None
+        elif chunk_type == b"IDAT":
+            idat.append(body)
+    if header is None or not idat:
+        return None
+    width = int.from_bytes(header[0:4], "big")
+    height = int.from_bytes(header[4:8], "big")
+    bit_depth, color_type, _compression, _filter, interlace = header[8:13]
+    if interlace or bit_depth not in PNG_PASSTHROUGH_DEPTHS.get(color_type, ()):
+        return None
+    if color_type == 3 and not palette:
+        return None
+    return PdfImage(
+        width=width,
+        height=height,
+        bits_per_component=bit_depth,
+        data=b"".join(idat),
+        colors=1 if color_type == 0 else 3,
+        palette=palette if color_type == 3 else None,
+    )
+
+
+def _pdf_image_passthrough(raw: bytes) -> PdfImage | None:
+    """Embed RGB/grey JPEGs, plain PNGs and serialized PdfImages as they are, or return None."""
+    if raw.startswith(PDF_IMAGE_MAGIC):
+        return PdfImage.from_bytes(raw)
+    png = _pdf_image_from_png(raw)
+    if png is not None:
+        return png
+    with Image.open(io.BytesIO(raw)) as src:
+        if src.format == "JPEG" and src.mode in ("RGB", "L"):
+            width, height = src.size
+            return PdfImage(width, height, 8, raw, dct=True, colors=3 if src.mode == "RGB" else 1)
+    return None
+
+
+def _png_bytes(image: Image.Image) -> bytes:
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def _pdf_image_transcode(raw: bytes) -> PdfImage:
+    with Image.open(io.BytesIO(raw)) as src:
+        if src.format == "JPEG":
+            # CMYK and friends: another JPEG keeps it close to the upload's size.
+            width, height = src.size
+            return PdfImage(width, height, 8, _jpeg_bytes_from_image(src, quality=100), dct=True)
+        image = src
+        if "transparency" in image.info:
+            # Colour-keyed or palette transparency becomes a real alpha channel.
+            image = image.convert("RGBA")
+        alpha = None
+        if image.mode in ("RGBA", "LA", "PA", "La", "RGBa"):
+            alpha = image.getchannel("A")
+            if alpha.getextrema() == (255, 255):
+                # Fully opaque, as most screenshot tools save them: no mask.
+                alpha = None
+            image = image.convert("L" if image.mode in ("LA", "La") else "RGB")
+        elif image.mode not in ("1", "L", "P", "RGB"):
+            image = image.convert("RGB")
+        color = _pdf_image_from_png(_png_bytes(image))
+        smask = _pdf_image_from_png(_png_bytes(alpha)) if alpha is not None else None
+    return replace(color, smask=smask)
+
+
+_pdf_image_cache: dict[str, PdfImage] = {}
+_pdf_image_cache_lock = threading.Lock()
+
+
+def pdf_image_from_bytes(raw: bytes) -> PdfImage:
+    """The screenshot as an image XObject, decoding pixels only when needed."""
+    image = _pdf_image_passthrough(raw)
+    if image is not None:
+        return image
+    digest = content_hash(raw)
+    with _pdf_image_cache_lock:
+        image = _pdf_image_cache.get(digest)
+    if image is None:
+        image = _pdf_image_transcode(raw)
+        with _pdf_image_cache_lock:
+            if len(_pdf_image_cache) >= PDF_IMAGE_CACHE_SIZE:
+                _pdf_image_cache.pop(next(iter(_pdf_image_cache)))
+            _pdf_image_cache[digest] = image
+    return image
+
+
+def _native_pdf_image_bytes(image_bytes: bytes) -> bytes:
+    # Soft-masked images cannot be one PNG, so they go out as a PdfImage blob.
+    if _pdf_image_passthrough(image_bytes) is not None:
+        return image_bytes
+    image = pdf_image_from_bytes(image_bytes)
+    return image.to_bytes() if image.smask is not None else image.to_file()
 
 
 def _stream_object(stream: bytes, header: str) -> bytes:
@@ -1425,99 +2289,472 @@ def _pdf_text_literal(text: str) -> str:
     return _escape_pdf_text(safe)
 
 
-def _serialize_pdf(objects: list[bytes], root_obj_num: int) -> bytes:
-    out = bytearray()
-    out.extend(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+def _flate_stream_object(data: bytes, entries: str = "") -> bytes:
+    compressed = zlib.compress(data, PDF_FLATE_LEVEL)
+    prefix = f"{entries} " if entries else ""
+    return _stream_object(compressed, f"<< {prefix}/Filter /FlateDecode /Length {len(compressed)} >>")
+
+
+class PdfObjectSerializer:
+    """Emit PDF objects one by one, recording xref offsets as bytes go out."""
+
+    def __init__(self, object_streams: bool = False, objects_per_stream: int = 100) -> None:
+        self.position = 0
+        self.object_streams = object_streams
+        self.objects_per_stream = max(1, objects_per_stream)
+        self._offsets: dict[int, int] = {}
+        self._compressed: dict[int, tuple[int, int]] = {}
+        self._pending: list[tuple[int, bytes]] = []
+        self._object_count = 0
+
+    def reserve(self) -> int:
+        self._object_count += 1
+        return self._object_count
+
+    def _advance(self, chunk: bytes) -> bytes:
+        self.position += len(chunk)
+        return chunk
+
+    def header(self) -> bytes:
+        version = "1.5" if self.object_streams else "1.4"
+        return self._advance(f"%PDF-{version}\n".encode("ascii") + b"%\xe2\xe3\xcf\xd3\n")
+
+    def emit(self, obj_num: int, data: bytes) -> bytes:
+        self._offsets[obj_num] = self.position
+        return self._advance(f"{obj_num} 0 obj\n".encode("ascii") + data + b"\nendobj\n")
+
+    def emit_compact(self, obj_num: int, data: bytes) -> bytes:
+        # Only non-stream objects may live inside an object stream.
+        if not self.object_streams:
+            return self.emit(obj_num, data)
+        self._pending.append((obj_num, data))
+        if len(self._pending) >= self.objects_per_stream:
+            return self._flush_object_stream()
+        return b""
+
+    def _flush_object_stream(self) -> bytes:
+        if not self._pending:
+            return b""
+        stream_obj_num = self.reserve()
+        index_parts: list[str] = []
+        body = bytearray()
+        for idx, (obj_num, data) in enumerate(self._pending):
+            index_parts.append(f"{obj_num} {len(body)}")
+            body.extend(data)
+            body.extend(b"\n")
+            self._compressed[obj_num] = (stream_obj_num, idx)
+        index = (" ".join(index_parts) + "\n").encode("ascii")
+        entries = f"/Type /ObjStm /N {len(self._pending)} /First {len(index)}"
+        self._pending = []
+        return self.emit(stream_obj_num, _flate_stream_object(index + bytes(body), entries))
+
+    def _check_complete(self) -> None:
+        count = self._object_count
+        missing = [
+            num for num in range(1, count + 1) if num not in self._offsets and num not in self._compressed
+        ]
+        if missing:
+            raise ValueError(f"PDF objects reserved but never written: {missing}")
+
+    def trailer(self, root_obj_num: int) -> bytes:
+        if self.object_streams:
+            return self._xref_stream_trailer(root_obj_num)
+
+        self._check_complete()
+        count = self._object_count
+        xref_pos = self.position
+        rows = [f"xref\n0 {count + 1}\n", "0000000000 65535 f \n"]
+        rows.extend(f"{self._offsets[num]:010d} 00000 n \n" for num in range(1, count + 1))
+        rows.append(
+            f"trailer\n<< /Size {count + 1} /Root {root_obj_num} 0 R >>\n"
+            f"startxref\n{xref_pos}\n%%EOF\n"
+        )
+        return self._advance("".join(rows).encode("ascii"))
+
+    def _xref_stream_trailer(self, root_obj_num: int) -> bytes:
+        flushed = self._flush_object_stream()
+        xref_obj_num = self.reserve()
+        xref_pos = self.position
+        self._offsets[xref_obj_num] = xref_pos
+        self._check_complete()
+
+        count = self._object_count
+        offset_width = max(1, (xref_pos.bit_length() + 7) // 8)
+        largest_index = max((idx for _, idx in self._compressed.values()), default=0)
+        index_width = max(2, (largest_index.bit_length() + 7) // 8)
+        rows = bytearray(b"\x00" + (0).to_bytes(offset_width, "big") + (65535).to_bytes(index_width, "big"))
+        for num in range(1, count + 1):
+            if num in self._offsets:
+                rows.append(1)
+                rows.extend(self._offsets[num].to_bytes(offset_width, "big"))
+                rows.extend((0).to_bytes(index_width, "big"))
+            else:
+                stream_obj_num, idx = self._compressed[num]
+                rows.append(2)
+                rows.extend(stream_obj_num.to_bytes(offset_width, "big"))
+                rows.extend(idx.to_bytes(index_width, "big"))
+
+        entries = (
+            f"/Type /XRef /Size {count + 1} /Root {root_obj_num} 0 R "
+            f"/W [1 {offset_width} {index_width}]"
+        )
+        xref_obj = self.emit(xref_obj_num, _flate_stream_object(bytes(rows), entries))
+        return flushed + xref_obj + self._advance(f"startxref\n{xref_pos}\n%%EOF\n".encode("ascii"))
 
-    offsets = [0]
-    for idx, obj in enumerate(objects, start=1):
-        offsets.append(len(out))
-        out.extend(f"{idx} 0 obj\n".encode("ascii"))
-        out.extend(obj)
-        out.extend(b"\nendobj\n")
 
-    xref_pos = len(out)
-    out.extend(f"xref\n0 {len(objects) + 1}\n".encode("ascii"))
-    out.extend(b"0000000000 65535 f \n")
-    for off in offsets[1:]:
-        out.extend(f"{off:010d} 00000 n \n".encode("ascii"))
+class ConversionProgress:
+    """Stage and page counters that a running conversion updates in place."""
 
-    trailer = (
-        f"trailer\n<< /Size {len(objects) + 1} /Root {root_obj_num} 0 R >>\n"
-        f"startxref\n{xref_pos}\n%%EOF\n"
-    )
-    out.extend(trailer.encode("ascii"))
-    return bytes(out)
+    STAGES = ("preprocess", "paginate", "render", "serialize")
 
+    def __init__(self) -> None:
+        self.stage = "queued"
+        self.pages_done = 0
+        self.pages_total: int | None = None
 
-def _build_pdf_with_native_image_page(
-    combined_lines: list[str],
-    image_input: Path | bytes,
-) -> bytes:
-    objects: list[bytes] = []
+    def start(self, stage: str, pages_total: int | None = None) -> None:
+        # Page counters carry over unless the new stage counts pages itself.
+        if pages_total is not None:
+            self.pages_total = pages_total
+            self.pages_done = 0
+        self.stage = stage
 
-    def add_obj(data: bytes) -> int:
-        objects.append(data)
-        return len(objects)
+    def page_done(self, count: int = 1) -> None:
+        self.pages_done += count
 
-    font_body_obj_num = add_obj(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
-    font_title_obj_num = add_obj(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
-    pages_obj_num = add_obj(b"<< /Type /Pages /Count 0 /Kids [] >>")
-    catalog_obj_num = add_obj(b"<< /Type /Catalog /Pages 3 0 R >>")
+    def snapshot(self) -> dict[str, object]:
+        return {"stage": self.stage, "pages_done": self.pages_done, "pages_total": self.pages_total}
 
-    kids: list[int] = []
 
-    text_pages, page_w, page_h, margin_x, margin_top, line_h = _paginate_wrapped_lines(combined_lines)
+RENDER_PAGES_PER_TASK = 16
+RENDER_POOL_MIN_PAGES = 32
+
+_render_pool: ProcessPoolExecutor | None = None
+_render_pool_workers = 1
+_render_pool_lock = threading.Lock()
+
+
+def configure_render_pool(workers: int | None) -> int:
+    """Set the number of render processes; ``None`` means one per CPU."""
+    global _render_pool_workers
+    shutdown_render_pool()
+    _render_pool_workers = max(1, workers if workers is not None else (os.cpu_count() or 1))
+    return _render_pool_workers
+
+
+def render_pool_workers() -> int:
+    return _render_pool_workers
+
+
+def get_render_pool() -> ProcessPoolExecutor | None:
+    global _render_pool
+    if _render_pool_workers <= 1:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn: the web app forks from a threaded server.
+            _render_pool = ProcessPoolExecutor(
+                max_workers=_render_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    with _render_pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def run_render_job(fn: Callable[..., object], *args, **kwargs):
+    """Run one conversion step on the render pool, or inline without one."""
+    pool = get_render_pool()
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.submit(fn, *args, **kwargs).result()
+
+
+PIPELINE_STAGE_WORKERS = 8
+
+_stage_pool: ThreadPoolExecutor | None = None
+_stage_pool_lock = threading.Lock()
+
+
+def get_stage_pool() -> ThreadPoolExecutor:
+    global _stage_pool
+    with _stage_pool_lock:
+        if _stage_pool is None:
+            _stage_pool = ThreadPoolExecutor(
+                max_workers=PIPELINE_STAGE_WORKERS, thread_name_prefix="conversion-stage"
+            )
+        return _stage_pool
+
+
+def _output_size(result: object) -> tuple[int, str] | None:
+    if isinstance(result, (bytes, bytearray)):
+        return len(result), "B"
+    if isinstance(result, str):
+        return len(result), "chars"
+    if isinstance(result, list):
+        return len(result), "lines"
+    if isinstance(result, PageLayout):
+        return len(result.pages), "pages"
+    if isinstance(result, tuple) and result:
+        return _output_size(result[0])
+    return None
+
+
+class Span:
+    """Wall time, CPU time and output size of one named stage."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.size: int | None = None
+        self.unit = ""
+
+    @contextmanager
+    def measure(self) -> Iterator["Span"]:
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield self
+        finally:
+            self.wall_seconds += time.perf_counter() - wall
+            self.cpu_seconds += time.thread_time() - cpu
+
+    def add_size(self, size: int, unit: str = "B") -> None:
+        self.size = (self.size or 0) + size
+        self.unit = unit
+
+    def set_output(self, result: object) -> None:
+        measured = _output_size(result)
+        if measured is not None:
+            self.size, self.unit = measured
+
+    def to_json(self) -> dict[str, object]:
+        return {
+            "name": self.name,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "size": self.size,
+            "unit": self.unit or None,
+        }
+
+
+class Timings:
+    """The spans of one conversion, in the order they were started."""
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def start(self, name: str) -> Span:
+        span = Span(name)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        span = self.start(name)
+        with span.measure():
+            yield span
+
+    def iter_span(self, name: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass ``chunks`` through, timing only the work of producing them."""
+        span = self.start(name)
+        iterator = iter(chunks)
+        while True:
+            with span.measure():
+                chunk = next(iterator, None)
+            if chunk is None:
+                return
+            span.add_size(len(chunk))
+            yield chunk
+
+    def to_json(self) -> list[dict[str, object]]:
+        return [span.to_json() for span in self.spans]
+
+    def server_timing(self) -> str:
+        """The spans as a Server-Timing header value (durations in ms)."""
+        metrics = []
+        for span in self.spans:
+            desc = f"cpu {span.cpu_seconds * 1000:.1f}ms"
+            if span.size is not None:
+                desc += f", {span.size} {span.unit}"
+            metrics.append(f'{span.name};dur={span.wall_seconds * 1000:.1f};desc="{desc}"')
+        return ", ".join(metrics)
+
+    def table(self) -> str:
+        rows = [f"{'stage':<16} {'wall':>10} {'cpu':>10}  output"]
+        for span in self.spans:
+            size = f"{span.size} {span.unit}" if span.size is not None else "-"
+            rows.append(f"{span.name:<16} {span.wall_seconds:>9.3f}s {span.cpu_seconds:>9.3f}s  {size}")
+        return "\n".join(rows)
+
+    def report_section(self) -> str:
+        """The spans as a section to append to a validation report."""
+        lines = ["", "เวลาที่ใช้แต่ละขั้น (wall / CPU / ขนาดผลลัพธ์):"]
+        for span in self.spans:
+            size = f"{span.size} {span.unit}" if span.size is not None else "-"
+            lines.append(f"- {span.name}: {span.wall_seconds:.3f}s / {span.cpu_seconds:.3f}s / {size}")
+        return "\n".join(lines) + "\n"
+
+
+class StageGraph:
+    """A small DAG of conversion stages run concurrently on a thread pool."""
+
+    def __init__(self, timings: Timings | None = None) -> None:
+        self._stages: dict[str, tuple[Callable[..., object], tuple[str, ...]]] = {}
+        self.timings = timings or Timings()
+        self.wall_seconds = 0.0
+
+    @property
+    def stage_seconds(self) -> dict[str, float]:
+        seconds = {span.name: span.wall_seconds for span in self.timings.spans if span.name in self._stages}
+        return {name: seconds[name] for name in self._stages if name in seconds}
+
+    def add(self, name: str, fn: Callable[..., object], deps: Iterable[str] = ()) -> None:
+        deps = tuple(deps)
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            # Dependencies must be added first, which also rules out cycles.
+            raise ValueError(f"Stage {name} depends on unknown stage(s): {', '.join(missing)}")
+        self._stages[name] = (fn, deps)
+
+    def _timed(self, name: str, fn: Callable[..., object], args: list[object]) -> object:
+        with self.timings.span(name) as span:
+            result = fn(*args)
+            span.set_output(result)
+        return result
+
+    def run(self, executor: Executor | None = None) -> dict[str, object]:
+        """Run every stage and return their results by name."""
+        executor = executor or get_stage_pool()
+        started = time.perf_counter()
+        results: dict[str, object] = {}
+        waiting = dict(self._stages)
+        running: dict[Future, str] = {}
+        try:
+            while waiting or running:
+                for name, (fn, deps) in list(waiting.items()):
+                    if all(dep in results for dep in deps):
+                        del waiting[name]
+                        args = [results[dep] for dep in deps]
+                        running[executor.submit(self._timed, name, fn, args)] = name
+                done, _pending = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except BaseException:
+            for future in running:
+                future.cancel()
+            wait(running)
+            raise
+        finally:
+            self.wall_seconds = time.perf_counter() - started
+        return results
+
+
+def _native_text_page_content(
+    page_lines: list[tuple[str, bool]],
+    page_w: int,
+    page_h: int,
+    margin_x: int,
+    margin_top: int,
+    line_h: int,
+) -> bytes:
     body_font_size = PDF_BODY_FONT_SIZE
-    for page_lines in text_pages:
-        y_start = page_h - margin_top - body_font_size
-        content_ops: list[str] = []
-        for idx, (text_line, is_command) in enumerate(page_lines):
+    y_start = page_h - margin_top - body_font_size
+    visible_lines = page_lines[: max(0, (y_start // line_h) + 1)]
+
+    # Highlights as one path, then the text as one BT/ET block stepping with T*.
+    highlight_ops: list[str] = []
+    for idx, (text_line, is_command) in enumerate(visible_lines):
+        if is_command and text_line.strip():
             y = y_start - (idx * line_h)
-            if y < 0:
-                break
-            if is_command and text_line.strip():
-                rect_x = margin_x - 2
-                rect_y = y - 2
-                rect_h = max(10, line_h - 2)
-                est_w = int((len(text_line) * body_font_size * 0.60) + 6)
-                max_w = page_w - margin_x - rect_x
-                rect_w = max(10, min(max_w, est_w))
-                content_ops.append("1.0 0.9569 0.5098 rg")
-                content_ops.append(f"{rect_x} {rect_y} {rect_w} {rect_h} re f")
-
-            content_ops.append("0 0 0 rg")
-            content_ops.append(
-                f"BT /F1 {body_font_size} Tf {margin_x} {y} Td ({_pdf_text_literal(text_line)}) Tj ET"
-            )
+            rect_x = margin_x - 2
+            rect_y = y - 2
+            rect_h = max(10, line_h - 2)
+            est_w = int((len(text_line) * body_font_size * 0.60) + 6)
+            max_w = page_w - margin_x - rect_x
+            rect_w = max(10, min(max_w, est_w))
+            highlight_ops.append(f"{rect_x} {rect_y} {rect_w} {rect_h} re")
+
+    content_ops: list[str] = []
+    if highlight_ops:
+        content_ops.append("1.0 0.9569 0.5098 rg")
+        content_ops.extend(highlight_ops)
+        content_ops.append("f")
+
+    content_ops.append("0 0 0 rg")
+    content_ops.append(f"BT /F1 {body_font_size} Tf {line_h} TL {margin_x} {y_start} Td")
+    for idx, (text_line, _is_command) in enumerate(visible_lines):
+        move = "T* " if idx else ""
+        if text_line:
+            content_ops.append(f"{move}({_pdf_text_literal(text_line)}) Tj")
+        elif move:
+            content_ops.append("T*")
+    content_ops.append("ET")
+
+    return ("\n".join(content_ops) + "\n").encode("latin-1", "replace")
+
+
+def _flate_text_page_streams(
+    pages: list[list[tuple[str, bool]]],
+    page_w: int,
+    page_h: int,
+    margin_x: int,
+    margin_top: int,
+    line_h: int,
+) -> list[bytes]:
+    return [
+        _flate_stream_object(_native_text_page_content(page_lines, page_w, page_h, margin_x, margin_top, line_h))
+        for page_lines in pages
+    ]
 
-        content = ("\n".join(content_ops) + "\n").encode("latin-1", "replace")
-        content_header = f"<< /Length {len(content)} >>"
-        content_obj_num = add_obj(_stream_object(content, content_header))
 
-        page_obj = (
-            f"<< /Type /Page /Parent {pages_obj_num} 0 R "
-            f"/MediaBox [0 0 {page_w} {page_h}] "
-            f"/Resources << /ProcSet [/PDF /Text] "
-            f"/Font << /F1 {font_body_obj_num} 0 R /F2 {font_title_obj_num} 0 R >> >> "
-            f"/Contents {content_obj_num} 0 R >>"
-        ).encode("ascii")
-        kids.append(add_obj(page_obj))
+def _iter_text_page_streams(
+    text_pages: list[list[tuple[str, bool]]],
+    page_w: int,
+    page_h: int,
+    margin_x: int,
+    margin_top: int,
+    line_h: int,
+) -> Iterator[bytes]:
+    geometry = (page_w, page_h, margin_x, margin_top, line_h)
+    pool = get_render_pool()
+    if pool is None or len(text_pages) < RENDER_POOL_MIN_PAGES:
+        for page_lines in text_pages:
+            yield from _flate_text_page_streams([page_lines], *geometry)
+        return
+
+    # Bounded batches in flight, handed back in page order.
+    window = render_pool_workers() * 2
+    pending: deque[Future] = deque()
+    try:
+        for start in range(0, len(text_pages), RENDER_PAGES_PER_TASK):
+            batch = text_pages[start : start + RENDER_PAGES_PER_TASK]
+            pending.append(pool.submit(_flate_text_page_streams, batch, *geometry))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
 
-    image_jpeg, (img_w, img_h) = _jpeg_bytes_and_size_from_input(image_input)
-    page_w, page_h = (A4_PAGE_W, A4_PAGE_H)
 
+def _native_image_page_content(img_w: int, img_h: int, page_w: int, page_h: int) -> bytes:
     # A4 portrait layout like text pages: title near top-left, image right below.
     top_margin = 60
     side_margin = 24
     bottom_margin = 24
     title_gap = 18
-    image_header = (
-        f"<< /Type /XObject /Subtype /Image /Width {img_w} /Height {img_h} "
-        f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode "
-        f"/Length {len(image_jpeg)} >>"
-    )
-    image_obj_num = add_obj(_stream_object(image_jpeg, image_header))
 
     title_text = "Show log"
     font_size = PDF_BODY_FONT_SIZE
@@ -1553,45 +2790,127 @@ def _build_pdf_with_native_image_page(
         "Q",
         "",
     ]
-    image_content = "\n".join(content_lines).encode("latin-1", "replace")
-    image_content_header = f"<< /Length {len(image_content)} >>"
-    image_content_obj_num = add_obj(_stream_object(image_content, image_content_header))
+    return "\n".join(content_lines).encode("latin-1", "replace")
+
+
+def iter_native_pdf_chunks(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    object_streams: bool = False,
+    progress: ConversionProgress | None = None,
+    layout: PageLayout | None = None,
+) -> Iterator[bytes]:
+    # Decoded up front so bad input fails before the first chunk.
+    if layout is None:
+        if progress is not None:
+            progress.start("paginate")
+        layout = PageLayout.build(combined_lines)
+    image = pdf_image_from_bytes(image_input.read_bytes() if isinstance(image_input, Path) else image_input)
+    return _iter_native_pdf_chunks(layout, image, object_streams=object_streams, progress=progress)
+
+
+def _iter_native_pdf_chunks(
+    layout: PageLayout,
+    image: PdfImage,
+    object_streams: bool = False,
+    progress: ConversionProgress | None = None,
+) -> Iterator[bytes]:
+    text_pages, page_w, page_h, margin_x, margin_top, line_h = layout.as_tuple()
+    if progress is not None:
+        progress.start("render", pages_total=len(text_pages) + 1)
+    pdf = PdfObjectSerializer(object_streams=object_streams)
+    yield pdf.header()
+
+    font_body_obj_num = pdf.reserve()
+    font_title_obj_num = pdf.reserve()
+    pages_obj_num = pdf.reserve()
+    catalog_obj_num = pdf.reserve()
+    yield pdf.emit_compact(font_body_obj_num, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+    yield pdf.emit_compact(font_title_obj_num, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+    yield pdf.emit_compact(catalog_obj_num, f"<< /Type /Catalog /Pages {pages_obj_num} 0 R >>".encode("ascii"))
+
+    kids: list[int] = []
+    for content_stream in _iter_text_page_streams(text_pages, page_w, page_h, margin_x, margin_top, line_h):
+        content_obj_num = pdf.reserve()
+        yield pdf.emit(content_obj_num, content_stream)
+
+        page_obj = (
+            f"<< /Type /Page /Parent {pages_obj_num} 0 R "
+            f"/MediaBox [0 0 {page_w} {page_h}] "
+            f"/Resources << /ProcSet [/PDF /Text] "
+            f"/Font << /F1 {font_body_obj_num} 0 R /F2 {font_title_obj_num} 0 R >> >> "
+            f"/Contents {content_obj_num} 0 R >>"
+        ).encode("ascii")
+        page_obj_num = pdf.reserve()
+        yield pdf.emit_compact(page_obj_num, page_obj)
+        kids.append(page_obj_num)
+        if progress is not None:
+            progress.page_done()
+
+    img_w, img_h = image.width, image.height
+    page_w, page_h = (A4_PAGE_W, A4_PAGE_H)
+    smask_obj_num = None
+    if image.smask is not None:
+        smask_obj_num = pdf.reserve()
+        yield pdf.emit(smask_obj_num, _stream_object(image.smask.data, image.smask.header()))
+    image_obj_num = pdf.reserve()
+    yield pdf.emit(image_obj_num, _stream_object(image.data, image.header(smask_obj_num)))
+
+    image_content = _native_image_page_content(img_w, img_h, page_w, page_h)
+    image_content_obj_num = pdf.reserve()
+    yield pdf.emit(image_content_obj_num, _flate_stream_object(image_content))
 
     image_page_obj = (
         f"<< /Type /Page /Parent {pages_obj_num} 0 R "
         f"/MediaBox [0 0 {page_w} {page_h}] "
-        f"/Resources << /ProcSet [/PDF /Text /ImageC] "
+        f"/Resources << /ProcSet [/PDF /Text {image.procset}] "
         f"/Font << /F1 {font_body_obj_num} 0 R /F2 {font_title_obj_num} 0 R >> "
         f"/XObject << /Im0 {image_obj_num} 0 R >> >> "
         f"/Contents {image_content_obj_num} 0 R >>"
     ).encode("ascii")
-    image_page_obj_num = add_obj(image_page_obj)
+    image_page_obj_num = pdf.reserve()
+    yield pdf.emit_compact(image_page_obj_num, image_page_obj)
     kids.append(image_page_obj_num)
+    if progress is not None:
+        progress.page_done()
+        progress.start("serialize")
 
     kids_refs = " ".join(f"{num} 0 R" for num in kids)
-    objects[pages_obj_num - 1] = (
-        f"<< /Type /Pages /Count {len(kids)} /Kids [{kids_refs}] >>".encode("ascii")
+    yield pdf.emit_compact(
+        pages_obj_num,
+        f"<< /Type /Pages /Count {len(kids)} /Kids [{kids_refs}] >>".encode("ascii"),
     )
-    objects[catalog_obj_num - 1] = (
-        f"<< /Type /Catalog /Pages {pages_obj_num} 0 R >>".encode("ascii")
-    )
-
-    return _serialize_pdf(objects, root_obj_num=catalog_obj_num)
+    yield pdf.trailer(root_obj_num=catalog_obj_num)
 
 
-def pages_to_pdf_bytes(
-    pages: Iterable[Image.Image],
-    image_input: Path | bytes | None = None,
-    combined_lines: list[str] | None = None,
+def _build_pdf_with_native_image_page(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    object_streams: bool = False,
 ) -> bytes:
-    page_list = list(pages)
-    if not page_list:
-        raise ValueError("No pages to convert.")
+    return b"".join(iter_native_pdf_chunks(combined_lines, image_input, object_streams=object_streams))
 
-    if image_input is not None and combined_lines is not None:
-        return _build_pdf_with_native_image_page(combined_lines, image_input)
 
-    first_page, other_pages = page_list[0], page_list[1:]
+def _iter_native_pdf15_chunks(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    progress: ConversionProgress | None = None,
+    layout: PageLayout | None = None,
+) -> Iterator[bytes]:
+    return iter_native_pdf_chunks(combined_lines, image_input, object_streams=True, progress=progress, layout=layout)
+
+
+def _build_pdf_native_pdf15(combined_lines: list[str], image_input: Path | bytes) -> bytes:
+    return _build_pdf_with_native_image_page(combined_lines, image_input, object_streams=True)
+
+
+def _pillow_pages_to_pdf_bytes(pages: Iterable[Image.Image]) -> bytes:
+    page_iter = iter(pages)
+    first_page = next(page_iter, None)
+    if first_page is None:
+        raise ValueError("No pages to convert.")
+
+    other_pages = list(page_iter)
     buffer = io.BytesIO()
     first_page.save(
         buffer,
@@ -1605,9 +2924,818 @@ def pages_to_pdf_bytes(
     return buffer.getvalue()
 
 
-def build_pdf_bytes(combined_lines: list[str], image_input: Path | bytes) -> bytes:
-    pages = build_pdf_pages(combined_lines, image_input)
-    return pages_to_pdf_bytes(pages, image_input=image_input, combined_lines=combined_lines)
+def pages_to_pdf_bytes(
+    pages: Iterable[Image.Image],
+    image_input: Path | bytes | None = None,
+    combined_lines: list[str] | None = None,
+) -> bytes:
+    # Older callers pass the source lines, which selects the vector writer.
+    if image_input is not None and combined_lines is not None:
+        return build_pdf_bytes(combined_lines, image_input, backend="native-vector")
+    return _pillow_pages_to_pdf_bytes(pages)
+
+
+@dataclass(frozen=True)
+class PdfBackend:
+    name: str
+    build: Callable[[list[str], Path | bytes], bytes]
+    description: str = ""
+    iter_chunks: Callable[..., Iterator[bytes]] | None = None
+    # True when iter_chunks accepts ``progress`` and a precomputed ``layout``.
+    native_layout: bool = False
+    prepare_image: Callable[[bytes], bytes] | None = None
+
+    def chunks(
+        self,
+        combined_lines: list[str],
+        image_input: Path | bytes,
+        progress: ConversionProgress | None = None,
+        layout: PageLayout | None = None,
+    ) -> Iterator[bytes]:
+        if self.iter_chunks is not None:
+            if self.native_layout:
+                return self.iter_chunks(combined_lines, image_input, progress=progress, layout=layout)
+            return self.iter_chunks(combined_lines, image_input)
+        return self._built_chunks(combined_lines, image_input, progress)
+
+    def _built_chunks(
+        self,
+        combined_lines: list[str],
+        image_input: Path | bytes,
+        progress: ConversionProgress | None,
+    ) -> Iterator[bytes]:
+        # Lazy, so the caller's render span covers the build.
+        if progress is not None:
+            progress.start("render")
+        yield self.build(combined_lines, image_input)
+
+
+@dataclass(frozen=True)
+class PdfBuildResult:
+    backend: str
+    data: bytes
+    elapsed_seconds: float
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.data)
+
+
+@dataclass(frozen=True)
+class PdfWriteResult:
+    backend: str
+    size_bytes: int
+    elapsed_seconds: float
+
+
+DEFAULT_PDF_BACKEND = "native-vector"
+PDF_BACKENDS: dict[str, PdfBackend] = {}
+
+
+def register_pdf_backend(
+    name: str,
+    build: Callable[[list[str], Path | bytes], bytes],
+    description: str = "",
+    iter_chunks: Callable[..., Iterator[bytes]] | None = None,
+    native_layout: bool = False,
+    prepare_image: Callable[[bytes], bytes] | None = None,
+) -> PdfBackend:
+    backend = PdfBackend(
+        name=name,
+        build=build,
+        description=description,
+        iter_chunks=iter_chunks,
+        native_layout=native_layout,
+        prepare_image=prepare_image,
+    )
+    PDF_BACKENDS[name] = backend
+    return backend
+
+
+def _build_pdf_pillow_raster(combined_lines: list[str], image_input: Path | bytes) -> bytes:
+    return _pillow_pages_to_pdf_bytes(iter_pdf_pages(combined_lines, image_input))
+
+
+register_pdf_backend(
+    "native-vector",
+    _build_pdf_with_native_image_page,
+    "Text as PDF operators, screenshot embedded as an image XObject.",
+    iter_chunks=iter_native_pdf_chunks,
+    native_layout=True,
+    prepare_image=_native_pdf_image_bytes,
+)
+register_pdf_backend(
+    "native-vector-pdf15",
+    _build_pdf_native_pdf15,
+    "native-vector with PDF 1.5 object streams and a compressed xref stream.",
+    iter_chunks=_iter_native_pdf15_chunks,
+    native_layout=True,
+    prepare_image=_native_pdf_image_bytes,
+)
+register_pdf_backend(
+    "pillow-raster",
+    _build_pdf_pillow_raster,
+    "Every page drawn with PIL and saved as a raster PDF.",
+)
+
+
+def resolve_pdf_backend(name: str | None) -> PdfBackend:
+    key = (name or DEFAULT_PDF_BACKEND).strip().lower()
+    backend = PDF_BACKENDS.get(key)
+    if backend is None:
+        known = ", ".join(sorted(PDF_BACKENDS))
+        raise ValueError(f"Unknown PDF backend: {name!r} (available: {known})")
+    return backend
+
+
+def prepare_render_image(image_bytes: bytes, output_format: str = "pdf", pdf_backend: str | None = None) -> bytes:
+    """Transcode the screenshot into what the chosen writer embeds unchanged."""
+    if not image_bytes:
+        return image_bytes
+    if output_format == "docx":
+        return _docx_image_part(image_bytes)[2]
+    prepare = resolve_pdf_backend(pdf_backend).prepare_image
+    return prepare(image_bytes) if prepare is not None else image_bytes
+
+
+def build_pdf_with_backend(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    backend: str | None = None,
+) -> PdfBuildResult:
+    selected = resolve_pdf_backend(backend)
+    started = time.perf_counter()
+    data = selected.build(combined_lines, image_input)
+    elapsed = time.perf_counter() - started
+    return PdfBuildResult(backend=selected.name, data=data, elapsed_seconds=elapsed)
+
+
+def iter_pdf_chunks(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    backend: str | None = None,
+    progress: ConversionProgress | None = None,
+    layout: PageLayout | None = None,
+) -> Iterator[bytes]:
+    return resolve_pdf_backend(backend).chunks(combined_lines, image_input, progress=progress, layout=layout)
+
+
+def write_pdf(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    sink: BinaryIO,
+    backend: str | None = None,
+    layout: PageLayout | None = None,
+) -> PdfWriteResult:
+    selected = resolve_pdf_backend(backend)
+    started = time.perf_counter()
+    size = 0
+    for chunk in selected.chunks(combined_lines, image_input, layout=layout):
+        sink.write(chunk)
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    return PdfWriteResult(backend=selected.name, size_bytes=size, elapsed_seconds=elapsed)
+
+
+def build_pdf_bytes(
+    combined_lines: list[str],
+    image_input: Path | bytes,
+    backend: str | None = None,
+) -> bytes:
+    return build_pdf_with_backend(combined_lines, image_input, backend=backend).data
+
+
+CACHE_ARTIFACTS = ("text", "lines", "layout", "image", "output")
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ConversionCache:
+    """Disk-backed, content-addressed store for conversion artifacts."""
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = dict.fromkeys(CACHE_ARTIFACTS, 0)
+        self.misses = dict.fromkeys(CACHE_ARTIFACTS, 0)
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size_bytes = sum(size for _path, size, _mtime in self._entries())
+
+    def __getstate__(self) -> dict[str, object]:
+        # Render pool workers get a copy; their counters stay in the worker.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, object]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return content_hash("\0".join(parts).encode("utf-8"))
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.root / kind / key[:2] / key
+
+    def get(self, kind: str, key: str) -> bytes | None:
+        path = self._path(kind, key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses[kind] += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another writer after the read; the data is still good.
+            pass
+        with self._lock:
+            self.hits[kind] += 1
+        return data
+
+    def put(self, kind: str, key: str, data: bytes) -> None:
+        path = self._path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.part")
+        partial_path.write_bytes(data)
+        with self._lock:
+            try:
+                replaced_bytes = path.stat().st_size
+            except FileNotFoundError:
+                replaced_bytes = 0
+            partial_path.replace(path)
+            self._size_bytes += len(data) - replaced_bytes
+            over_budget = self._size_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def get_or_build(self, kind: str, key: str, build: Callable[[], bytes]) -> bytes:
+        data = self.get(kind, key)
+        if data is None:
+            data = build()
+            self.put(kind, key, data)
+        return data
+
+    def _entries(self) -> list[tuple[Path, int, float]]:
+        entries = []
+        for kind in CACHE_ARTIFACTS:
+            for path in (self.root / kind).glob("*/*"):
+                if path.suffix == ".part":
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self) -> None:
+        # Re-scanned: other processes may share the directory.
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _path, size, _mtime in entries)
+            for path, size, _mtime in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                self.evictions += 1
+            self._size_bytes = total
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "evictions": self.evictions,
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _clock_options_cache_token(options: FdoClockOptions | None) -> str | None:
+    # Preprocessed lines are only reproducible with a fixed clock seed.
+    opts = options or FdoClockOptions()
+    if opts.seed is None:
+        return None
+    token = json.dumps(asdict(opts), sort_keys=True)
+    if opts.custom_mode:
+        try:
+            datetime.strptime(opts.custom_date or "", "%Y-%m-%d")
+        except ValueError:
+            # The custom clock window falls back to today's date.
+            token += datetime.now().strftime("|%Y-%m-%d")
+    return token
+
+
+def cached_decode_text(cache: ConversionCache | None, raw: bytes) -> str:
+    if cache is None:
+        return decode_text_with_fallback(raw)
+    digest = content_hash(raw)
+    # Tagged so text decoded before encodings were sniffed is not read back.
+    key = cache.key("sniffed-text", digest)
+    return cache.get_or_build(
+        "text", key, lambda: decode_text_with_fallback(raw, digest).encode("utf-8")
+    ).decode("utf-8")
+
+
+def _combined_lines_key(
+    cache: ConversionCache | None,
+    fdo_raw: bytes,
+    apic_raw: bytes,
+    fdo_clock_options: FdoClockOptions | None,
+    show_log_image_present: bool,
+) -> str | None:
+    options_token = _clock_options_cache_token(fdo_clock_options)
+    if cache is None or options_token is None:
+        return None
+    return cache.key(content_hash(fdo_raw), content_hash(apic_raw), options_token, str(show_log_image_present))
+
+
+def _load_combined_lines(cache: ConversionCache, key: str) -> tuple[list[str], FdoValidationResult] | None:
+    data = cache.get("lines", key)
+    if data is None:
+        return None
+    payload = json.loads(data)
+    validation = payload["validation"]
+    return payload["lines"], FdoValidationResult(
+        passed=validation["passed"],
+        report=validation["report"],
+        checks=validation["checks"],
+        changes=validation["changes"],
+    )
+
+
+def _store_combined_lines(
+    cache: ConversionCache,
+    key: str,
+    combined_lines: list[str],
+    validation: FdoValidationResult,
+) -> None:
+    payload = {"lines": combined_lines, "validation": validation.to_json()}
+    cache.put("lines", key, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def _preprocess_stage(
+    fdo_text: str | Iterable[str],
+    fdo_clock_options: FdoClockOptions | None,
+) -> tuple[list[str], FdoPreprocessStats]:
+    # A memory-mapped LogLineSource cannot go to a render worker.
+    if isinstance(fdo_text, str):
+        return run_render_job(_preprocess_fdo_lines_and_stats, fdo_text, fdo_clock_options)
+    return _preprocess_fdo_lines_and_stats(fdo_text, options=fdo_clock_options)
+
+
+def add_combined_lines_stages(
+    graph: StageGraph,
+    cache: ConversionCache | None,
+    fdo_input: bytes | LogLineSource,
+    apic_raw: bytes,
+    fdo_clock_options: FdoClockOptions | None = None,
+    show_log_image_present: bool = False,
+) -> None:
+    """Add the stages that end in ``combine``, whose result is (lines, validation)."""
+    if isinstance(fdo_input, LogLineSource):
+        graph.add("preprocess_fdo", lambda: _preprocess_stage(fdo_input, fdo_clock_options))
+    else:
+        graph.add("decode_fdo", lambda: cached_decode_text(cache, fdo_input))
+        graph.add(
+            "preprocess_fdo",
+            lambda fdo_text: _preprocess_stage(fdo_text, fdo_clock_options),
+            deps=("decode_fdo",),
+        )
+    graph.add("decode_apic", lambda: cached_decode_text(cache, apic_raw))
+    graph.add("split_apic", _apic_block, deps=("decode_apic",))
+
+    def combine(
+        preprocessed: tuple[list[str], FdoPreprocessStats],
+        apic_block: tuple[list[str], CommandIndex],
+    ) -> tuple[list[str], FdoValidationResult]:
+        fdo_lines, stats = preprocessed
+        combined_lines, command_index = _splice_apic_block(fdo_lines, *apic_block)
+        validation = _validate_combined_lines(
+            combined_lines,
+            command_index,
+            stats,
+            show_log_title_present=True,
+            show_log_image_present=show_log_image_present,
+        )
+        return combined_lines, validation
+
+    graph.add("combine", combine, deps=("preprocess_fdo", "split_apic"))
+
+
+def cached_combined_lines(
+    cache: ConversionCache | None,
+    fdo_raw: bytes,
+    apic_raw: bytes,
+    fdo_clock_options: FdoClockOptions | None = None,
+    show_log_image_present: bool = False,
+    timings: Timings | None = None,
+) -> tuple[list[str], FdoValidationResult]:
+    timings = timings or Timings()
+    key = _combined_lines_key(cache, fdo_raw, apic_raw, fdo_clock_options, show_log_image_present)
+    if key is not None:
+        with timings.span("lines_cache") as span:
+            cached = _load_combined_lines(cache, key)
+            span.set_output(cached)
+        if cached is not None:
+            return cached
+    graph = StageGraph(timings)
+    add_combined_lines_stages(graph, cache, fdo_raw, apic_raw, fdo_clock_options, show_log_image_present)
+    combined_lines, validation = graph.run()["combine"]
+    if key is not None:
+        _store_combined_lines(cache, key, combined_lines, validation)
+    return combined_lines, validation
+
+
+@dataclass(frozen=True)
+class PreparedConversion:
+    combined_lines: list[str]
+    validation: FdoValidationResult
+    render_image: bytes
+    stage_seconds: dict[str, float]
+    wall_seconds: float
+
+    def timings_text(self) -> str:
+        stages = " ".join(f"{name}={seconds:.3f}s" for name, seconds in self.stage_seconds.items())
+        return f"{stages} (wall {self.wall_seconds:.3f}s, sum {sum(self.stage_seconds.values()):.3f}s)"
+
+
+def prepare_conversion(
+    cache: ConversionCache | None,
+    fdo_input: bytes | LogLineSource,
+    apic_raw: bytes,
+    image_bytes: bytes,
+    output_format: str = "pdf",
+    pdf_backend: str | None = None,
+    fdo_clock_options: FdoClockOptions | None = None,
+    timings: Timings | None = None,
+) -> PreparedConversion:
+    """Everything a conversion needs before rendering, with stages overlapped."""
+    timings = timings or Timings()
+    key = None
+    cached = None
+    if not isinstance(fdo_input, LogLineSource):
+        key = _combined_lines_key(cache, fdo_input, apic_raw, fdo_clock_options, bool(image_bytes))
+    if key is not None:
+        with timings.span("lines_cache") as span:
+            cached = _load_combined_lines(cache, key)
+            span.set_output(cached)
+
+    graph = StageGraph(timings)
+    if cached is None:
+        add_combined_lines_stages(graph, cache, fdo_input, apic_raw, fdo_clock_options, bool(image_bytes))
+    graph.add("image", lambda: cached_render_image(cache, image_bytes, output_format, pdf_backend))
+    results = graph.run()
+    if cached is None:
+        cached = results["combine"]
+        if key is not None:
+            _store_combined_lines(cache, key, *cached)
+    combined_lines, validation = cached
+    return PreparedConversion(
+        combined_lines=combined_lines,
+        validation=validation,
+        render_image=results["image"],
+        stage_seconds=dict(graph.stage_seconds),
+        wall_seconds=graph.wall_seconds,
+    )
+
+
+def cached_render_image(
+    cache: ConversionCache | None,
+    image_bytes: bytes,
+    output_format: str = "pdf",
+    pdf_backend: str | None = None,
+) -> bytes:
+    """prepare_render_image, kept per image hash and target writer."""
+    if cache is None or not image_bytes:
+        return prepare_render_image(image_bytes, output_format, pdf_backend)
+    target = output_format if output_format == "docx" else resolve_pdf_backend(pdf_backend).name
+    key = cache.key("render-image", content_hash(image_bytes), target)
+    data = cache.get("image", key)
+    if data is None:
+        data = prepare_render_image(image_bytes, output_format, pdf_backend)
+        cache.put("image", key, b"" if data == image_bytes else data)
+    return data or image_bytes
+
+
+def combined_lines_hash(combined_lines: list[str]) -> str:
+    return content_hash("\n".join(combined_lines).encode("utf-8"))
+
+
+def layout_base_key(cache: ConversionCache, *source_parts: bytes) -> str:
+    """Key shared by every conversion of the same source files, whatever the clock seed."""
+    return cache.key("layout-base", *(content_hash(part) for part in source_parts))
+
+
+def cached_layout(
+    cache: ConversionCache | None,
+    combined_lines: list[str],
+    lines_hash: str | None = None,
+    base_key: str | None = None,
+    fdo_clock_options: FdoClockOptions | None = None,
+) -> PageLayout:
+    """Fetch or build the page layout of ``combined_lines``."""
+    if cache is None:
+        return PageLayout.build(combined_lines)
+    seeded = _clock_options_cache_token(fdo_clock_options) is not None
+    key = None
+    if seeded:
+        # Tagged so entries written before layouts carried their units are not read back.
+        key = cache.key("page-layout", lines_hash or combined_lines_hash(combined_lines))
+        data = cache.get("layout", key)
+        if data is not None:
+            return PageLayout.from_json(json.loads(data))
+    elif base_key is not None:
+        key = cache.key("page-layout-latest", base_key)
+
+    base_layout = None
+    if base_key is not None:
+        base_ref = cache.get("layout", base_key)
+        base_data = cache.get("layout", base_ref.decode("ascii")) if base_ref is not None else None
+        if base_data is not None:
+            base_layout = PageLayout.from_json(json.loads(base_data))
+    if base_layout is not None:
+        layout = base_layout.repaginate(combined_lines)
+    else:
+        layout = PageLayout.build(combined_lines)
+    if key is not None:
+        cache.put("layout", key, json.dumps(layout.to_json(), ensure_ascii=False).encode("utf-8"))
+        if base_key is not None:
+            cache.put("layout", base_key, key.encode("ascii"))
+    return layout
+
+
+def output_cache_key(
+    cache: ConversionCache,
+    lines_hash: str,
+    image_bytes: bytes,
+    output_format: str,
+    pdf_backend: str | None = None,
+    docx_compression: str | None = None,
+) -> str:
+    if output_format == "pdf":
+        variant = resolve_pdf_backend(pdf_backend).name
+    else:
+        variant = f"deflate-{resolve_docx_compression(docx_compression)}"
+    return cache.key(lines_hash, content_hash(image_bytes), output_format, variant)
+
+
+def cached_output_bytes(
+    cache: ConversionCache | None,
+    combined_lines: list[str],
+    image_bytes: bytes,
+    output_format: str = "pdf",
+    pdf_backend: str | None = None,
+    layout_base: str | None = None,
+    render_image: bytes | None = None,
+    docx_compression: str | None = None,
+    docx_stats: DocxWriteStats | None = None,
+    fdo_clock_options: FdoClockOptions | None = None,
+) -> bytes:
+    """Build (or fetch) the final document for already combined lines."""
+    lines_hash = combined_lines_hash(combined_lines) if cache is not None else None
+    image_input = image_bytes if render_image is None else render_image
+
+    def build() -> bytes:
+        if output_format == "docx":
+            return build_docx_bytes(combined_lines, image_input, docx_compression, docx_stats)
+        selected = resolve_pdf_backend(pdf_backend)
+        layout = None
+        if selected.native_layout:
+            layout = cached_layout(cache, combined_lines, lines_hash, layout_base, fdo_clock_options)
+        return b"".join(selected.chunks(combined_lines, image_input, layout=layout))
+
+    if cache is None or _clock_options_cache_token(fdo_clock_options) is None:
+        return build()
+    key = output_cache_key(cache, lines_hash, image_bytes, output_format, pdf_backend, docx_compression)
+    return cache.get_or_build("output", key, build)
+
+
+OUTPUT_MIMETYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+BATCH_MANIFEST_NAME = "manifest.json"
+VALIDATION_PASS_HEADER = "ผลการตรวจสอบ: ผ่าน"
+
+
+def safe_basename(text: str) -> str:
+    text = text.strip()
+    if not text:
+        return "output"
+    sanitized = re.sub(r"[^A-Za-z0-9._-]+", "_", text).strip("._-")
+    return sanitized or "output"
+
+
+def validation_report_passed(report: str) -> bool:
+    first_line = report.splitlines()[0] if report else ""
+    return first_line.strip() == VALIDATION_PASS_HEADER
+
+
+@dataclass(frozen=True)
+class BatchDevice:
+    name: str
+    fdo: str
+    apic: str
+    image: str
+
+
+@dataclass(frozen=True)
+class BatchDeviceResult:
+    name: str
+    output_name: str | None
+    passed: bool
+    error: str | None = None
+
+
+def parse_batch_manifest(raw: bytes | str) -> list[BatchDevice]:
+    """Read a batch manifest: a JSON list of {"fdo", "apic", "image"} file names."""
+    data = json.loads(raw)
+    entries = data.get("devices") if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("Batch manifest must list at least one device.")
+
+    devices: list[BatchDevice] = []
+    seen: set[str] = set()
+    for position, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Batch manifest entry #{position} must be an object.")
+        missing = [key for key in ("fdo", "apic", "image") if not str(entry.get(key) or "").strip()]
+        if missing:
+            raise ValueError(f"Batch manifest entry #{position} is missing: {', '.join(missing)}")
+        fdo = str(entry["fdo"]).strip()
+        name = safe_basename(PurePosixPath(fdo.replace("\\", "/")).stem)
+        if name in seen:
+            raise ValueError(f"Batch manifest has more than one device named {name!r}.")
+        seen.add(name)
+        devices.append(
+            BatchDevice(name=name, fdo=fdo, apic=str(entry["apic"]).strip(), image=str(entry["image"]).strip())
+        )
+    return devices
+
+
+def convert_log_triple(
+    fdo_raw: bytes,
+    apic_raw: bytes,
+    image_bytes: bytes,
+    output_format: str = "pdf",
+    fdo_clock_options: FdoClockOptions | None = None,
+    pdf_backend: str | None = None,
+    cache: ConversionCache | None = None,
+    docx_compression: str | None = None,
+) -> tuple[str, bytes]:
+    """Convert one device and return its validation report and document."""
+    prepared = prepare_conversion(
+        cache,
+        fdo_raw,
+        apic_raw,
+        image_bytes,
+        output_format,
+        pdf_backend,
+        fdo_clock_options=fdo_clock_options,
+    )
+    layout_base = layout_base_key(cache, fdo_raw, apic_raw) if cache is not None else None
+    data = cached_output_bytes(
+        cache,
+        prepared.combined_lines,
+        image_bytes,
+        output_format,
+        pdf_backend,
+        layout_base,
+        render_image=prepared.render_image,
+        docx_compression=docx_compression,
+        fdo_clock_options=fdo_clock_options,
+    )
+    return prepared.validation.report, data
+
+
+def build_batch_zip(
+    devices: list[BatchDevice],
+    load: Callable[[str], bytes],
+    output_format: str = "pdf",
+    fdo_clock_options: FdoClockOptions | None = None,
+    pdf_backend: str | None = None,
+    max_workers: int | None = None,
+    cache: ConversionCache | None = None,
+    docx_compression: str | None = None,
+) -> tuple[bytes, list[BatchDeviceResult]]:
+    """Convert every device concurrently and pack the results into one zip."""
+    if output_format not in OUTPUT_MIMETYPES:
+        raise ValueError(f"Unsupported output format: {output_format!r}")
+    resolve_docx_compression(docx_compression)
+
+    # Archive readers are not shared with workers.
+    inputs: list[tuple[BatchDevice, tuple[bytes, bytes, bytes] | None, str | None]] = []
+    for device in devices:
+        try:
+            inputs.append((device, (load(device.fdo), load(device.apic), load(device.image)), None))
+        except (KeyError, OSError) as exc:
+            inputs.append((device, None, f"Missing input file: {exc}"))
+
+    results: list[BatchDeviceResult] = []
+    output = io.BytesIO()
+    render_pool = get_render_pool()
+    pool: Executor = render_pool if render_pool is not None else ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        with zipfile.ZipFile(output, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+            futures = [
+                pool.submit(
+                    convert_log_triple, *raw, output_format, fdo_clock_options, pdf_backend, cache, docx_compression
+                )
+                if raw is not None
+                else None
+                for _device, raw, _error in inputs
+            ]
+            for (device, _raw, load_error), future in zip(inputs, futures):
+                error = load_error
+                if future is not None:
+                    try:
+                        report, data = future.result()
+                    except Exception as exc:
+                        error = f"Conversion failed: {exc}"
+                if error is not None:
+                    zf.writestr(f"{device.name}.validation.txt", error + "\n")
+                    results.append(BatchDeviceResult(name=device.name, output_name=None, passed=False, error=error))
+                    continue
+
+                output_name = f"{device.name}.{output_format}"
+                zf.writestr(output_name, data, compress_type=_zip_compress_type(output_name))
+                zf.writestr(f"{device.name}.validation.txt", report + "\n")
+                passed = validation_report_passed(report)
+                results.append(BatchDeviceResult(name=device.name, output_name=output_name, passed=passed))
+
+            summary = {
+                "output_format": output_format,
+                "devices": [
+                    {"name": r.name, "output": r.output_name, "passed": r.passed, "error": r.error} for r in results
+                ],
+            }
+            zf.writestr("summary.json", json.dumps(summary, ensure_ascii=False, indent=2))
+    finally:
+        if render_pool is None:
+            pool.shutdown()
+    return output.getvalue(), results
+
+
+def load_batch_archive(archive_bytes: bytes) -> tuple[list[BatchDevice], Callable[[str], bytes]]:
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    except zipfile.BadZipFile:
+        raise ValueError("Batch file is not a valid zip archive.") from None
+    try:
+        manifest = archive.read(BATCH_MANIFEST_NAME)
+    except KeyError:
+        raise ValueError(f"Batch archive must contain {BATCH_MANIFEST_NAME} at its root.") from None
+    return parse_batch_manifest(manifest), archive.read
+
+
+def _cache_from_args(args: argparse.Namespace) -> ConversionCache | None:
+    if args.cache_dir is None:
+        return None
+    return ConversionCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+
+
+def _run_batch_cli(args: argparse.Namespace, clock_options: FdoClockOptions | None = None) -> None:
+    batch_path: Path = args.batch
+    if not batch_path.exists():
+        raise FileNotFoundError(f"Missing batch file: {batch_path}")
+
+    if zipfile.is_zipfile(batch_path):
+        devices, load = load_batch_archive(batch_path.read_bytes())
+    else:
+        devices = parse_batch_manifest(batch_path.read_bytes())
+        base_dir = batch_path.parent
+
+        def load(name: str) -> bytes:
+            return (base_dir / name).read_bytes()
+
+    zip_bytes, results = build_batch_zip(
+        devices,
+        load,
+        output_format=args.format,
+        fdo_clock_options=clock_options,
+        pdf_backend=args.pdf_backend,
+        max_workers=args.workers,
+        cache=_cache_from_args(args),
+        docx_compression=args.docx_compression,
+    )
+    args.outdir.mkdir(parents=True, exist_ok=True)
+    out_zip = args.outdir / f"{safe_basename(batch_path.stem)}-batch.zip"
+    out_zip.write_bytes(zip_bytes)
+
+    for result in results:
+        status = "error" if result.error else ("pass" if result.passed else "fail")
+        detail = result.error or result.output_name
+        print(f"{result.name:<24} {status:<5} {detail}")
+    print(f"Created batch zip: {out_zip}")
 
 
 def main() -> None:
@@ -1619,10 +3747,71 @@ def main() -> None:
     parser.add_argument("--image", type=Path, default=DEFAULT_IMAGE)
     parser.add_argument("--outdir", type=Path, default=DEFAULT_OUTDIR)
     parser.add_argument("--format", choices=("pdf", "docx"), default="pdf")
+    parser.add_argument("--pdf-backend", choices=sorted(PDF_BACKENDS), default=DEFAULT_PDF_BACKEND)
+    parser.add_argument(
+        "--docx-compression",
+        choices=[*DOCX_COMPRESSION_LEVELS, *(str(level) for level in range(10))],
+        default=DEFAULT_DOCX_COMPRESSION,
+        metavar="{" + ",".join(DOCX_COMPRESSION_LEVELS) + ",0-9}",
+        help="Deflate level for DOCX XML parts; images are always stored (default: %(default)s).",
+    )
     parser.add_argument("--pdf-name")
     parser.add_argument("--docx-name")
     parser.add_argument("--text-name")
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        help=f"Convert many devices from a JSON manifest or a zip containing {BATCH_MANIFEST_NAME}.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for the show clock randomization (default: a new one per run, printed and kept in the report).",
+    )
+    parser.add_argument("--cache-dir", type=Path, help="Reuse intermediate results from this conversion cache.")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024))
+    parser.add_argument(
+        "--validate-only",
+        action="store_true",
+        help="Only preprocess and validate --fdo/--apic, print the result as JSON and exit (1 when it fails).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Render processes (default 1: in-process). Large PDFs build pages on them, --batch converts devices.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print wall time, CPU time and output size of every conversion stage.",
+    )
     args = parser.parse_args()
+    if args.workers is not None:
+        configure_render_pool(args.workers)
+    clock_options = FdoClockOptions(seed=args.seed)
+
+    if args.batch is not None:
+        _run_batch_cli(args, clock_options)
+        return
+
+    if args.validate_only:
+        for path in (args.fdo, args.apic):
+            if not path.exists():
+                raise FileNotFoundError(f"Missing input file: {path}")
+        timings = Timings()
+        with timings.span("validate"), LogLineSource.open(args.fdo) as fdo_source:
+            validation = validate_logs(
+                fdo_source,
+                read_text_with_fallback(args.apic),
+                fdo_clock_options=clock_options,
+                show_log_title_present=True,
+                show_log_image_present=args.image.exists(),
+            )
+        report = validation.to_json()
+        if args.timings:
+            report["timings"] = timings.to_json()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        raise SystemExit(0 if validation.passed else 1)
 
     for path in (args.fdo, args.apic, args.image):
         if not path.exists():
@@ -1634,21 +3823,99 @@ def main() -> None:
     out_docx = args.outdir / (args.docx_name or f"{base_name}.docx")
     out_text = args.outdir / (args.text_name or f"{base_name}.txt")
 
-    fdo_text = read_text_with_fallback(args.fdo)
-    apic_text = read_text_with_fallback(args.apic)
-    combined_lines = build_combined_lines(fdo_text, apic_text)
-    out_text.write_text("\n".join(combined_lines) + "\n", encoding="utf-8")
+    cache = _cache_from_args(args)
+    timings = Timings()
+    with timings.span("read_inputs") as span:
+        apic_raw = args.apic.read_bytes()
+        image_raw = args.image.read_bytes()
+        fdo_raw = args.fdo.read_bytes() if cache is not None else None
+        span.add_size(len(apic_raw) + len(image_raw) + len(fdo_raw or b""))
+    if fdo_raw is not None:
+        prepared = prepare_conversion(
+            cache,
+            fdo_raw,
+            apic_raw,
+            image_raw,
+            args.format,
+            args.pdf_backend,
+            fdo_clock_options=clock_options,
+            timings=timings,
+        )
+    else:
+        with LogLineSource.open(args.fdo) as fdo_source:
+            prepared = prepare_conversion(
+                None,
+                fdo_source,
+                apic_raw,
+                image_raw,
+                args.format,
+                args.pdf_backend,
+                fdo_clock_options=clock_options,
+                timings=timings,
+            )
+    combined_lines, validation = prepared.combined_lines, prepared.validation
+    with timings.span("write_text") as span:
+        text = "\n".join(combined_lines) + "\n"
+        out_text.write_text(text, encoding="utf-8")
+        span.add_size(len(text), "chars")
 
     print(f"Created text file: {out_text}")
-    if args.format == "pdf":
-        pdf_bytes = build_pdf_bytes(combined_lines, args.image)
-        out_pdf.write_bytes(pdf_bytes)
-        text_pages, *_ = _paginate_wrapped_lines(combined_lines)
+    print(f"Clock seed:        {validation.changes['clock_seed']}")
+    print(f"Stage times:       {prepared.timings_text()}")
+    if cache is not None:
+        out_path = out_pdf if args.format == "pdf" else out_docx
+        docx_stats = DocxWriteStats.for_compression(args.docx_compression)
+        with timings.span("output") as span:
+            output = cached_output_bytes(
+                cache,
+                combined_lines,
+                image_raw,
+                args.format,
+                args.pdf_backend,
+                layout_base_key(cache, fdo_raw, apic_raw),
+                render_image=prepared.render_image,
+                docx_compression=args.docx_compression,
+                docx_stats=docx_stats,
+                fdo_clock_options=clock_options,
+            )
+            out_path.write_bytes(output)
+            span.add_size(len(output))
+        print(f"Created {args.format.upper()} file: {out_path}")
+        if args.format == "docx":
+            if docx_stats.uncompressed_bytes:
+                print(f"DOCX compression:  {docx_stats.summary()}")
+            else:
+                print(
+                    f"DOCX compression:  {docx_stats.compression} (level {docx_stats.level}): "
+                    f"{len(output)} bytes from cache"
+                )
+        stats = cache.stats()
+        print(f"Cache hits:        {stats['hits']}")
+        print(f"Cache misses:      {stats['misses']}")
+    elif args.format == "pdf":
+        with timings.span("paginate") as span:
+            layout = PageLayout.build(combined_lines)
+            span.set_output(layout)
+        with timings.span("render") as span, out_pdf.open("wb") as sink:
+            pdf_result = write_pdf(
+                combined_lines, prepared.render_image, sink, backend=args.pdf_backend, layout=layout
+            )
+            span.add_size(pdf_result.size_bytes)
         print(f"Created PDF file:  {out_pdf}")
-        print(f"Total pages:       {len(text_pages) + 1}")
+        print(f"Total pages:       {len(layout.pages) + 1}")
+        print(
+            f"PDF backend:       {pdf_result.backend} "
+            f"({pdf_result.elapsed_seconds:.3f}s, {pdf_result.size_bytes} bytes)"
+        )
     else:
-        out_docx.write_bytes(build_docx_bytes(combined_lines, args.image))
+        with timings.span("render") as span, out_docx.open("wb") as sink:
+            docx_stats = write_docx(combined_lines, prepared.render_image, sink, args.docx_compression)
+            span.add_size(docx_stats.compressed_bytes)
         print(f"Created DOCX file: {out_docx}")
+        print(f"DOCX compression:  {docx_stats.summary()}")
+    if args.timings:
+        print()
+        print(timings.table())
 
 
 if __name__ == "__main__":
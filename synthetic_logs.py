@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import argparse
+import codecs
+import io
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+
+SYNTHETIC_ENCODINGS = ("utf-8", "utf-8-sig", "utf-16", "cp874")
+SYNTHETIC_IMAGE_FORMATS = ("png", "jpeg")
+INTERFACE_ERRORS_RULE = "-" * 80
+INTERFACE_ERRORS_HEADER = "Port          Align-Err    FCS-Err   Xmit-Err    Rcv-Err  UnderSize OutDiscards"
+THAI_DESCRIPTIONS = ("ลิงก์หลัก ห้อง ๒", "สำรอง ชั้น ๓", "ไปยังตู้ rack ๑๒")
+
+
+@dataclass(frozen=True)
+class SyntheticLogSpec:
+    """Size and shape of a generated FDO/APIC pair; equal specs give equal bytes.
+
+    ``lines`` is the approximate FDO line count, most of it running-config
+    stanzas. Every ``separator_every`` lines a small ``---`` table is added
+    and every ``clear_every`` lines a ``clear`` command (0 turns either
+    off). The three show clock blocks and two interface-errors tables with
+    ``ports`` rows are placed so the pair passes validation.
+    """
+
+    lines: int = 10_000
+    ports: int = 48
+    separator_every: int = 500
+    clear_every: int = 2_000
+    thai_every: int = 50
+    apic_nodes: int = 3
+    hostname: str = "LEAF-101"
+    encoding: str = "utf-8"
+    crlf: bool = False
+    seed: int = 0
+
+
+def _interface_errors_table(rng: random.Random, ports: int) -> list[str]:
+    rows = [INTERFACE_ERRORS_RULE, INTERFACE_ERRORS_HEADER, INTERFACE_ERRORS_RULE]
+    for port in range(1, ports + 1):
+        # Mostly zero counters, with the odd non-zero one preprocessing masks.
+        counters = [rng.choice((0, 0, 0, 0, rng.randint(1, 9999))) for _ in range(6)]
+        rows.append(f"Eth1/{port:<10}" + "".join(f"{value:>11}" for value in counters))
+    return rows
+
+
+def _separator_table(rng: random.Random, index: int) -> list[str]:
+    rows = [
+        "",
+        "VLAN Name                             Status    Ports",
+        "---- -------------------------------- --------- -------",
+    ]
+    for vlan in range(rng.randint(2, 6)):
+        rows.append(f"{100 + index * 8 + vlan:<4} vlan-{index}-{vlan:<27} active    Eth1/{vlan + 1}")
+    return rows
+
+
+def _running_config(spec: SyntheticLogSpec, rng: random.Random, line_count: int) -> list[str]:
+    prompt = f"{spec.hostname}#"
+    lines: list[str] = []
+    stanza = 0
+    next_separator = spec.separator_every or line_count + 1
+    next_clear = spec.clear_every or line_count + 1
+    while len(lines) < line_count:
+        port = stanza % 48 + 1
+        if spec.thai_every and stanza % spec.thai_every == 0:
+            description = THAI_DESCRIPTIONS[stanza // spec.thai_every % len(THAI_DESCRIPTIONS)]
+        else:
+            description = f"uplink-{stanza}, vlan {rng.randint(1, 4094)}, mtu 9216"
+        lines.extend(
+            [
+                f"interface Ethernet1/{port}",
+                f"  description {description}",
+                f"  switchport access vlan {rng.randint(1, 4094)}",
+                "  no shutdown",
+            ]
+        )
+        stanza += 1
+        if len(lines) >= next_separator:
+            lines.extend(_separator_table(rng, stanza))
+            next_separator += spec.separator_every
+        if len(lines) >= next_clear:
+            lines.extend([prompt, f"{prompt} clear counters interface Ethernet1/{port}"])
+            next_clear += spec.clear_every
+    return lines
+
+
+def synthetic_fdo_text(spec: SyntheticLogSpec = SyntheticLogSpec()) -> str:
+    rng = random.Random(spec.seed)
+    prompt = f"{spec.hostname}#"
+    head = [
+        prompt,
+        f"{prompt} show clock",
+        "10:15:30.123 UTC Tue Nov 25 2025",
+        prompt,
+        f"{prompt} show version",
+        "Cisco Nexus Operating System (NX-OS) Software",
+        "TAC support: http://www.cisco.com/tac",
+        "  NXOS: version 10.2(5)",
+        prompt,
+        f"{prompt} show running-config",
+        "!Command: show running-config",
+    ]
+    tail = [
+        prompt,
+        f"{prompt} show environment",
+        "Fan             Model                Hw     Direction       Status",
+        "---------------------------------------------------------------------",
+        "Fan1(sys_fan1)  N9K-C93180YC-FAN     --     front-to-back   Ok",
+        prompt,
+        f"{prompt} show clock",
+        "10:16:40.123 UTC Tue Nov 25 2025",
+        prompt,
+        f"{prompt} show interface counters errors",
+        "",
+        *_interface_errors_table(rng, spec.ports),
+        prompt,
+        f"{prompt} show clock",
+        "10:24:00.123 UTC Tue Nov 25 2025",
+        prompt,
+        f"{prompt} show interface counters errors",
+        "",
+        *_interface_errors_table(rng, spec.ports),
+        prompt,
+    ]
+    body = _running_config(spec, rng, max(0, spec.lines - len(head) - len(tail)))
+    newline = "\r\n" if spec.crlf else "\n"
+    return newline.join([*head, *body, *tail]) + newline
+
+
+def synthetic_apic_text(spec: SyntheticLogSpec = SyntheticLogSpec()) -> str:
+    rows = [
+        "apic1# acidiag fnvread",
+        "      ID   Pod ID                 Name    Serial Number         IP Address    Role        State",
+        "---------------------------------------------------------------------------------------------",
+    ]
+    for node in range(101, 101 + spec.apic_nodes):
+        rows.append(f"{node:>8} {1:>8} {f'leaf{node}':>20}    FDO{node:08d}   10.0.{node}.64/32    leaf      active")
+    rows.append("apic1#")
+    newline = "\r\n" if spec.crlf else "\n"
+    return newline.join(rows) + newline
+
+
+def encode_log_text(text: str, encoding: str) -> bytes:
+    # "utf-16" is written little-endian with a BOM, as Windows tools save it.
+    if encoding == "utf-16":
+        return codecs.BOM_UTF16_LE + text.encode("utf-16-le")
+    if encoding not in SYNTHETIC_ENCODINGS:
+        raise ValueError(f"unsupported encoding {encoding!r}; use one of {', '.join(SYNTHETIC_ENCODINGS)}")
+    return text.encode(encoding)
+
+
+def synthetic_screenshot(
+    width: int = 1280,
+    height: int = 720,
+    image_format: str = "png",
+    seed: int = 0,
+) -> bytes:
+    """A terminal-like screenshot: light text bars on a dark background."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), color=(12, 12, 12))
+    draw = ImageDraw.Draw(image)
+    for y in range(8, height - 16, 18):
+        x = 8
+        while x < width - 40 and rng.random() > 0.15:
+            word = rng.randint(2, 12) * 8
+            draw.rectangle((x, y, min(width - 8, x + word), y + 10), fill=(200, 200, 200))
+            x += word + 8
+    out = io.BytesIO()
+    if image_format == "jpeg":
+        image.save(out, format="JPEG", quality=90)
+    elif image_format == "png":
+        image.save(out, format="PNG")
+    else:
+        raise ValueError(f"unsupported image format {image_format!r}")
+    return out.getvalue()
+
+
+def write_synthetic_inputs(
+    outdir: Path,
+    spec: SyntheticLogSpec = SyntheticLogSpec(),
+    name: str = "FDO_synthetic",
+    image_format: str = "png",
+) -> dict[str, Path]:
+    outdir.mkdir(parents=True, exist_ok=True)
+    suffix = "jpg" if image_format == "jpeg" else image_format
+    paths = {
+        "fdo": outdir / f"{name}.log",
+        "apic": outdir / f"{name}_apic.log",
+        "image": outdir / f"{name}.{suffix}",
+    }
+    paths["fdo"].write_bytes(encode_log_text(synthetic_fdo_text(spec), spec.encoding))
+    paths["apic"].write_bytes(encode_log_text(synthetic_apic_text(spec), spec.encoding))
+    paths["image"].write_bytes(synthetic_screenshot(image_format=image_format, seed=spec.seed))
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic FDO/APIC/screenshot set.")
+    parser.add_argument("--outdir", type=Path, default=Path("output") / "synthetic")
+    parser.add_argument("--name", default="FDO_synthetic")
+    parser.add_argument("--lines", type=int, default=SyntheticLogSpec.lines)
+    parser.add_argument("--ports", type=int, default=SyntheticLogSpec.ports)
+    parser.add_argument("--separator-every", type=int, default=SyntheticLogSpec.separator_every)
+    parser.add_argument("--clear-every", type=int, default=SyntheticLogSpec.clear_every)
+    parser.add_argument("--encoding", choices=SYNTHETIC_ENCODINGS, default=SyntheticLogSpec.encoding)
+    parser.add_argument("--crlf", action="store_true", help="Windows line endings.")
+    parser.add_argument("--image-format", choices=SYNTHETIC_IMAGE_FORMATS, default="png")
+    parser.add_argument("--seed", type=int, default=SyntheticLogSpec.seed)
+    args = parser.parse_args()
+
+    spec = SyntheticLogSpec(
+        lines=args.lines,
+        ports=args.ports,
+        separator_every=args.separator_every,
+        clear_every=args.clear_every,
+        encoding=args.encoding,
+        crlf=args.crlf,
+        seed=args.seed,
+    )
+    paths = write_synthetic_inputs(args.outdir, spec, name=args.name, image_format=args.image_format)
+    for kind, path in paths.items():
+        print(f"{kind:<6} {path} ({path.stat().st_size} bytes)")
+    print(
+        f"Convert with: python merge_logs_to_pdf.py "
+        f"--fdo {paths['fdo']} --apic {paths['apic']} --image {paths['image']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
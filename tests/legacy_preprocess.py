@@ -0,0 +1,435 @@
+"""Frozen copy of the FDO preprocessing before it was fused into one pass.
+
+Kept verbatim apart from drawing its randomness from a seeded
+``random.Random`` (as the current engine does), so the regression tests can
+compare both implementations line for line. Do not "fix" this file: it is
+the reference, not production code.
+"""
+
+from __future__ import annotations
+
+import random
+import re
+from datetime import datetime, timedelta
+
+from merge_logs_to_pdf import FdoClockOptions, FdoPreprocessStats
+
+
+PROMPT_ONLY_PATTERN = re.compile(r"^\s*[^\s#][^#]*#\s*$")
+COMMAND_LINE_PATTERN = re.compile(r"^\s*[^\s#][^#]*#\s+\S", re.IGNORECASE)
+SHOW_CLOCK_COMMAND_PATTERN = re.compile(r"#\s*(?:sh|sho|show)\s+(?:clock|clo)\b", re.IGNORECASE)
+CLEAR_WORD_PATTERN = re.compile(r"\bclear\b", re.IGNORECASE)
+TIME_LINE_PATTERN = re.compile(
+    r"^(\s*(?:[.*]\s*)*)(\d{1,2}):(\d{2}):(\d{2})(?:\.(\d+))?\s+(\S+)\s+([A-Za-z]{3})\s+([A-Za-z]{3})\s+(\d{1,2})\s+(\d{4})\s*$"
+)
+INTERFACE_NAME_PATTERN = re.compile(r"^[A-Za-z][A-Za-z0-9/._:-]*$")
+INTERFACE_ERRORS_FIELD_PATTERN = re.compile(r"(\s+)(\S+)")
+INTERFACE_ERRORS_HEADER_PATTERN = re.compile(r"^\s*port\s+.+$", re.IGNORECASE)
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+MONTH_TO_INDEX = {month: idx for idx, month in enumerate(MONTHS)}
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def _parse_hms_seconds(value: str, fallback_seconds: int) -> int:
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})(?::(\d{2}))?\s*", value or "")
+    if not match:
+        return fallback_seconds
+    hour = int(match.group(1))
+    minute = int(match.group(2))
+    second = int(match.group(3) or "0")
+    if hour > 23 or minute > 59 or second > 59:
+        return fallback_seconds
+    return (hour * 3600) + (minute * 60) + second
+
+
+def _parse_clock_time_line(line: str) -> tuple[datetime, int, str, str] | None:
+    match = TIME_LINE_PATTERN.match(line)
+    if not match:
+        return None
+    prefix = match.group(1) or ""
+    hour = int(match.group(2))
+    minute = int(match.group(3))
+    second = int(match.group(4))
+    fraction_text = match.group(5) or ""
+    fraction_digits = len(fraction_text)
+    # datetime supports microseconds up to 6 digits.
+    # If source has more than 6 digits, use the first 6 for time math and keep full width for formatting.
+    microseconds = int((fraction_text[:6].ljust(6, "0"))) if fraction_text else 0
+    timezone_token = match.group(6)
+    month = match.group(8).title()
+    day = int(match.group(9))
+    year = int(match.group(10))
+    month_index = MONTH_TO_INDEX.get(month)
+    if month_index is None:
+        return None
+    try:
+        dt = datetime(year, month_index + 1, day, hour, minute, second, microseconds)
+    except ValueError:
+        return None
+    return dt, fraction_digits, timezone_token, prefix
+
+
+def _format_clock_time_line(
+    dt: datetime,
+    fraction_digits: int,
+    timezone_token: str,
+    prefix: str,
+) -> str:
+    base = f"{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
+    if fraction_digits > 0:
+        base_fraction = f"{dt.microsecond:06d}"
+        if fraction_digits <= 6:
+            fraction = base_fraction[:fraction_digits]
+        else:
+            fraction = base_fraction + ("0" * (fraction_digits - 6))
+        base = f"{base}.{fraction}"
+    weekday = WEEKDAYS[dt.weekday()]
+    month = MONTHS[dt.month - 1]
+    return f"{prefix}{base} {timezone_token} {weekday} {month} {dt.day} {dt.year}"
+
+
+def _randomize_microsecond_for_precision(fraction_digits: int, rng: random.Random) -> int:
+    if fraction_digits <= 0:
+        return 0
+    if fraction_digits >= 6:
+        return rng.randint(0, 999999)
+    visible_max = (10 ** fraction_digits) - 1
+    step = 10 ** (6 - fraction_digits)
+    return rng.randint(0, visible_max) * step
+
+
+def _is_show_clock_command(line: str) -> bool:
+    return bool(SHOW_CLOCK_COMMAND_PATTERN.search(line))
+
+
+def _prompt_command_tokens(line: str) -> list[str]:
+    match = re.search(r"#\s*(.+)$", line)
+    if not match:
+        return []
+    raw = match.group(1).strip().lower()
+    if not raw:
+        return []
+    return [token for token in re.split(r"\s+", raw) if token]
+
+
+def _is_show_interface_counters_errors_command(line: str) -> bool:
+    tokens = _prompt_command_tokens(line)
+    if not tokens:
+        return False
+
+    first = tokens[0]
+    if not first.startswith("sh"):
+        return False
+
+    search_tokens = tokens[1:]
+    found_int = False
+    found_count = False
+    for token in search_tokens:
+        if not found_int:
+            if token.startswith("int"):
+                found_int = True
+            continue
+        if not found_count:
+            if token.startswith("cou"):
+                found_count = True
+            continue
+        if token.startswith("err"):
+            return True
+    return False
+
+
+def _is_interface_errors_header(line: str) -> bool:
+    if not INTERFACE_ERRORS_HEADER_PATTERN.match(line):
+        return False
+    tokens = line.split()
+    return len(tokens) >= 3 and tokens[0].lower() == "port"
+
+
+def _parse_interface_errors_data_row(line: str) -> tuple[str, list[int], str] | None:
+    match = re.match(r"^(\s*)(\S+)(.*)$", line)
+    if not match:
+        return None
+
+    indent = match.group(1)
+    interface_name = match.group(2)
+    rest = match.group(3)
+    if not INTERFACE_NAME_PATTERN.fullmatch(interface_name):
+        return None
+    # Avoid touching header lines like "Port ..."; data rows always include a digit.
+    if not re.search(r"\d", interface_name):
+        return None
+
+    fields: list[tuple[str, str]] = []
+    cursor = 0
+    for field_match in INTERFACE_ERRORS_FIELD_PATTERN.finditer(rest):
+        if field_match.start() != cursor:
+            return None
+        fields.append((field_match.group(1), field_match.group(2)))
+        cursor = field_match.end()
+    trailing = rest[cursor:]
+
+    if not fields:
+        return None
+    if trailing.strip():
+        return None
+
+    prefix = f"{indent}{interface_name}"
+    token_end_positions: list[int] = []
+    for field_match in INTERFACE_ERRORS_FIELD_PATTERN.finditer(rest):
+        token_end_positions.append(len(prefix) + field_match.end())
+    return prefix, token_end_positions, trailing
+
+
+def _interface_row_contains_non_dash_value(line: str) -> bool:
+    match = re.match(r"^(\s*)(\S+)(.*)$", line)
+    if not match:
+        return False
+
+    interface_name = match.group(2)
+    rest = match.group(3)
+    if not INTERFACE_NAME_PATTERN.fullmatch(interface_name):
+        return False
+    if not re.search(r"\d", interface_name):
+        return False
+
+    values: list[str] = []
+    cursor = 0
+    for field_match in INTERFACE_ERRORS_FIELD_PATTERN.finditer(rest):
+        if field_match.start() != cursor:
+            return False
+        values.append(field_match.group(2))
+        cursor = field_match.end()
+    trailing = rest[cursor:]
+    if not values or trailing.strip():
+        return False
+
+    return any(value != "--" for value in values)
+
+
+def _normalize_interface_errors_block(block_lines: list[str]) -> list[str]:
+    normalized = block_lines[:]
+    group: list[tuple[int, str, list[int], str]] = []
+
+    def flush_group() -> None:
+        nonlocal group
+        if not group:
+            return
+        num_cols = len(group[0][2])
+        column_end_positions = [0] * num_cols
+        for _, _, token_ends, _ in group:
+            for idx, end_pos in enumerate(token_ends):
+                if end_pos > column_end_positions[idx]:
+                    column_end_positions[idx] = end_pos
+
+        for line_idx, prefix, _, trailing in group:
+            out = [prefix]
+            current_len = len(prefix)
+            for end_pos in column_end_positions:
+                spaces = max(1, end_pos - current_len - 2)
+                out.append(" " * spaces)
+                out.append("--")
+                current_len += spaces + 2
+            out.append(trailing)
+            normalized[line_idx] = "".join(out)
+        group = []
+
+    for idx, line in enumerate(block_lines):
+        parsed = _parse_interface_errors_data_row(line)
+        if parsed is None:
+            flush_group()
+            continue
+
+        prefix, token_ends, trailing = parsed
+        if group and len(token_ends) != len(group[0][2]):
+            flush_group()
+        group.append((idx, prefix, token_ends, trailing))
+
+    flush_group()
+    return normalized
+
+
+def _force_interface_errors_to_dash(lines: list[str]) -> list[str]:
+    out: list[str] = []
+    in_errors_section = False
+    section_buffer: list[str] = []
+
+    def flush_section() -> None:
+        nonlocal section_buffer
+        if section_buffer:
+            out.extend(_normalize_interface_errors_block(section_buffer))
+            section_buffer = []
+
+    for line in lines:
+        if _is_show_interface_counters_errors_command(line):
+            flush_section()
+            in_errors_section = True
+            out.append(line)
+            continue
+
+        if not in_errors_section and _is_interface_errors_header(line):
+            in_errors_section = True
+            section_buffer.append(line)
+            continue
+
+        if in_errors_section and (COMMAND_LINE_PATTERN.match(line) or PROMPT_ONLY_PATTERN.fullmatch(line)):
+            flush_section()
+            in_errors_section = False
+            out.append(line)
+            continue
+
+        if in_errors_section:
+            section_buffer.append(line)
+            continue
+
+        flush_section()
+        out.append(line)
+
+    flush_section()
+    return out
+
+
+def _adjust_show_clock_lines(lines: list[str], options: FdoClockOptions, rng: random.Random) -> list[str]:
+    opts = options or FdoClockOptions()
+    blocks: list[tuple[int, datetime, int, str, str]] = []
+
+    for idx, line in enumerate(lines):
+        if not _is_show_clock_command(line):
+            continue
+        value_idx = idx + 1
+        while value_idx < len(lines) and lines[value_idx].strip() == "":
+            value_idx += 1
+        if value_idx >= len(lines):
+            continue
+        parsed = _parse_clock_time_line(lines[value_idx])
+        if not parsed:
+            continue
+        dt, fraction_digits, timezone_token, prefix = parsed
+        blocks.append((value_idx, dt, fraction_digits, timezone_token, prefix))
+
+    if len(blocks) < 3:
+        return lines
+
+    line1_idx, dt1_raw, has_ms1, tz1, prefix1 = blocks[0]
+    line2_idx, _dt2_raw, has_ms2, tz2, prefix2 = blocks[1]
+    line3_idx, _dt3_raw, has_ms3, tz3, prefix3 = blocks[2]
+
+    def apply_fraction_precision(dt: datetime, fraction_digits: int) -> datetime:
+        if fraction_digits <= 0:
+            return dt.replace(microsecond=0)
+        if fraction_digits < 6:
+            step = 10 ** (6 - fraction_digits)
+            return dt.replace(microsecond=(dt.microsecond // step) * step)
+        if fraction_digits > 6:
+            return dt.replace(microsecond=_randomize_microsecond_for_precision(fraction_digits, rng))
+        return dt
+
+    # Clock #1 behavior:
+    # - auto mode (checkbox OFF): keep original clock #1 unchanged
+    # - custom mode (checkbox ON): randomize clock #1 in selected date/time window
+    if opts.custom_mode:
+        if opts.custom_date:
+            try:
+                chosen_date = datetime.strptime(opts.custom_date, "%Y-%m-%d")
+            except ValueError:
+                chosen_date = datetime.now()
+        else:
+            chosen_date = datetime.now()
+
+        start_sec = _parse_hms_seconds(opts.custom_start_time, 8 * 3600)
+        end_sec = _parse_hms_seconds(opts.custom_end_time, 18 * 3600)
+        if end_sec < start_sec:
+            end_sec = start_sec
+
+        dt1_window_start = chosen_date.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(
+            seconds=start_sec
+        )
+        dt1_window_end = chosen_date.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(
+            seconds=end_sec
+        )
+
+        if dt1_window_end < dt1_window_start:
+            dt1_window_end = dt1_window_start
+
+        # Randomize clock #1 inside selected custom range.
+        range_us = int((dt1_window_end - dt1_window_start).total_seconds() * 1_000_000)
+        offset_us = rng.randint(0, max(0, range_us))
+        dt1_new = dt1_window_start + timedelta(microseconds=offset_us)
+        dt1_new = apply_fraction_precision(dt1_new, has_ms1)
+    else:
+        # Keep clock #1 as-is from source when custom mode is not selected.
+        dt1_new = dt1_raw
+
+    delta12_sec = rng.randint(40, 90)
+    delta23_sec = rng.randint(420, 450)
+    dt2_new = dt1_new + timedelta(seconds=delta12_sec)
+    dt2_new = apply_fraction_precision(dt2_new, has_ms2)
+    dt3_new = dt2_new + timedelta(seconds=delta23_sec)
+    dt3_new = apply_fraction_precision(dt3_new, has_ms3)
+
+    out = lines[:]
+    out[line1_idx] = _format_clock_time_line(dt1_new, has_ms1, tz1, prefix1)
+    out[line2_idx] = _format_clock_time_line(dt2_new, has_ms2, tz2, prefix2)
+    out[line3_idx] = _format_clock_time_line(dt3_new, has_ms3, tz3, prefix3)
+    return out
+
+
+def _extract_show_clock_entries(lines: list[str]) -> list[tuple[int, int, datetime, str]]:
+    entries: list[tuple[int, int, datetime, str]] = []
+    for idx, line in enumerate(lines):
+        if not _is_show_clock_command(line):
+            continue
+        value_idx = idx + 1
+        while value_idx < len(lines) and lines[value_idx].strip() == "":
+            value_idx += 1
+        if value_idx >= len(lines):
+            continue
+        parsed = _parse_clock_time_line(lines[value_idx])
+        if not parsed:
+            continue
+        dt, _fraction_digits, _tz, _prefix = parsed
+        entries.append((idx, value_idx, dt, lines[value_idx]))
+    return entries
+
+
+def legacy_preprocess_fdo_lines_and_stats(
+    fdo_text: str,
+    options: FdoClockOptions,
+) -> tuple[list[str], FdoPreprocessStats]:
+    """The multi-pass preprocessing as it was before the single-pass engine."""
+    rng = random.Random(options.seed)
+    raw_lines = fdo_text.splitlines()
+    lines_no_clear: list[str] = []
+    clear_removed_lines: list[tuple[int, str]] = []
+    for line_no, line in enumerate(raw_lines, start=1):
+        if CLEAR_WORD_PATTERN.search(line):
+            clear_removed_lines.append((line_no, line))
+            continue
+        lines_no_clear.append(line)
+    clear_removed = len(clear_removed_lines)
+
+    lines_after_interface = _force_interface_errors_to_dash(lines_no_clear)
+    interface_rows_seen = 0
+    interface_rows_changed = 0
+    interface_row_changes: list[str] = []
+    for before, after in zip(lines_no_clear, lines_after_interface):
+        if _parse_interface_errors_data_row(before) is not None:
+            interface_rows_seen += 1
+            if before != after and _interface_row_contains_non_dash_value(before):
+                interface_rows_changed += 1
+                interface_row_changes.append(before)
+
+    clock_before = _extract_show_clock_entries(lines_after_interface)
+    final_lines = _adjust_show_clock_lines(lines_after_interface, options, rng)
+    clock_after = _extract_show_clock_entries(final_lines)
+
+    stats = FdoPreprocessStats(
+        clear_removed=clear_removed,
+        clear_removed_lines=clear_removed_lines,
+        interface_rows_changed=interface_rows_changed,
+        interface_rows_seen=interface_rows_seen,
+        interface_row_changes=interface_row_changes,
+        clock_before=clock_before,
+        clock_after=clock_after,
+        clock_seed=options.seed,
+    )
+    return final_lines, stats
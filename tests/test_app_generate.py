@@ -0,0 +1,55 @@
+"""/generate behaviour that only shows once the streamed body has been sent."""
+
+from __future__ import annotations
+
+import io
+import os
+
+import pytest
+
+os.environ.setdefault("RENDER_WORKERS", "1")
+
+import app as web  # noqa: E402
+from merge_logs_to_pdf import ConversionCache  # noqa: E402
+from synthetic_logs import SyntheticLogSpec, synthetic_apic_text, synthetic_fdo_text, synthetic_screenshot  # noqa: E402
+
+
+SPEC = SyntheticLogSpec(lines=400, ports=8)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(web, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(web, "CONVERSION_CACHE", ConversionCache(tmp_path / "cache"))
+    return web.app.test_client()
+
+
+def _generate(client, **form: str):
+    data = {
+        "fdo_file": (io.BytesIO(synthetic_fdo_text(SPEC).encode()), "FDO_synthetic.log"),
+        "apic_file": (io.BytesIO(synthetic_apic_text(SPEC).encode()), "apic.log"),
+        "image_file": (io.BytesIO(synthetic_screenshot(320, 200)), "shot.png"),
+        **form,
+    }
+    response = client.post("/generate", data=data, content_type="multipart/form-data")
+    response.get_data()
+    response.close()
+    return response
+
+
+def _report(client, response) -> str:
+    return client.get(f"/validation-report/{response.headers['X-Validation-Report-Id']}").get_data(as_text=True)
+
+
+@pytest.mark.parametrize("form", [{}, {"clock_seed": "42"}], ids=["unseeded", "seeded"])
+def test_docx_stats_reach_the_report(client, form: dict[str, str]) -> None:
+    response = _generate(client, output_format="docx", docx_compression="fast", **form)
+    assert response.status_code == 200
+    assert response.headers["X-Docx-Compression"] == "fast; level=1"
+    assert "DOCX compression: fast (level 1): " in _report(client, response)
+
+
+def test_cached_docx_has_no_build_stats(client) -> None:
+    _generate(client, output_format="docx", clock_seed="42")
+    response = _generate(client, output_format="docx", clock_seed="42")
+    assert "DOCX compression:" not in _report(client, response)
@@ -0,0 +1,89 @@
+"""What the disk cache keeps, and what it must not keep, across conversions."""
+
+from __future__ import annotations
+
+import io
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import merge_logs_to_pdf as core
+from synthetic_logs import SyntheticLogSpec, synthetic_apic_text, synthetic_fdo_text, synthetic_screenshot
+
+
+SPEC = SyntheticLogSpec(lines=2_000, ports=8)
+
+
+def _entries(cache: core.ConversionCache, kind: str) -> list[Path]:
+    return [path for path in (cache.root / kind).glob("*/*") if path.suffix != ".part"]
+
+
+def _convert(cache: core.ConversionCache, seed: int | None) -> bytes:
+    _report, data = core.convert_log_triple(
+        synthetic_fdo_text(SPEC).encode(),
+        synthetic_apic_text(SPEC).encode(),
+        synthetic_screenshot(320, 200),
+        fdo_clock_options=core.FdoClockOptions(seed=seed),
+        cache=cache,
+    )
+    return data
+
+
+def test_unseeded_runs_keep_one_layout_per_source(tmp_path: Path) -> None:
+    cache = core.ConversionCache(tmp_path)
+    for _ in range(3):
+        _convert(cache, seed=None)
+    # The base pointer and the source's latest layout, rewritten in place.
+    assert len(_entries(cache, "layout")) == 2
+    assert _entries(cache, "output") == []
+    on_disk = sum(path.stat().st_size for kind in core.CACHE_ARTIFACTS for path in _entries(cache, kind))
+    assert cache.stats()["size_bytes"] == on_disk
+
+
+def test_seeded_runs_reuse_their_entries(tmp_path: Path) -> None:
+    cache = core.ConversionCache(tmp_path)
+    first = _convert(cache, seed=7)
+    layouts = len(_entries(cache, "layout"))
+    assert _convert(cache, seed=7) == first
+    assert len(_entries(cache, "layout")) == layouts
+    assert cache.stats()["hits"]["output"] == 1
+
+
+def _alpha_png() -> bytes:
+    image = Image.new("RGBA", (64, 40), (30, 30, 30, 255))
+    image.paste((200, 200, 200, 96), (8, 8, 56, 32))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_alpha_png_split_is_cached_by_image_hash(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    upload = _alpha_png()
+    lines = synthetic_fdo_text(SyntheticLogSpec(lines=200, ports=4)).splitlines()
+    expected = b"".join(core.iter_pdf_chunks(lines, upload, backend="native-vector"))
+
+    prepared = core.cached_render_image(core.ConversionCache(tmp_path), upload)
+    [entry] = _entries(core.ConversionCache(tmp_path), "image")
+    assert entry.read_bytes() == prepared != upload
+
+    # A new process: nothing in memory, and no transcode may run again.
+    monkeypatch.setattr(core, "_pdf_image_cache", {})
+    monkeypatch.setattr(core, "_pdf_image_transcode", lambda raw: pytest.fail("transcoded again"))
+    image = core.pdf_image_from_bytes(core.cached_render_image(core.ConversionCache(tmp_path), upload))
+    assert image.smask is not None
+    assert core.PdfImage.from_bytes(image.to_bytes()) == image
+    assert b"".join(core.iter_pdf_chunks(lines, prepared, backend="native-vector")) == expected
+
+
+def test_get_survives_eviction_after_read(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = core.ConversionCache(tmp_path)
+    cache.put("output", "ab" * 32, b"document")
+
+    def evicted(path: Path) -> None:
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(core.os, "utime", evicted)
+    assert cache.get("output", "ab" * 32) == b"document"
+    assert cache.stats()["hits"]["output"] == 1
+    assert cache.stats()["misses"]["output"] == 0
@@ -0,0 +1,111 @@
+"""The single-pass FDO preprocessing must match the multi-pass original exactly."""
+
+from __future__ import annotations
+
+import random
+from dataclasses import asdict
+
+import pytest
+
+import merge_logs_to_pdf as core
+from legacy_preprocess import legacy_preprocess_fdo_lines_and_stats
+from synthetic_logs import SyntheticLogSpec, synthetic_fdo_text
+
+
+SYNTHETIC_SPECS = [
+    SyntheticLogSpec(lines=200, ports=4, seed=1),
+    SyntheticLogSpec(lines=3_000, ports=48, separator_every=100, clear_every=250, seed=2),
+    SyntheticLogSpec(lines=1_500, ports=96, separator_every=0, clear_every=0, seed=3),
+    SyntheticLogSpec(lines=2_000, ports=24, clear_every=7, thai_every=3, crlf=True, seed=4),
+]
+
+# Line shapes the synthetic logs do not produce: abbreviated commands,
+# blank lines before clock values, >6-digit fractions, ragged error rows.
+EDGE_VOCABULARY = (
+    "sw# show clock",
+    "sw#show clock",
+    "sw# sh clo",
+    "",
+    "  ",
+    "10:15:30.123 UTC Tue Nov 25 2025",
+    "*10:15:30 PST Mon Jan 6 2025",
+    "10:15:30.1234567 UTC Tue Nov 25 2025",
+    ". 23:59:59.9 UTC Tue Dec 31 2024",
+    "sw#",
+    "sw# show interface counters errors",
+    "sw# sh int cou err",
+    "Port  Align-Err  FCS-Err",
+    "port x",
+    "Eth1/1   1  2  3",
+    "Eth1/2   --  --  --",
+    "Eth1/3  5 6",
+    "mgmt0  --",
+    "Po1  0 0 0 extra  ",
+    "  Eth1/4\t1 2 3",
+    "sw# clear counters",
+    "no clear here? clear",
+    "Eth1/5 1 2 3 # x",
+    "sw# show version",
+    "text, text",
+    "---- ----",
+    "Eth1 nodigit?",
+    "interface Eth1/1",
+)
+
+CLOCK_OPTIONS = [
+    {},
+    {"custom_mode": True, "custom_date": "2025-02-03", "custom_start_time": "09:00", "custom_end_time": "10:00"},
+    {"custom_mode": True, "custom_date": "2025-02-03", "custom_start_time": "18:00", "custom_end_time": "08:00"},
+]
+
+
+def _edge_document(seed: int) -> str:
+    rng = random.Random(seed)
+    return "\n".join(rng.choice(EDGE_VOCABULARY) for _ in range(rng.randint(0, 80)))
+
+
+def _corpus() -> list[tuple[str, str]]:
+    corpus = [(f"synthetic-{spec.seed}", synthetic_fdo_text(spec)) for spec in SYNTHETIC_SPECS]
+    corpus += [(f"edge-{seed}", _edge_document(seed)) for seed in range(300)]
+    return corpus
+
+
+@pytest.mark.parametrize("option_fields", CLOCK_OPTIONS, ids=["auto", "custom", "custom-inverted"])
+def test_lines_and_stats_match_legacy(option_fields: dict[str, object]) -> None:
+    for seed, (name, text) in enumerate(_corpus()):
+        options = core.FdoClockOptions(seed=seed, **option_fields)
+        expected_lines, expected_stats = legacy_preprocess_fdo_lines_and_stats(text, options)
+        lines, stats = core._preprocess_fdo_lines_and_stats(text, options)
+        assert lines == expected_lines, name
+        assert asdict(stats) == asdict(expected_stats), name
+
+
+def test_report_matches_legacy() -> None:
+    for seed, (name, text) in enumerate(_corpus()):
+        options = core.FdoClockOptions(seed=seed)
+        expected_lines, stats = legacy_preprocess_fdo_lines_and_stats(text, options)
+        expected_report = core._build_fdo_validation(
+            validated_lines=expected_lines,
+            clear_removed=stats.clear_removed,
+            clear_removed_lines=stats.clear_removed_lines,
+            interface_rows_changed=stats.interface_rows_changed,
+            interface_rows_seen=stats.interface_rows_seen,
+            interface_row_changes=stats.interface_row_changes,
+            clock_before=stats.clock_before,
+            clock_after=stats.clock_after,
+            clock_seed=stats.clock_seed,
+        ).report
+        lines, report = core.preprocess_fdo_lines_with_report(text, options)
+        assert lines == expected_lines, name
+        assert report == expected_report, name
+
+
+def test_streamed_lines_match_legacy() -> None:
+    # LogLineSource hands the engine an iterable of lines instead of the text.
+    spec = SYNTHETIC_SPECS[1]
+    text = synthetic_fdo_text(spec)
+    options = core.FdoClockOptions(seed=spec.seed)
+    expected_lines, expected_stats = legacy_preprocess_fdo_lines_and_stats(text, options)
+    lines, stats = core._preprocess_fdo_lines_and_stats(iter(text.splitlines()), options)
+    assert lines == expected_lines
+    assert asdict(stats) == asdict(expected_stats)
@@ -0,0 +1,103 @@
+"""_wrap_long_line must break lines exactly where the TextWrapper it replaced did."""
+
+from __future__ import annotations
+
+import random
+import textwrap
+
+import pytest
+
+import merge_logs_to_pdf as core
+
+
+def legacy_wrap_segments(line: str, max_chars: int) -> list[str]:
+    # The wrapper the pipeline used before _wrap_long_line, built per call.
+    wrapper = textwrap.TextWrapper(
+        width=max_chars,
+        expand_tabs=False,
+        replace_whitespace=False,
+        drop_whitespace=False,
+        break_long_words=False,
+        break_on_hyphens=True,
+    )
+    wrapper.wordsep_re = core.WORD_WRAP_SEPARATOR_PATTERN
+    return wrapper.wrap(line) or [""]
+
+
+def legacy_wrap_lines(lines: list[str], max_chars: int) -> list[tuple[str, bool]]:
+    wrapped: list[tuple[str, bool]] = []
+    for line in lines:
+        line = line.replace("\t", "    ")
+        is_command = bool(core.COMMAND_LINE_PATTERN.match(line))
+        if line == "":
+            wrapped.append(("", False))
+            continue
+        wrapped.extend((segment, is_command) for segment in legacy_wrap_segments(line, max_chars))
+    return wrapped
+
+
+WIDTHS = [1, 2, 5, 8, 13, 40, 110]
+
+CASES = [
+    "",
+    " ",
+    "a",
+    "word",
+    "interface Ethernet1/1",
+    # Every separator shape the pattern knows: whitespace runs, bare commas,
+    # commas followed by whitespace, and commas in a row.
+    "vlan 10,20,30,40,50,60,70,80,90,100",
+    "vlan 10, 20,  30,\t40,,50 ,60",
+    ",,,,,,,,,,,,,,,,",
+    ", , , , , , , , ,",
+    "a,b c\td,\te  f",
+    # Runs of spaces and tabs, leading, inner and trailing.
+    "    indented by four spaces",
+    "\t\tindented by two tabs",
+    "trailing spaces        ",
+    "a          b          c          d",
+    "a\t\t\tb \t c\t \tdone",
+    " \t \t \t \t \t \t \t ",
+    "                                                  ",
+    # Words longer than the width, alone and next to separators.
+    "x" * 150,
+    "short " + "y" * 90 + " short",
+    "path=/very/long/path/without/any/separator/at/all/that/keeps/going/and/going",
+    "a" * 30 + "," + "b" * 30 + ", " + "c" * 30,
+    "Eth1/1          0          0          0          0          0          0",
+    "description ลิงก์หลัก ห้อง ๒, uplink to rack ๑๒ via patch panel 3",
+    "hyphen-ated-words-are-not-split-by-the-pattern and-so-stay-whole",
+]
+
+SEPARATOR_ALPHABET = ("a", "bb", "cccccccccccc", ",", ", ", " ", "  ", "\t", " \t", ",,", "-")
+
+
+def _random_lines(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return ["".join(rng.choice(SEPARATOR_ALPHABET) for _ in range(rng.randint(0, 40))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("max_chars", WIDTHS)
+def test_segments_match_textwrapper(max_chars: int) -> None:
+    for line in CASES:
+        assert core._wrap_text_segments(line, max_chars) == legacy_wrap_segments(line, max_chars), repr(line)
+
+
+@pytest.mark.parametrize("max_chars", WIDTHS)
+def test_long_line_matches_textwrapper(max_chars: int) -> None:
+    # Bypasses the fits-on-one-row shortcut so short lines hit the wrapper too.
+    for line in CASES + _random_lines(500, max_chars):
+        if line:
+            assert list(core._wrap_long_line(line, max_chars)) == legacy_wrap_segments(line, max_chars), repr(line)
+
+
+@pytest.mark.parametrize("max_chars", WIDTHS)
+def test_random_separator_lines_match_textwrapper(max_chars: int) -> None:
+    for line in _random_lines(2_000, 1_000 + max_chars):
+        assert core._wrap_text_segments(line, max_chars) == legacy_wrap_segments(line, max_chars), repr(line)
+
+
+def test_wrap_lines_matches_legacy() -> None:
+    lines = CASES + ["sw# show clock", "sw#", "", "\t"] + _random_lines(500, 7)
+    for max_chars in WIDTHS:
+        assert core.wrap_lines(lines, max_chars) == legacy_wrap_lines(lines, max_chars)